@@ -1,12 +1,26 @@
-import json
+import os
+
+from upload.common.database import UploadDB
 from upload.lambdas.checksum_daemon import ChecksumDaemon
 
+# Messages are consumed on up to MAX_CONCURRENT_MESSAGES threads, and each one needs its own DB connection.
+UploadDB.configure(pool_size=ChecksumDaemon.MAX_CONCURRENT_MESSAGES)
+
 
 # This lambda function is invoked by messages in the the pre_checksum_upload_queue (AWS SQS).
-# The queue and the lambda function are connected via aws_lambda_event_source_mapping
+# The queue and the lambda function are connected via aws_lambda_event_source_mapping.
+# Every message in the batch is processed.  Failed messages can be reported with an SQS partial batch
+# response so only they are retried, but that requires the event source mapping's function_response_types
+# to include ReportBatchItemFailures: without it a batch that returns normally is deleted in full.  So unless
+# REPORT_BATCH_ITEM_FAILURES is set, which must only be done together with that setting, we raise if any
+# message failed, which retries the whole batch.
 def call_checksum_daemon(event, context):
-    unwrapped_events = json.loads(event["Records"][0]["body"])
-    ChecksumDaemon(context).consume_events(unwrapped_events)
+    messages = event["Records"]
+    failed_message_ids = ChecksumDaemon(context).consume_sqs_messages(messages)
+    some_succeeded = len(failed_message_ids) < len(messages)
+    if failed_message_ids and not (some_succeeded and os.environ.get('REPORT_BATCH_ITEM_FAILURES')):
+        raise RuntimeError(f"Failed to process {len(failed_message_ids)} of {len(messages)} messages")
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]}
 
 
 """
@@ -1,7 +1,7 @@
 import json
 
-from upload.common.uploaded_file import UploadedFile
-from upload.common.validation_scheduler import ValidationScheduler
+from upload.common.validation_event import ValidationEvent
+from upload.common.validation_scheduler import ValidationScheduler, QueuedValidation
 from upload.common.upload_area import UploadArea
 from upload.common.logging import get_logger
 
@@ -9,21 +9,30 @@ logger = get_logger(__name__)
 
 
 # This lambda function is invoked by messages in the the validation_queue (AWS SQS).
-# The queue and the lambda function are connected via aws_lambda_event_source_mapping
+# The queue and the lambda function are connected via aws_lambda_event_source_mapping.
+# All the validations in a batch of messages are scheduled together, so that those using the same
+# validator image share AWS Batch array jobs.  If any cannot be scheduled we raise, and the whole batch
+# is retried: validations that were scheduled the first time are then skipped.
 def schedule_file_validation(event, context):
     logger.info(f"initiated schedule_file_validation with {event}")
-    unwrapped_event = json.loads(event["Records"][0]["body"])
-    upload_area_uuid = unwrapped_event["upload_area_uuid"]
-    filenames = unwrapped_event["filenames"]
+    validations = [_queued_validation(json.loads(record["body"])) for record in event["Records"]]
+    validations = [validation for validation in validations if validation is not None]
+    unscheduled = ValidationScheduler.schedule_batch_validations(validations)
+    if unscheduled:
+        raise RuntimeError(f"Failed to schedule validations {[v.validation_id for v in unscheduled]}")
+    logger.info(f"scheduled batch jobs for {len(validations)} validations")
+
+
+def _queued_validation(unwrapped_event):
     validation_id = unwrapped_event["validation_id"]
-    image = unwrapped_event["validator_docker_image"]
-    env = unwrapped_event["environment"]
-    orig_validation_id = unwrapped_event["orig_validation_id"]
+    if ValidationEvent.load(validation_id).status != "SCHEDULING_QUEUED":
+        logger.info(f"validation {validation_id} has already been scheduled")
+        return None
+    upload_area_uuid = unwrapped_event["upload_area_uuid"]
     upload_area = UploadArea(upload_area_uuid)
-    files = []
-    for filename in filenames:
-        file = upload_area.uploaded_file(filename)
-        files.append(file)
-    validation_scheduler = ValidationScheduler(upload_area_uuid, files)
-    validation_id = validation_scheduler.schedule_batch_validation(validation_id, image, env, orig_validation_id)
-    logger.info(f"scheduled batch job with {event}")
+    files = upload_area.uploaded_files(unwrapped_event["filenames"])
+    return QueuedValidation(scheduler=ValidationScheduler(upload_area_uuid, files),
+                            validation_id=validation_id,
+                            docker_image=unwrapped_event["validator_docker_image"],
+                            env=unwrapped_event["environment"],
+                            orig_val_id=unwrapped_event["orig_validation_id"])
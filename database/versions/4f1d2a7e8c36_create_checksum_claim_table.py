@@ -0,0 +1,36 @@
+"""create checksum_claim table
+
+Revision ID: 4f1d2a7e8c36
+Revises: 9c925ff1b517
+Create Date: 2026-10-18 14:03:27.518310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1d2a7e8c36'
+down_revision = '9c925ff1b517'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Supports ChecksumClaim: coalescing duplicate S3 events for the same object contents.
+    op.create_table(
+        'checksum_claim',
+        sa.Column('s3_key', sa.String, primary_key=True),
+        sa.Column('s3_etag', sa.String, primary_key=True),
+        sa.Column('claim_id', sa.String, nullable=False),
+        sa.Column('claimed_sequencer', sa.String, nullable=False),
+        sa.Column('latest_sequencer', sa.String, nullable=False),
+        sa.Column('expires_at', sa.types.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.types.DateTime(timezone=True), nullable=False, server_default=text('now()')),
+        sa.Column('updated_at', sa.types.DateTime(timezone=True), nullable=False, server_default=text('now()'))
+    )
+
+
+def downgrade():
+    op.drop_table('checksum_claim')
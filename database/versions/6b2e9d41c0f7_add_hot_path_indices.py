@@ -0,0 +1,56 @@
+"""add hot path indices
+
+Revision ID: 6b2e9d41c0f7
+Revises: 4f1d2a7e8c36
+Create Date: 2026-10-18 16:21:53.104772
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2e9d41c0f7'
+down_revision = '4f1d2a7e8c36'
+branch_labels = None
+depends_on = None
+
+# Each composite index replaces a single column index on its leading column, which it makes redundant.
+COMPOSITE_INDICES = [
+    # Counting the distinct file names in an upload area can be answered from the index alone.
+    ("file_upload_area_id_name_index", "file (upload_area_id, name)",
+     "file_upload_area_id_index", "file (upload_area_id)"),
+    # The latest checksum of a file, without sorting all of its checksums.
+    ("checksum_file_id_created_at_index", "checksum (file_id, created_at)",
+     "checksum_file_id_index", "checksum (file_id)"),
+    # Joining a file's validation_files to validation can be answered from the index alone.
+    ("validation_files_file_id_validation_id_index", "validation_files (file_id, validation_id)",
+     "validation_files_file_id_index", "validation_files (file_id)"),
+]
+
+# Jobs in progress or failed are a small fraction of all jobs, and are all the health check looks at.
+PARTIAL_INDICES = [
+    ("checksum_unfinished_status_updated_at_index", "checksum (status, updated_at)",
+     "status IN ('SCHEDULED', 'CHECKSUMMING', 'FAILED')"),
+    ("validation_unfinished_status_updated_at_index", "validation (status, updated_at)",
+     "status IN ('SCHEDULING_QUEUED', 'SCHEDULED', 'VALIDATING', 'FAILED')"),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY does not lock out writes, but cannot run inside a transaction.
+    # If it fails it leaves an INVALID index behind: drop that before running this migration again.
+    op.execute('COMMIT')
+    for name, columns, replaced_name, _ in COMPOSITE_INDICES:
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {columns};")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {replaced_name};")
+    for name, columns, predicate in PARTIAL_INDICES:
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {columns} WHERE {predicate};")
+
+
+def downgrade():
+    op.execute('COMMIT')
+    for name, _, _ in PARTIAL_INDICES:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+    for name, _, replaced_name, replaced_columns in COMPOSITE_INDICES:
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {replaced_name} ON {replaced_columns};")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
@@ -0,0 +1,30 @@
+"""file s3_etag size index
+
+Revision ID: 9c925ff1b517
+Revises: 0e33836280f2
+Create Date: 2026-10-18 09:12:41.220913
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9c925ff1b517'
+down_revision = '0e33836280f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Supports ChecksumReuse: finding checksummed files with identical contents in other upload areas.
+    # The predicate must match ChecksumReuse's query for the index to be used.
+    # CREATE INDEX CONCURRENTLY does not lock out writes to file, but cannot run inside a transaction.
+    # If it fails it leaves an INVALID index behind: drop that before running this migration again.
+    op.execute('COMMIT')
+    op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS file_s3_etag_size_index ON file (s3_etag, size) "
+               "WHERE jsonb_typeof(checksums) = 'object';")
+
+
+def downgrade():
+    op.execute('COMMIT')
+    op.execute("DROP INDEX CONCURRENTLY IF EXISTS file_s3_etag_size_index;")
@@ -0,0 +1,230 @@
+"""create upload_area_count table
+
+Revision ID: a83f5c2d917e
+Revises: 6b2e9d41c0f7
+Create Date: 2026-10-18 17:48:02.639158
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83f5c2d917e'
+down_revision = '6b2e9d41c0f7'
+branch_labels = None
+depends_on = None
+
+# Counters kept per upload area, see upload/common/upload_area_counts.py:
+#   file_names        distinct file names (status is '')
+#   checksum_files    files with a checksum in each status
+#   validation_files  (validation, file) pairs whose validation is in each status
+# Triggers keep them up to date whatever writes the tables, including cascaded deletes.
+# Files are never renamed or moved between areas, so updates to file are not counted.
+#
+# Under READ COMMITTED a trigger cannot see rows written by transactions that have not committed yet, so
+# triggers that look at other rows first take a lock that concurrent writes of the same counts also take,
+# and wait for those transactions to commit:
+#   file              an advisory lock on the (upload area, name)
+#   checksum          the file row, FOR NO KEY UPDATE: FOR UPDATE would deadlock with the FOR KEY SHARE
+#                     lock that the foreign key check of another checksum of the same file holds
+#   validation_files  the validation row, FOR SHARE, which waits for changes to its status
+
+ADD_TO_COUNT_FUNCTION = """
+CREATE FUNCTION add_to_upload_area_count(area_id INTEGER, counter_name VARCHAR, counter_status VARCHAR,
+                                         delta BIGINT) RETURNS void AS $$
+BEGIN
+    IF area_id IS NULL OR counter_status IS NULL THEN
+        RETURN;  -- the file or validation is being deleted, and its counts already have been
+    END IF;
+    IF delta > 0 THEN
+        INSERT INTO upload_area_count (upload_area_id, counter, status, total)
+            VALUES (area_id, counter_name, counter_status, delta)
+            ON CONFLICT (upload_area_id, counter, status)
+            DO UPDATE SET total = upload_area_count.total + EXCLUDED.total, updated_at = now();
+    ELSIF delta < 0 THEN
+        -- Deleting an upload area cascades to its files, and to its counts, which are then left alone.
+        UPDATE upload_area_count SET total = total + delta, updated_at = now()
+            WHERE upload_area_id = area_id AND counter = counter_name AND status = counter_status
+            AND EXISTS (SELECT 1 FROM upload_area WHERE id = area_id);
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+COUNT_FILE_FUNCTION = """
+CREATE FUNCTION count_file() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(NEW.upload_area_id || '/' || NEW.name));
+    IF NOT EXISTS (SELECT 1 FROM file
+                   WHERE upload_area_id = NEW.upload_area_id AND name = NEW.name AND id != NEW.id) THEN
+        PERFORM add_to_upload_area_count(NEW.upload_area_id, 'file_names', '', 1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Runs before the file's checksums and validation_files are deleted by cascade.
+UNCOUNT_FILE_FUNCTION = """
+CREATE FUNCTION uncount_file() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(OLD.upload_area_id || '/' || OLD.name));
+    IF NOT EXISTS (SELECT 1 FROM file
+                   WHERE upload_area_id = OLD.upload_area_id AND name = OLD.name AND id != OLD.id) THEN
+        PERFORM add_to_upload_area_count(OLD.upload_area_id, 'file_names', '', -1);
+    END IF;
+    PERFORM add_to_upload_area_count(OLD.upload_area_id, 'checksum_files', statuses.status::text, -1)
+        FROM (SELECT DISTINCT status FROM checksum WHERE file_id = OLD.id) AS statuses;
+    PERFORM add_to_upload_area_count(OLD.upload_area_id, 'validation_files', validation.status::text, -COUNT(*))
+        FROM validation_files JOIN validation ON validation.id = validation_files.validation_id
+        WHERE validation_files.file_id = OLD.id
+        GROUP BY validation.status;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+COUNT_CHECKSUM_FUNCTION = """
+CREATE FUNCTION count_checksum() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF OLD.status = NEW.status AND OLD.file_id = NEW.file_id THEN
+            RETURN NULL;
+        END IF;
+        PERFORM 1 FROM file WHERE id IN (OLD.file_id, NEW.file_id) ORDER BY id FOR NO KEY UPDATE;
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM 1 FROM file WHERE id = NEW.file_id FOR NO KEY UPDATE;
+    ELSE
+        PERFORM 1 FROM file WHERE id = OLD.file_id FOR NO KEY UPDATE;
+    END IF;
+    IF TG_OP != 'INSERT' THEN
+        IF NOT EXISTS (SELECT 1 FROM checksum WHERE file_id = OLD.file_id AND status = OLD.status) THEN
+            PERFORM add_to_upload_area_count((SELECT upload_area_id FROM file WHERE id = OLD.file_id),
+                                             'checksum_files', OLD.status::text, -1);
+        END IF;
+    END IF;
+    IF TG_OP != 'DELETE' THEN
+        IF NOT EXISTS (SELECT 1 FROM checksum
+                       WHERE file_id = NEW.file_id AND status = NEW.status AND id != NEW.id) THEN
+            PERFORM add_to_upload_area_count((SELECT upload_area_id FROM file WHERE id = NEW.file_id),
+                                             'checksum_files', NEW.status::text, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+COUNT_VALIDATION_FILES_FUNCTION = """
+CREATE FUNCTION count_validation_files() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM add_to_upload_area_count((SELECT upload_area_id FROM file WHERE id = NEW.file_id),
+                                         'validation_files',
+                                         (SELECT status::text FROM validation WHERE id = NEW.validation_id
+                                          FOR SHARE), 1);
+    ELSE
+        PERFORM add_to_upload_area_count((SELECT upload_area_id FROM file WHERE id = OLD.file_id),
+                                         'validation_files',
+                                         (SELECT status::text FROM validation WHERE id = OLD.validation_id
+                                          FOR SHARE), -1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+COUNT_VALIDATION_STATUS_FUNCTION = """
+CREATE FUNCTION count_validation_status() RETURNS trigger AS $$
+BEGIN
+    IF OLD.status != NEW.status THEN
+        PERFORM add_to_upload_area_count(file.upload_area_id, 'validation_files', OLD.status::text, -COUNT(*)),
+                add_to_upload_area_count(file.upload_area_id, 'validation_files', NEW.status::text, COUNT(*))
+            FROM validation_files JOIN file ON file.id = validation_files.file_id
+            WHERE validation_files.validation_id = NEW.id
+            GROUP BY file.upload_area_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Runs before the validation's validation_files are deleted by cascade.
+UNCOUNT_VALIDATION_FUNCTION = """
+CREATE FUNCTION uncount_validation() RETURNS trigger AS $$
+BEGIN
+    PERFORM add_to_upload_area_count(file.upload_area_id, 'validation_files', OLD.status::text, -COUNT(*))
+        FROM validation_files JOIN file ON file.id = validation_files.file_id
+        WHERE validation_files.validation_id = OLD.id
+        GROUP BY file.upload_area_id;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGERS = [
+    ("file_count", "AFTER INSERT ON file", "count_file"),
+    ("file_uncount", "BEFORE DELETE ON file", "uncount_file"),
+    ("checksum_count", "AFTER INSERT OR UPDATE OF file_id, status OR DELETE ON checksum", "count_checksum"),
+    ("validation_files_count", "AFTER INSERT OR DELETE ON validation_files", "count_validation_files"),
+    ("validation_status_count", "AFTER UPDATE OF status ON validation", "count_validation_status"),
+    ("validation_uncount", "BEFORE DELETE ON validation", "uncount_validation"),
+]
+
+# The same counts as UploadAreaCounts.repair(), for every upload area.
+BACKFILL_QUERIES = [
+    "INSERT INTO upload_area_count (upload_area_id, counter, status, total) "
+    "SELECT upload_area_id, 'file_names', '', COUNT(DISTINCT name) FROM file GROUP BY upload_area_id;",
+
+    "INSERT INTO upload_area_count (upload_area_id, counter, status, total) "
+    "SELECT file.upload_area_id, 'checksum_files', checksum.status::text, COUNT(DISTINCT checksum.file_id) "
+    "FROM checksum JOIN file ON checksum.file_id = file.id "
+    "GROUP BY file.upload_area_id, checksum.status;",
+
+    "INSERT INTO upload_area_count (upload_area_id, counter, status, total) "
+    "SELECT file.upload_area_id, 'validation_files', validation.status::text, COUNT(*) "
+    "FROM validation JOIN validation_files ON validation.id = validation_files.validation_id "
+    "JOIN file ON validation_files.file_id = file.id "
+    "GROUP BY file.upload_area_id, validation.status;",
+]
+
+
+def upgrade():
+    # Migration 6b2e9d41c0f7 commits Alembic's transaction, so start our own (if one is still open, Postgres
+    # only warns), and keep writers out of the counted tables until the triggers and backfill are committed.
+    # Otherwise rows written between the backfill's snapshot and the triggers' creation would not be counted.
+    op.execute("BEGIN;")
+    op.execute("LOCK TABLE file, checksum, validation, validation_files IN SHARE ROW EXCLUSIVE MODE;")
+    op.create_table(
+        'upload_area_count',
+        sa.Column('upload_area_id', sa.Integer, primary_key=True),
+        sa.Column('counter', sa.String, primary_key=True),
+        sa.Column('status', sa.String, primary_key=True),
+        sa.Column('total', sa.BigInteger, nullable=False),
+        sa.Column('created_at', sa.types.DateTime(timezone=True), nullable=False, server_default=text('now()')),
+        sa.Column('updated_at', sa.types.DateTime(timezone=True), nullable=False, server_default=text('now()'))
+    )
+    op.execute("ALTER TABLE upload_area_count "
+               "ADD CONSTRAINT upload_area_count_upload_area_id FOREIGN KEY (upload_area_id) "
+               "REFERENCES upload_area (id) ON DELETE CASCADE;")
+    for function in (ADD_TO_COUNT_FUNCTION, COUNT_FILE_FUNCTION, UNCOUNT_FILE_FUNCTION, COUNT_CHECKSUM_FUNCTION,
+                     COUNT_VALIDATION_FILES_FUNCTION, COUNT_VALIDATION_STATUS_FUNCTION, UNCOUNT_VALIDATION_FUNCTION):
+        op.execute(function)
+    for name, when, function_name in TRIGGERS:
+        op.execute(f"CREATE TRIGGER {name} {when} FOR EACH ROW EXECUTE PROCEDURE {function_name}();")
+    for query in BACKFILL_QUERIES:
+        op.execute(query)
+    op.execute("COMMIT;")
+
+
+def downgrade():
+    op.execute("BEGIN;")
+    for name, when, function_name in TRIGGERS:
+        table = when.split()[-1]
+        op.execute(f"DROP TRIGGER {name} ON {table};")
+        op.execute(f"DROP FUNCTION {function_name}();")
+    op.execute("DROP FUNCTION add_to_upload_area_count(INTEGER, VARCHAR, VARCHAR, BIGINT);")
+    op.drop_table('upload_area_count')
+    op.execute("COMMIT;")
@@ -5,6 +5,22 @@ resource "aws_s3_bucket" "upload_areas_bucket" {
   acceleration_status = "Enabled"
 }
 
+// Checkpoints of Batch checksumming jobs, so that a retry after a Spot interruption can resume.
+// Kept out of the upload areas bucket, where every new object would be an S3 event for the checksum daemon.
+resource "aws_s3_bucket" "checksum_checkpoints" {
+  bucket = "${var.bucket_name_prefix}csum-checkpoints-${var.deployment_stage}"
+  acl = "private"
+  force_destroy = "true"
+
+  lifecycle_rule {
+    id = "expire-abandoned-checkpoints"
+    enabled = true
+    expiration {
+      days = 7
+    }
+  }
+}
+
 resource "aws_iam_policy" "upload_areas_submitter_access" {
   name = "dcp-upload-areas-submitter-access-${var.deployment_stage}"
   // Note that this policy creates very broad access, to all upload areas in the bucket.
@@ -66,6 +66,17 @@ resource "aws_iam_policy" "csum_job_policy" {
                 "arn:aws:s3:::${aws_s3_bucket.upload_areas_bucket.bucket}/*"
             ]
         },
+        {
+            "Effect": "Allow",
+            "Action": [
+                "s3:GetObject",
+                "s3:PutObject",
+                "s3:DeleteObject"
+            ],
+            "Resource": [
+                "arn:aws:s3:::${aws_s3_bucket.checksum_checkpoints.bucket}/*"
+            ]
+        },
         {
             "Effect": "Allow",
             "Action": [
@@ -88,7 +88,8 @@ resource "aws_iam_role_policy" "upload_csum_lambda" {
         "sqs:ChangeMessageVisibility",
         "sqs:DeleteMessage",
         "sqs:GetQueueAttributes",
-        "sqs:ReceiveMessage"
+        "sqs:ReceiveMessage",
+        "sqs:SendMessage"
       ],
       "Resource": [
         "arn:aws:sqs:*:*:${aws_sqs_queue.upload_queue.name}"
@@ -118,7 +119,8 @@ resource "aws_lambda_function" "upload_checksum_lambda" {
     variables = {
       DEPLOYMENT_STAGE = "${var.deployment_stage}",
       API_HOST = "${var.upload_api_fqdn}",
-      CSUM_DOCKER_IMAGE = "${var.csum_docker_image}"
+      CSUM_DOCKER_IMAGE = "${var.csum_docker_image}",
+      CSUM_CHECKPOINT_BUCKET = "${aws_s3_bucket.checksum_checkpoints.bucket}"
     }
   }
 }
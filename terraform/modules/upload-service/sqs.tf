@@ -49,6 +49,9 @@ POLICY
 }
 
 resource "aws_lambda_event_source_mapping" "event_source_mapping" {
+  # The checksum daemon can process whole batches and report partial failures.  Until this sets
+  # function_response_types = ["ReportBatchItemFailures"] (needs AWS provider >= 3.39), and the lambda
+  # REPORT_BATCH_ITEM_FAILURES with it, a batch with any failed message is retried in full.
   batch_size = 1
   event_source_arn  = "${aws_sqs_queue.upload_queue.arn}"
   enabled           = true
@@ -92,7 +95,8 @@ resource "aws_sqs_queue" "validation_deadletter_queue" {
 }
 
 resource "aws_lambda_event_source_mapping" "validation_event_source_mapping" {
-  batch_size = 1
+  # Validations in one batch that share a validator image are submitted as one Batch array job.
+  batch_size = 10
   event_source_arn  = "${aws_sqs_queue.validation_queue.arn}"
   enabled           = true
   function_name     = "${aws_lambda_function.validation_scheduler_lambda.arn}"
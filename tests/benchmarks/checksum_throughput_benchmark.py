@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+Measure checksumming throughput against an in-process S3 stand-in (moto), so that regressions can be caught
+and read concurrency / part sizes tuned from data rather than guesswork.
+
+Benchmarks:
+    reader       ParallelS3Reader alone: sweeps part size and concurrency
+    computer     DssChecksums.ChecksumComputer: sweeps concurrency, serial vs pipelined hashing
+    calculator   ClientSideChecksumHandler.ChecksumCalculator on a local file: sweeps hash sets
+    checksummer  the Batch checksummer entry point, in test mode (no Upload API calls)
+
+Every file size is run through every benchmark.  Results are printed as JSON, one entry per case, with
+MB/s, peak RSS (sampled while the case runs) and process CPU time for each case.
+
+    python -m tests.benchmarks.checksum_throughput_benchmark --sizes-mb 64 512 --concurrency 4 16
+"""
+
+import argparse
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import uuid
+
+import boto3
+from moto import mock_s3
+
+from upload.common.client_side_checksum_handler import ClientSideChecksumHandler
+from upload.common.dss_checksums import DssChecksums
+from upload.common.parallel_s3_reader import ParallelS3Reader
+
+MB = 1024 * 1024
+BUCKET_NAME = 'checksum-benchmark'
+
+
+class PeakRssSampler:
+    """ Samples resident set size on a background thread; ru_maxrss only ever reports the peak of the process. """
+
+    INTERVAL_SECONDS = 0.01
+
+    def __init__(self):
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.peak_bytes = self._current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.INTERVAL_SECONDS):
+            self.peak_bytes = max(self.peak_bytes, self._current_rss())
+
+    @staticmethod
+    def _current_rss():
+        try:
+            with open('/proc/self/statm') as fp:
+                return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # not Linux: best we can do
+
+
+def measure(size, fn, **params):
+    start_time = time.time()
+    start_cpu = time.process_time()
+    with PeakRssSampler() as rss:
+        fn()
+    elapsed = time.time() - start_time
+    return dict(params,
+                size_mb=size / MB,
+                elapsed_s=round(elapsed, 3),
+                cpu_s=round(time.process_time() - start_cpu, 3),
+                mb_per_s=round(size / MB / elapsed, 1),
+                peak_rss_mb=round(rss.peak_bytes / MB, 1))
+
+
+def bench_reader(s3obj, local_path, args):
+    for part_mb in args.part_mb:
+        for concurrency in args.concurrency:
+            reader = ParallelS3Reader(s3obj, part_size=part_mb * MB, concurrency=concurrency)
+            yield measure(s3obj.content_length, lambda: sum(len(part) for part in reader.parts()),
+                          benchmark='reader', part_mb=part_mb, concurrency=concurrency)
+
+
+def bench_computer(s3obj, local_path, args):
+    for concurrency in args.concurrency:
+        for pipelined in (False, True):
+            computer = DssChecksums.ChecksumComputer(s3obj, concurrency=concurrency, pipelined=pipelined)
+            yield measure(s3obj.content_length, computer.compute,
+                          benchmark='computer', concurrency=concurrency, pipelined=pipelined)
+
+
+def bench_calculator(s3obj, local_path, args):
+    size = os.path.getsize(local_path)
+    for hash_set in args.hash_sets:
+        calculator = ClientSideChecksumHandler.ChecksumCalculator(size, filename=local_path,
+                                                                  checksums=hash_set.split(','))
+        yield measure(size, calculator.compute, benchmark='calculator', hash_set=hash_set)
+
+
+def bench_checksummer(s3obj, local_path, args):
+    from upload.docker_images.checksummer.checksummer import Checksummer
+    os.environ.update({'CONTAINER': 'yes', 'AWS_BATCH_JOB_ID': 'benchmark', 'CHECKSUM_ID': str(uuid.uuid4()),
+                       'API_HOST': 'localhost', 'CSUM_CHECKPOINT_BUCKET': BUCKET_NAME})
+    boto3.client('s3').put_object_tagging(Bucket=BUCKET_NAME, Key=s3obj.key, Tagging={'TagSet': []})
+    DssChecksums.Tagger.clear_cache()
+    argv = [f"s3://{BUCKET_NAME}/{s3obj.key}", s3obj.e_tag.strip('"'), '--test']
+    yield measure(s3obj.content_length, lambda: Checksummer(argv), benchmark='checksummer')
+
+
+BENCHMARKS = {
+    'reader': bench_reader,
+    'computer': bench_computer,
+    'calculator': bench_calculator,
+    'checksummer': bench_checksummer
+}
+
+
+def run(args):
+    results = []
+    s3 = boto3.resource('s3')
+    bucket = s3.Bucket(BUCKET_NAME)
+    bucket.create()
+    with tempfile.TemporaryDirectory() as tempdir:
+        for size_mb in args.sizes_mb:
+            local_path = os.path.join(tempdir, f"{size_mb}MB")
+            with open(local_path, 'wb') as fp:
+                for _ in range(size_mb):
+                    fp.write(os.urandom(MB))
+            key = f"benchmark-area/{size_mb}MB"
+            bucket.upload_file(local_path, key)
+            s3obj = bucket.Object(key)
+            s3obj.load()
+            for benchmark in args.benchmarks:
+                for _ in range(args.repeat):
+                    results.extend(BENCHMARKS[benchmark](s3obj, local_path, args))
+            os.remove(local_path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[16, 128], help="file sizes to checksum")
+    parser.add_argument('--part-mb', type=int, nargs='+', default=[8, 64], help="reader part sizes")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help="reader concurrency")
+    parser.add_argument('--hash-sets', nargs='+', default=['crc32c', 'sha1,sha256', 'crc32c,sha1,sha256,s3_etag'],
+                        help="comma separated hash function sets for the calculator")
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=1, help="run each case this many times")
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_s3():
+        results = run(args)
+    print(json.dumps({'cpu_count': os.cpu_count(), 'results': results}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
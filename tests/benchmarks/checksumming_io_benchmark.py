@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Compare the throughput of ChecksummingSink (all hashes in series on one thread)
+with PipelinedChecksummingSink (one thread per hash function).
+
+    python -m tests.benchmarks.checksumming_io_benchmark --size-mb 1024 --chunk-mb 64
+"""
+
+import argparse
+import json
+import os
+import time
+
+from upload.common.checksumming_io import ChecksummingSink, PipelinedChecksummingSink
+
+MB = 1024 * 1024
+
+SINKS = {
+    'serial': ChecksummingSink,
+    'pipelined': PipelinedChecksummingSink
+}
+
+
+def measure(sink_class, chunk, chunk_count):
+    start_time = time.time()
+    start_cpu = time.process_time()
+    with sink_class(len(chunk)) as sink:
+        for _ in range(chunk_count):
+            sink.write(chunk)
+        sink.get_checksums()
+    elapsed = time.time() - start_time
+    return {
+        'bytes': len(chunk) * chunk_count,
+        'elapsed_s': elapsed,
+        'cpu_s': time.process_time() - start_cpu,
+        'bytes_per_s': len(chunk) * chunk_count / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=1024, help="amount of data to checksum")
+    parser.add_argument('--chunk-mb', type=int, default=64, help="size of each write")
+    parser.add_argument('--repeat', type=int, default=3, help="take the best of this many runs")
+    args = parser.parse_args()
+
+    chunk = os.urandom(args.chunk_mb * MB)
+    chunk_count = max(1, args.size_mb // args.chunk_mb)
+    results = {}
+    for mode, sink_class in SINKS.items():
+        runs = [measure(sink_class, chunk, chunk_count) for _ in range(args.repeat)]
+        results[mode] = max(runs, key=lambda run: run['bytes_per_s'])
+    results['speedup'] = results['pipelined']['bytes_per_s'] / results['serial']['bytes_per_s']
+    results['cpu_count'] = os.cpu_count()
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Measure UploadDB queries/s under concurrency, for the two hottest lookups: an upload area by uuid and
+a file by (s3_key, s3_etag).  Needs a Postgres with the Upload Service schema (alembic upgrade head).
+
+Every pool size is run with every thread count, once with statements built per query (as UploadDB did
+before select_statement() existed) and once with the shared, compile-cached statements.
+
+Also reports how long reflecting the schema takes, which UploadDB did before its first query in every
+process until it took its table definitions from database_orm.
+
+    python -m tests.benchmarks.database_benchmark --pool-sizes 1 8 --threads 1 8 16
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+
+from sqlalchemy import and_, create_engine, MetaData
+
+from upload.common.database import UploadDB
+from upload.common.upload_config import UploadDbConfig
+
+
+class Fixture:
+
+    def __init__(self):
+        db = UploadDB()
+        self.area_uuid = str(uuid.uuid4())
+        area_id = db.create_pg_record('upload_area', {
+            'uuid': self.area_uuid,
+            'bucket_name': 'database-benchmark',
+            'status': 'UNLOCKED'
+        })
+        self.s3_key = f"{self.area_uuid}/file.fastq.gz"
+        self.s3_etag = uuid.uuid4().hex
+        db.create_pg_record('file', {
+            's3_key': self.s3_key,
+            's3_etag': self.s3_etag,
+            'upload_area_id': area_id,
+            'name': 'file.fastq.gz',
+            'size': 1,
+            'checksums': {}
+        })
+
+    def delete(self):
+        db = UploadDB()
+        db.run_query_with_params("DELETE FROM file WHERE s3_key = %s;", (self.s3_key,))
+        db.run_query_with_params("DELETE FROM upload_area WHERE uuid = %s;", (self.area_uuid,))
+
+
+def built_queries(fixture):
+    db = UploadDB()
+    area_table = db.table('upload_area')
+    file_table = db.table('file')
+    db.run_query(area_table.select().where(area_table.columns['uuid'] == fixture.area_uuid)).fetchall()
+    db.run_query(file_table.select().where(and_(file_table.columns['s3_key'] == fixture.s3_key,
+                                                file_table.columns['s3_etag'] == fixture.s3_etag))).fetchall()
+
+
+def cached_queries(fixture):
+    db = UploadDB()
+    db.run_select_statement(db.select_statement('upload_area', 'uuid'), {'uuid': fixture.area_uuid}).fetchall()
+    db.run_select_statement(db.select_statement('file', 's3_key', 's3_etag'),
+                            {'s3_key': fixture.s3_key, 's3_etag': fixture.s3_etag}).fetchall()
+
+
+QUERIES_PER_CALL = 2
+IMPLEMENTATIONS = {
+    'built': built_queries,
+    'cached': cached_queries
+}
+
+
+def reflection_seconds(database_uri):
+    engine = create_engine(database_uri)
+    engine.execute("SELECT 1;")  # don't count connecting
+    start_time = time.time()
+    MetaData(engine).reflect()
+    elapsed = time.time() - start_time
+    engine.dispose()
+    return round(elapsed, 3)
+
+
+def measure(implementation, fixture, threads, seconds):
+    calls = [0] * threads
+    deadline = time.time() + seconds
+
+    def worker(index):
+        while time.time() < deadline:
+            implementation(fixture)
+            calls[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start_time = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start_time
+    return round(sum(calls) * QUERIES_PER_CALL / elapsed, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--database-uri', default='postgresql://:@localhost/upload_local')
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--seconds', type=float, default=5, help="duration of each case")
+    args = parser.parse_args()
+
+    UploadDbConfig().set({'database_uri': args.database_uri, 'pgbouncer_uri': args.database_uri})
+    fixture = Fixture()
+    results = {'reflection_seconds': reflection_seconds(args.database_uri), 'queries': []}
+    try:
+        for pool_size in args.pool_sizes:
+            UploadDB.configure(pool_size=pool_size)
+            for threads in args.threads:
+                for name, implementation in IMPLEMENTATIONS.items():
+                    results['queries'].append({
+                        'pool_size': pool_size,
+                        'threads': threads,
+                        'statements': name,
+                        'queries_per_s': measure(implementation, fixture, threads, args.seconds)
+                    })
+    finally:
+        UploadDB.configure()
+        fixture.delete()
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Compare checksumming a local file by reading it chunk by chunk (the previous implementation, which allocates a
+new bytes object per chunk) with ClientSideChecksumHandler.ChecksumCalculator, which feeds the sink
+memoryview slices of a memory map.
+
+Reports MB/s, how many of the chunks handed to the sink were freshly allocated buffers, and the peak
+memory allocated by Python (tracemalloc) while checksumming.
+
+    python -m tests.benchmarks.local_file_checksumming_benchmark --size-mb 1024
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from dcplib.s3_multipart import get_s3_multipart_chunk_size
+
+from upload.common import client_side_checksum_handler
+from upload.common.checksumming_io import ChecksummingSink
+from upload.common.client_side_checksum_handler import ClientSideChecksumHandler
+
+MB = 1024 * 1024
+
+
+class CountingChecksummingSink(ChecksummingSink):
+
+    writes = 0
+    copies = 0
+
+    def write(self, data):
+        CountingChecksummingSink.writes += 1
+        if isinstance(data, bytes):
+            CountingChecksummingSink.copies += 1
+        return super().write(data)
+
+
+def read_chunks(path, size, hash_functions):
+    """ The implementation ChecksumCalculator used before it memory mapped files. """
+    chunk_size = get_s3_multipart_chunk_size(size)
+    with CountingChecksummingSink(chunk_size, hash_functions=hash_functions) as sink:
+        with open(path, 'rb') as file_object:
+            while True:
+                data = file_object.read(chunk_size)
+                if not data:
+                    break
+                sink.write(data)
+        return sink.get_checksums()
+
+
+def mapped_chunks(path, size, hash_functions):
+    with patch.object(client_side_checksum_handler, 'ChecksummingSink', CountingChecksummingSink):
+        return ClientSideChecksumHandler.ChecksumCalculator(size, filename=path, checksums=hash_functions).compute()
+
+
+def measure(implementation, path, size, hash_functions):
+    CountingChecksummingSink.writes = CountingChecksummingSink.copies = 0
+    tracemalloc.start()
+    start_time = time.time()
+    checksums = implementation(path, size, hash_functions)
+    elapsed = time.time() - start_time
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'mb_per_s': round(size / MB / elapsed, 1),
+        'sink_writes': CountingChecksummingSink.writes,
+        'chunk_allocations': CountingChecksummingSink.copies,
+        'peak_traced_mb': round(peak_traced / MB, 1),
+        'checksums': checksums
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=512, help="size of the file to checksum")
+    parser.add_argument('--hash-functions', default='crc32c,sha1,sha256,s3_etag', help="comma separated")
+    args = parser.parse_args()
+
+    hash_functions = args.hash_functions.split(',')
+    with tempfile.NamedTemporaryFile() as fp:
+        for _ in range(args.size_mb):
+            fp.write(os.urandom(MB))
+        fp.flush()
+        size = args.size_mb * MB
+        results = {
+            'before': measure(read_chunks, fp.name, size, hash_functions),
+            'after': measure(mapped_chunks, fp.name, size, hash_functions)
+        }
+    assert results['before'].pop('checksums') == results['after'].pop('checksums'), "checksums differ"
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ import boto3
 from moto import mock_iam, mock_s3, mock_sts, mock_sqs
 
 from upload.common.database_orm import DBSessionMaker, DbUploadArea
+from upload.common.dss_checksums import DssChecksums
 from upload.common.upload_config import UploadConfig, UploadDbConfig, UploadVersion, UploadOutgoingIngestAuthConfig
 
 os.environ['LOG_LEVEL'] = 'CRITICAL'
@@ -180,6 +181,8 @@ class UploadTestCaseUsingMockAWS(UploadTestCase):
         # Upload Bucket
         self.upload_bucket = boto3.resource('s3').Bucket(self.upload_config.bucket_name)
         self.upload_bucket.create()
+        # Each test's mock bucket is new, but object keys and etags repeat between tests
+        DssChecksums.Tagger.clear_cache()
 
         self.sqs = boto3.resource('sqs')
         self.sqs.create_queue(QueueName=f"bogo_url")  # TODO: what is this?  Needs comment or renamed.
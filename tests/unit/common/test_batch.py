@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+from upload.common.batch import JobDefinition
+
+
+def job_definition_metadata(revision):
+    return {'jobDefinitionName': 'upload-test-123', 'jobDefinitionArn': f"arn:aws:batch:job-definition/foo:{revision}",
+            'containerProperties': {'image': 'foo/bar:1'}}
+
+
+@patch('upload.common.batch.batch')
+class TestJobDefinitionCache(unittest.TestCase):
+
+    def setUp(self):
+        JobDefinition.clear_cache()
+
+    def _find_or_create(self):
+        return JobDefinition.find_or_create_cached('foo/bar:1', 'test', 'bogo_role_arn')
+
+    def test_find_or_create_cached__describes_the_job_definition_only_once(self, mock_batch):
+        mock_batch.describe_job_definitions.return_value = {'jobDefinitions': [job_definition_metadata(1)]}
+
+        for _ in range(3):
+            job_defn = self._find_or_create()
+
+        self.assertEqual("arn:aws:batch:job-definition/foo:1", job_defn.arn)
+        mock_batch.describe_job_definitions.assert_called_once()
+
+    def test_find_or_create_cached__describes_it_again_after_the_ttl(self, mock_batch):
+        mock_batch.describe_job_definitions.return_value = {'jobDefinitions': [job_definition_metadata(1)]}
+
+        with patch('upload.common.batch.time.time', return_value=1000):
+            self._find_or_create()
+        with patch('upload.common.batch.time.time', return_value=1000 + JobDefinition.CACHE_TTL_SECONDS):
+            self._find_or_create()
+
+        self.assertEqual(2, mock_batch.describe_job_definitions.call_count)
+
+    def test_find_or_create_cached__creates_a_missing_job_definition(self, mock_batch):
+        mock_batch.describe_job_definitions.return_value = {'jobDefinitions': []}
+        mock_batch.register_job_definition.return_value = job_definition_metadata(1)
+
+        self.assertEqual("arn:aws:batch:job-definition/foo:1", self._find_or_create().arn)
+
+    def test_submit_job__when_a_cached_job_definition_is_rejected__finds_it_again_and_resubmits(self, mock_batch):
+        mock_batch.describe_job_definitions.return_value = {'jobDefinitions': [job_definition_metadata(1)]}
+        job_defn = self._find_or_create()
+        mock_batch.describe_job_definitions.return_value = {'jobDefinitions': [job_definition_metadata(2)]}
+        rejection = ClientError({'Error': {'Code': 'ClientException',
+                                           'Message': "Job definition foo:1 is INACTIVE"}}, 'SubmitJob')
+        mock_batch.submit_job.side_effect = [rejection, {'jobId': "123"}]
+
+        job = job_defn.submit_job(jobName="job", jobQueue="queue")
+
+        self.assertEqual("123", job['jobId'])
+        mock_batch.submit_job.assert_called_with(jobDefinition="arn:aws:batch:job-definition/foo:2",
+                                                 jobName="job", jobQueue="queue")
+        self.assertEqual("arn:aws:batch:job-definition/foo:2", self._find_or_create().arn)
+
+    def test_submit_job__does_not_retry_other_errors(self, mock_batch):
+        mock_batch.describe_job_definitions.return_value = {'jobDefinitions': [job_definition_metadata(1)]}
+        job_defn = self._find_or_create()
+        mock_batch.submit_job.side_effect = ClientError({'Error': {'Code': 'ClientException',
+                                                                   'Message': "Job queue not found"}}, 'SubmitJob')
+
+        with self.assertRaises(ClientError):
+            job_defn.submit_job(jobName="job", jobQueue="queue")
+        mock_batch.submit_job.assert_called_once()
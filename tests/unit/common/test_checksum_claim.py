@@ -0,0 +1,66 @@
+import uuid
+
+from upload.common.checksum_claim import ChecksumClaim
+from upload.common.database_orm import DBSessionMaker, DbChecksumClaim
+from .. import UploadTestCaseUsingMockAWS
+
+
+class TestChecksumClaim(UploadTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super().setUp()
+        self.db = DBSessionMaker().session()
+        self.s3_key = f"{uuid.uuid4()}/foo"
+        self.s3_etag = "acbd18db4cc2f85cedef654fccc4a4d8"
+
+    def _claim(self, sequencer):
+        return ChecksumClaim(self.s3_key, self.s3_etag, sequencer)
+
+    def test_normalize_sequencer__pads_so_that_string_order_is_numeric_order(self):
+        self.assertLess(ChecksumClaim.normalize_sequencer('FF'), ChecksumClaim.normalize_sequencer('100'))
+        self.assertEqual('0' * ChecksumClaim.SEQUENCER_WIDTH, ChecksumClaim.normalize_sequencer(None))
+
+    def test_acquire__only_one_claim_can_be_live(self):
+        self.assertTrue(self._claim('0059BB193641C4EAB0').acquire())
+        self.assertFalse(self._claim('0059BB193641C4EAB1').acquire())
+
+    def test_acquire__claims_on_different_contents_do_not_conflict(self):
+        self.assertTrue(self._claim('0059BB193641C4EAB0').acquire())
+        self.assertTrue(ChecksumClaim(self.s3_key, "different-etag", '0059BB193641C4EAB1').acquire())
+
+    def test_acquire__an_expired_claim_can_be_taken_over(self):
+        self.assertTrue(self._claim('0059BB193641C4EAB0').acquire(ttl_seconds=-1))
+        claim = self._claim('0059BB193641C4EAB1')
+
+        self.assertTrue(claim.acquire())
+        record = self.db.query(DbChecksumClaim).filter(DbChecksumClaim.s3_key == self.s3_key).one()
+        self.assertEqual(claim.claim_id, record.claim_id)
+
+    def test_release__deletes_the_claim(self):
+        claim = self._claim('0059BB193641C4EAB0')
+        claim.acquire()
+
+        self.assertFalse(claim.release())
+        self.assertEqual(0, self.db.query(DbChecksumClaim).filter(DbChecksumClaim.s3_key == self.s3_key).count())
+        self.assertTrue(self._claim('0059BB193641C4EAB1').acquire())
+
+    def test_release__reports_reuploads_while_the_claim_was_held(self):
+        claim = self._claim('0059BB193641C4EAB0')
+        claim.acquire()
+        self._claim('0059BB193641C4EAB5').acquire()
+
+        self.assertTrue(claim.release())
+
+    def test_release__ignores_redelivery_of_the_same_event(self):
+        claim = self._claim('0059BB193641C4EAB0')
+        claim.acquire()
+        self._claim('0059BB193641C4EAB0').acquire()
+
+        self.assertFalse(claim.release())
+
+    def test_release_by_key__releases_whichever_claim_is_held(self):
+        self._claim('0059BB193641C4EAB0').acquire()
+        self._claim('0059BB193641C4EAB5').acquire()
+
+        self.assertTrue(ChecksumClaim.release_by_key(self.s3_key, self.s3_etag))
+        self.assertTrue(self._claim('0059BB193641C4EAB6').acquire())
@@ -0,0 +1,72 @@
+import uuid
+from unittest.mock import patch
+
+from upload.common.checksum_reuse import ChecksumReuse
+from upload.common.database_orm import DBSessionMaker, DbFile
+from upload.common.upload_area import UploadArea
+from .. import UploadTestCaseUsingMockAWS
+from ... import FixtureFile
+
+
+class TestChecksumReuse(UploadTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super().setUp()
+        self.db = DBSessionMaker().session()
+        self.test_file = FixtureFile.factory('foo')
+
+        self.first_area = UploadArea(str(uuid.uuid4()))
+        self.first_area.update_or_create()
+        self.second_area = UploadArea(str(uuid.uuid4()))
+        self.second_area.update_or_create()
+
+    def _upload(self, upload_area, contents=None, checksums=None):
+        s3_key = f"{upload_area.uuid}/{self.test_file.name}"
+        s3obj = self.create_s3_object(object_key=s3_key, content=contents or self.test_file.contents)
+        s3obj.load()
+        self.db.add(DbFile(s3_key=s3_key, s3_etag=s3obj.e_tag.strip('"'), upload_area_id=upload_area.db_id,
+                           name=self.test_file.name, size=s3obj.content_length, checksums=checksums))
+        self.db.commit()
+        return upload_area.uploaded_file(self.test_file.name)
+
+    def test_find__when_an_identical_file_has_checksums__returns_them(self):
+        self._upload(self.first_area, checksums=self.test_file.checksums)
+        uploaded_file = self._upload(self.second_area)
+
+        self.assertEqual(self.test_file.checksums, ChecksumReuse(uploaded_file, audit_fraction=0).find())
+
+    def test_find__when_no_identical_file_exists__returns_none(self):
+        uploaded_file = self._upload(self.second_area)
+
+        self.assertIsNone(ChecksumReuse(uploaded_file, audit_fraction=0).find())
+
+    def test_find__ignores_incomplete_checksums(self):
+        self._upload(self.first_area, checksums={'crc32c': self.test_file.checksums['crc32c']})
+        uploaded_file = self._upload(self.second_area)
+
+        self.assertIsNone(ChecksumReuse(uploaded_file, audit_fraction=0).find())
+
+    def test_find__when_the_identical_file_has_been_deleted__returns_none(self):
+        self._upload(self.first_area, checksums=self.test_file.checksums)
+        self.upload_bucket.Object(f"{self.first_area.uuid}/{self.test_file.name}").delete()
+        uploaded_file = self._upload(self.second_area)
+
+        self.assertIsNone(ChecksumReuse(uploaded_file, audit_fraction=0).find())
+
+    def test_find__when_selected_for_audit__returns_none_and_audit_compares_checksums(self):
+        self._upload(self.first_area, checksums=self.test_file.checksums)
+        uploaded_file = self._upload(self.second_area)
+        reuse = ChecksumReuse(uploaded_file, audit_fraction=1)
+
+        self.assertIsNone(reuse.find())
+        self.assertTrue(reuse.audit(self.test_file.checksums))
+        self.assertFalse(reuse.audit(dict(self.test_file.checksums, crc32c='00000000')))
+
+    @patch('upload.common.checksum_reuse.ChecksumReuse._read_range')
+    def test_find__when_sampled_bytes_differ__returns_none(self, mock_read_range):
+        self._upload(self.first_area, checksums=self.test_file.checksums)
+        uploaded_file = self._upload(self.second_area)
+        mock_read_range.side_effect = lambda s3_key, offset, length: b"ours" if s3_key == uploaded_file.s3_key \
+            else b"theirs"
+
+        self.assertIsNone(ChecksumReuse(uploaded_file, audit_fraction=0).find())
@@ -0,0 +1,66 @@
+import unittest
+
+from dcplib import checksumming_io as dcplib_checksumming_io
+
+from upload.common.checksumming_io import ChecksummingSink, PipelinedChecksummingSink
+from ... import FixtureFile
+
+
+class TestChecksummingSink(unittest.TestCase):
+
+    def test_get_checksums__matches_dcplib_checksumming_sink(self):
+        data = bytes(range(256)) * 1000
+        chunk_size = 10000
+
+        with dcplib_checksumming_io.ChecksummingSink(chunk_size) as dcplib_sink:
+            for offset in range(0, len(data), chunk_size):
+                dcplib_sink.write(data[offset:offset + chunk_size])
+            expected = dcplib_sink.get_checksums()
+
+        with ChecksummingSink(chunk_size) as sink:
+            for offset in range(0, len(data), chunk_size):
+                sink.write(data[offset:offset + chunk_size])
+            actual = sink.get_checksums()
+
+        self.assertEqual(expected, actual)
+
+
+class TestPipelinedChecksummingSink(unittest.TestCase):
+
+    def test_get_checksums__matches_fixture_checksums(self):
+        test_file = FixtureFile.factory("foo")
+
+        with PipelinedChecksummingSink(test_file.size) as sink:
+            sink.write(test_file.contents.encode('utf8'))
+            checksums = sink.get_checksums()
+
+        self.assertEqual(test_file.checksums, checksums)
+
+    def test_get_checksums__matches_serial_sink_across_many_writes(self):
+        data = bytes(range(256)) * 1000
+        chunk_size = 10000
+
+        with ChecksummingSink(chunk_size) as serial_sink:
+            for offset in range(0, len(data), chunk_size):
+                serial_sink.write(data[offset:offset + chunk_size])
+            expected = serial_sink.get_checksums()
+
+        with PipelinedChecksummingSink(chunk_size) as pipelined_sink:
+            for offset in range(0, len(data), chunk_size):
+                pipelined_sink.write(data[offset:offset + chunk_size])
+            actual = pipelined_sink.get_checksums()
+
+        self.assertEqual(expected, actual)
+
+    def test_get_checksums__only_computes_requested_hash_functions(self):
+        with PipelinedChecksummingSink(4, hash_functions=['crc32c']) as sink:
+            sink.write(b"exquisite corpse")
+
+            self.assertEqual({'crc32c': FixtureFile.factory("foo").crc32c}, sink.get_checksums())
+
+    def test_write__after_get_checksums__raises(self):
+        with PipelinedChecksummingSink(4) as sink:
+            sink.get_checksums()
+
+            with self.assertRaises(ValueError):
+                sink.write(b"too late")
@@ -1,3 +1,7 @@
+import hashlib
+import tempfile
+from unittest.mock import patch
+
 from upload.common.client_side_checksum_handler import ClientSideChecksumHandler, CHECKSUM_NAMES, \
     __name__ as logger_name
 from upload.common.logging import get_logger
@@ -34,16 +38,57 @@ class TestClientSideChecksumHandler(UploadTestCaseUsingMockAWS):
          _hash_function in
          CHECKSUM_NAMES]
 
-    def test__get_tag_given_s3_file__returns_warning(self):
-        _test_file = FixtureFile.factory("10241MB_file")
+    def test__get_tag_given_data_and_checksum_names__returns_those_checksums(self):
+        _test_file = FixtureFile.factory("foo")
 
-        with self.assertLogs(logger=get_logger(logger_name)) as context_manager:
-            _checksum_handler = ClientSideChecksumHandler(filename=_test_file.url)
+        _checksum_handler = ClientSideChecksumHandler(data=_test_file.contents,
+                                                      checksum_names=('crc32c', 'sha1', 'sha256', 's3_etag'))
+        _checksums = _checksum_handler.get_checksum_metadata_tag()
+
+        self.assertEqual(_test_file.checksums, _checksums)
+
+    @patch('upload.common.client_side_checksum_handler.get_s3_multipart_chunk_size')
+    def test__get_tag_given_data__computes_the_s3_etag_with_the_multipart_chunk_size(self, mock_chunk_size):
+        mock_chunk_size.return_value = 4
+        _data = b"0123456789"
+
+        _checksum_handler = ClientSideChecksumHandler(data=_data, checksum_names=('s3_etag',))
+        _checksums = _checksum_handler.get_checksum_metadata_tag()
+
+        mock_chunk_size.assert_called_once_with(len(_data))
+        _part_digests = b"".join(hashlib.md5(_data[start:start + 4]).digest() for start in range(0, len(_data), 4))
+        self.assertEqual(f"{hashlib.md5(_part_digests).hexdigest()}-3", _checksums['s3_etag'])
+
+    def test__get_tag_given_empty_file__returns_crc32c_tag(self):
+        with tempfile.NamedTemporaryFile() as _empty_file:
+            _checksum_handler = ClientSideChecksumHandler(filename=_empty_file.name)
             _checksums = _checksum_handler.get_checksum_metadata_tag()
 
-            self.assertIn("Did not perform client-side checksumming for file in S3", str(context_manager.output))
-            self.assertIn("No checksums have been computed", str(context_manager.output))
-            self.assertEquals(_checksums, {})
+        self.assertEqual({'crc32c': '00000000'}, _checksums)
+
+    def test__get_tag_given_s3_file__returns_crc32c_tag(self):
+        _test_file = FixtureFile.factory("foo")
+        _s3obj = self.create_s3_object(object_key=f"somearea/{_test_file.name}", content=_test_file.contents)
+
+        _checksum_handler = ClientSideChecksumHandler(filename=f"s3://{_s3obj.bucket_name}/{_s3obj.key}")
+        _checksums = _checksum_handler.get_checksum_metadata_tag()
+
+        self.assertEqual({'crc32c': _test_file.crc32c}, _checksums)
+
+    @patch('upload.common.client_side_checksum_handler.get_s3_multipart_chunk_size', return_value=5)
+    def test__get_tag_given_s3_file__matches_local_file_path(self, _mock_chunk_size):
+        _test_file = FixtureFile.factory("small_file")
+        _local_path = FixtureFile.fixture_file_path(_test_file.name)
+        with open(_local_path, 'rb') as _fp:
+            _s3obj = self.create_s3_object(object_key=f"somearea/{_test_file.name}", content=_fp.read())
+        _all_checksums = ('crc32c', 'sha1', 'sha256', 's3_etag')
+
+        _from_s3 = ClientSideChecksumHandler(filename=f"s3://{_s3obj.bucket_name}/{_s3obj.key}",
+                                             checksum_names=_all_checksums).get_checksum_metadata_tag()
+        _from_file = ClientSideChecksumHandler(filename=_local_path,
+                                               checksum_names=_all_checksums).get_checksum_metadata_tag()
+
+        self.assertEqual(_from_file, _from_s3)
 
     def test__get_tag_given_no_data_nor_filename__returns_warning(self):
         with self.assertLogs(logger=get_logger(logger_name)) as context_manager:
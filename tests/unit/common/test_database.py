@@ -1,8 +1,12 @@
 import uuid
+from unittest.mock import patch
 
-from .. import UploadTestCaseUsingMockAWS
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+from .. import UploadTestCaseUsingMockAWS, EnvironmentSetup
 
 from upload.common.database import UploadDB
+from upload.common.exceptions import UploadException
 from upload.common.upload_area import UploadArea
 
 
@@ -48,3 +52,153 @@ class TestDatabase(UploadTestCaseUsingMockAWS):
         self.assertEqual(results[0]["uuid"], self.area_uuid)
         self.assertEqual(results[0]["bucket_name"], self.upload_config.bucket_name)
         self.assertEqual(results[0]["status"], "UNLOCKED")
+
+    def test_create_pg_records_returns_the_new_primary_keys_in_order(self):
+        area_uuids = [str(uuid.uuid4()) for _ in range(3)]
+
+        with patch.object(UploadDB, 'BULK_INSERT_ROWS', 2):
+            area_ids = self.db.create_pg_records("upload_area", [{
+                "uuid": area_uuid,
+                "status": "UNLOCKED",
+                "bucket_name": self.upload_config.bucket_name
+            } for area_uuid in area_uuids])
+
+        self.assertEqual(3, len(area_ids))
+        for area_uuid, area_id in zip(area_uuids, area_ids):
+            self.assertEqual(area_id, self.db.get_pg_record("upload_area", area_uuid, column='uuid')["id"])
+
+    def test_create_pg_records_creates_none_of_the_records_when_one_already_exists(self):
+        new_area_uuid = str(uuid.uuid4())
+
+        with self.assertRaises(UploadException) as context:
+            self.db.create_pg_records("upload_area", [{
+                "uuid": area_uuid,
+                "status": "UNLOCKED",
+                "bucket_name": self.upload_config.bucket_name
+            } for area_uuid in (new_area_uuid, self.area_uuid)])
+
+        self.assertEqual(409, context.exception.status)
+        self.assertIsNone(self.db.get_pg_record("upload_area", new_area_uuid, column='uuid'))
+
+    def test_create_pg_records_with_conflict_columns_skips_records_that_already_exist(self):
+        new_area_uuids = [str(uuid.uuid4()) for _ in range(2)]
+
+        area_ids = self.db.create_pg_records("upload_area", [{
+            "uuid": area_uuid,
+            "status": "UNLOCKED",
+            "bucket_name": self.upload_config.bucket_name
+        } for area_uuid in (new_area_uuids[0], self.area_uuid, new_area_uuids[1])], conflict_columns=('uuid',))
+
+        self.assertIsNone(area_ids[1])
+        for area_uuid, area_id in zip(new_area_uuids, (area_ids[0], area_ids[2])):
+            self.assertEqual(area_id, self.db.get_pg_record("upload_area", area_uuid, column='uuid')["id"])
+
+    def test_create_pg_records_with_no_records_does_nothing(self):
+        self.assertEqual([], self.db.create_pg_records("upload_area", []))
+
+    def test_upsert_pg_record_creates_a_missing_record(self):
+        area_uuid = str(uuid.uuid4())
+
+        record = self.db.upsert_pg_record("upload_area", {
+            "uuid": area_uuid,
+            "status": "UNLOCKED",
+            "bucket_name": self.upload_config.bucket_name
+        }, conflict_columns=('uuid',))
+
+        self.assertEqual(record, self.db.get_pg_record("upload_area", area_uuid, column='uuid'))
+        self.assertEqual("UNLOCKED", record["status"])
+
+    def test_upsert_pg_record_updates_an_existing_record(self):
+        before = self.db.get_pg_record("upload_area", self.area_uuid, column='uuid')
+
+        record = self.db.upsert_pg_record("upload_area", {
+            "uuid": self.area_uuid,
+            "status": "LOCKED",
+            "bucket_name": self.upload_config.bucket_name
+        }, conflict_columns=('uuid',))
+
+        self.assertEqual(before["id"], record["id"])
+        self.assertEqual("LOCKED", record["status"])
+        self.assertEqual(before["created_at"], record["created_at"])
+        self.assertGreater(record["updated_at"], before["updated_at"])
+
+    def test_upsert_pg_record_only_updates_update_columns(self):
+        record = self.db.upsert_pg_record("upload_area", {
+            "uuid": self.area_uuid,
+            "status": "LOCKED",
+            "bucket_name": "another-bucket"
+        }, conflict_columns=('uuid',), update_columns=('bucket_name',))
+
+        self.assertEqual("UNLOCKED", record["status"])
+        self.assertEqual("another-bucket", record["bucket_name"])
+
+    def test_select_statement_is_reused_for_the_same_columns(self):
+        statement = self.db.select_statement("file", "s3_key", "s3_etag")
+
+        self.assertIs(self.db.select_statement("file", "s3_key", "s3_etag"), statement)
+        self.assertIsNot(self.db.select_statement("file", "s3_key"), statement)
+
+    def test_only_select_statements_are_compile_cached(self):
+        compiled_cache = UploadDB._select_engine.get_execution_options()['compiled_cache']
+        compiled_cache.clear()
+
+        self.db.run_select_statement(self.db.select_statement("upload_area", "uuid"), {"uuid": self.area_uuid})
+        self.db.get_pg_records("upload_area", self.area_uuid, "uuid")
+        self.db.update_pg_record("upload_area", {"uuid": self.area_uuid, "status": "UNLOCKED"}, column="uuid")
+
+        self.assertEqual(1, len(compiled_cache))
+        self.assertNotIn('compiled_cache', self.db.engine.get_execution_options())
+
+    def test_select_statement_matches_all_columns(self):
+        query = self.db.select_statement("upload_area", "uuid", "status")
+
+        result = self.db.run_select_statement(query, {"uuid": self.area_uuid, "status": "UNLOCKED"})
+        self.assertEqual(len(result.fetchall()), 1)
+
+        result = self.db.run_select_statement(query, {"uuid": self.area_uuid, "status": "LOCKED"})
+        self.assertEqual(len(result.fetchall()), 0)
+
+
+class TestDatabaseConfigure(UploadTestCaseUsingMockAWS):
+
+    def tearDown(self):
+        UploadDB.configure()
+        super().tearDown()
+
+    def test_configure_replaces_the_engine_with_one_using_the_new_pool_settings(self):
+        old_engine = UploadDB().engine
+
+        UploadDB.configure(pool_size=4, max_overflow=2)
+
+        engine = UploadDB().engine
+        self.assertIsNot(engine, old_engine)
+        self.assertEqual(engine.pool.size(), 4)
+        self.assertEqual(engine.pool._max_overflow, 2)
+        self.assertEqual(UploadDB().run_query("SELECT 1;").fetchone()[0], 1)
+
+    def test_configure_rejects_unknown_settings(self):
+        with self.assertRaisesRegex(ValueError, "pool_sizes"):
+            UploadDB.configure(pool_sizes=4)
+
+
+class TestDatabaseSchema(UploadTestCaseUsingMockAWS):
+
+    def test_table_definitions_match_the_migrated_database(self):
+        self.assertEqual(UploadDB().check_schema(), [])
+
+    def test_check_schema_reports_columns_the_database_does_not_have(self):
+        table = Table('upload_area', MetaData(), Column('id', Integer(), primary_key=True),
+                      Column('colour', String(), nullable=True))
+
+        with patch.dict(UploadDB._record_type_table_map, {'upload_area': table}):
+            differences = UploadDB().check_schema()
+
+        self.assertIn("column upload_area.colour does not exist", differences)
+        self.assertIn("column upload_area.uuid is not defined in database_orm", differences)
+
+    def test_schema_is_checked_on_first_use_when_asked(self):
+        with patch.object(UploadDB, '_schema_checked', False), \
+                patch.object(UploadDB, 'check_schema', return_value=["table file does not exist"]), \
+                EnvironmentSetup({'UPLOAD_DB_CHECK_SCHEMA': '1'}):
+            with self.assertRaisesRegex(RuntimeError, "table file does not exist"):
+                UploadDB()
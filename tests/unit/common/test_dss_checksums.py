@@ -1,4 +1,5 @@
 import uuid
+from unittest.mock import Mock, patch
 
 import boto3
 
@@ -101,6 +102,66 @@ class TestDssChecksums(UploadTestCaseUsingMockAWS):
 
         self.assertEqual(DssChecksums(s3_object=_s3obj).compute(), _test_file.checksums)
 
+    def test__compute_checksums__for_a_single_part_upload__takes_s3_etag_from_the_object_etag(self):
+        _test_file = FixtureFile.factory("foo")
+        _s3obj = self.mock_upload_file_to_s3(self.upload_area_id, _test_file.name, contents=_test_file.contents)
+        _computer = DssChecksums.ChecksumComputer(s3obj=_s3obj)
+
+        self.assertEqual(_test_file.checksums, _computer.compute())
+        self.assertFalse(_computer.s3_etag_was_computed)
+
+    def _computer_for_fake_object(self, e_tag, size):
+        _s3obj = Mock(e_tag=f'"{e_tag}"', content_length=size, server_side_encryption=None,
+                      sse_customer_algorithm=None)
+        return DssChecksums.ChecksumComputer(s3obj=_s3obj)
+
+    @patch('upload.common.dss_checksums.DssChecksums.ChecksumComputer._part_size')
+    def test__s3_etag_from_object_etag__when_parts_match_chunk_size__returns_etag(self, mock_part_size):
+        mock_part_size.side_effect = lambda part_number: {1: 100, 2: 100, 3: 50}[part_number]
+        _computer = self._computer_for_fake_object("abcdef-3", size=250)
+
+        self.assertEqual("abcdef-3", _computer._s3_etag_from_object_etag(multipart_chunksize=100))
+        self.assertEqual([1, 2, 3], sorted(call[0][0] for call in mock_part_size.call_args_list))
+
+    @patch('upload.common.dss_checksums.DssChecksums.ChecksumComputer._part_size')
+    def test__s3_etag_from_object_etag__when_part_size_differs__returns_none(self, mock_part_size):
+        mock_part_size.side_effect = lambda part_number: {1: 120, 2: 100, 3: 30}[part_number]
+        _computer = self._computer_for_fake_object("abcdef-3", size=250)
+
+        self.assertIsNone(_computer._s3_etag_from_object_etag(multipart_chunksize=100))
+
+    @patch('upload.common.dss_checksums.DssChecksums.ChecksumComputer._part_size')
+    def test__s3_etag_from_object_etag__when_a_middle_part_size_differs__returns_none(self, mock_part_size):
+        mock_part_size.side_effect = lambda part_number: {1: 100, 2: 80, 3: 100, 4: 20}[part_number]
+        _computer = self._computer_for_fake_object("abcdef-4", size=300)
+
+        self.assertIsNone(_computer._s3_etag_from_object_etag(multipart_chunksize=100))
+
+    @patch('upload.common.dss_checksums.DssChecksums.ChecksumComputer._part_size')
+    def test__s3_etag_from_object_etag__for_a_kms_encrypted_multipart_upload__returns_none(self, mock_part_size):
+        mock_part_size.side_effect = lambda part_number: {1: 100, 2: 100, 3: 50}[part_number]
+        _computer = self._computer_for_fake_object("abcdef-3", size=250)
+        _computer._s3obj.server_side_encryption = 'aws:kms'
+
+        self.assertIsNone(_computer._s3_etag_from_object_etag(multipart_chunksize=100))
+        mock_part_size.assert_not_called()
+
+    def test__s3_etag_from_object_etag__for_a_multipart_upload_with_a_customer_key__returns_none(self):
+        _computer = self._computer_for_fake_object("abcdef-3", size=250)
+        _computer._s3obj.sse_customer_algorithm = 'AES256'
+
+        self.assertIsNone(_computer._s3_etag_from_object_etag(multipart_chunksize=100))
+
+    def test__s3_etag_from_object_etag__when_part_count_differs__returns_none(self):
+        _computer = self._computer_for_fake_object("abcdef-5", size=250)
+
+        self.assertIsNone(_computer._s3_etag_from_object_etag(multipart_chunksize=100))
+
+    def test__s3_etag_from_object_etag__for_a_single_part_upload_larger_than_a_chunk__returns_none(self):
+        _computer = self._computer_for_fake_object("abcdef", size=250)
+
+        self.assertIsNone(_computer._s3_etag_from_object_etag(multipart_chunksize=100))
+
     def test__save_as_tags_on_s3_object__succeeds(self):
         _filename = "foo"
         _checksums = {'sha1': 'a', 'sha256': 'b', 'crc32c': 'c', 's3_etag': 'd'}
@@ -113,3 +174,62 @@ class TestDssChecksums(UploadTestCaseUsingMockAWS):
         self.assertEqual(
             [{'Key': 'hca-dss-' + _hash_function, 'Value': _value} for _hash_function, _value in _checksums.items()],
             self.s3client.get_object_tagging(Bucket=self.upload_area.bucket_name, Key=_s3obj.key)['TagSet'])
+
+
+class TestDssChecksumsTagCache(UploadTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super().setUp()
+        self.s3client = boto3.client('s3')
+        self.s3obj = self.create_s3_object(object_key="somearea/file", checksum_value={'crc32c': '4'})
+        self.checksums = {'sha1': '1', 'sha256': '2', 's3_etag': '3', 'crc32c': '4'}
+
+    def test_construction__does_not_read_tags(self):
+        with patch.object(DssChecksums.Tagger, '_read_tags') as mock_read_tags:
+            DssChecksums(s3_object=self.s3obj)
+
+        mock_read_tags.assert_not_called()
+
+    def test_tags_are_read_once_per_object_version(self):
+        with patch.object(DssChecksums.Tagger, '_read_tags', return_value={}) as mock_read_tags:
+            DssChecksums(s3_object=self.s3obj).are_present()
+            DssChecksums(s3_object=self.s3obj).are_present()
+
+        self.assertEqual(1, mock_read_tags.call_count)
+
+    def test_save_tags__updates_the_cache(self):
+        self.assertFalse(DssChecksums(s3_object=self.s3obj).are_present())
+
+        DssChecksums(self.s3obj, checksums=self.checksums).save_as_tags_on_s3_object()
+
+        self.assertTrue(DssChecksums(s3_object=self.s3obj).are_present())
+
+    def test_refresh__bypasses_the_cache(self):
+        checksums = DssChecksums(self.s3obj, checksums=self.checksums)
+        checksums.save_as_tags_on_s3_object()
+        self.s3client.put_object_tagging(Bucket=self.s3obj.bucket_name, Key=self.s3obj.key,
+                                         Tagging={'TagSet': [{'Key': 'unrelated', 'Value': 'tag'}]})
+
+        checksums.refresh()
+
+        self.assertFalse(checksums.are_present())
+
+    @patch.object(DssChecksums.Tagger, 'CACHE_MAX_ENTRIES', 2)
+    def test_cache__evicts_the_oldest_entries_beyond_its_size(self):
+        s3objs = [self.create_s3_object(object_key=f"somearea/file{i}") for i in range(3)]
+        with patch.object(DssChecksums.Tagger, '_read_tags', return_value={}):
+            for s3obj in s3objs:
+                DssChecksums(s3_object=s3obj).are_present()
+
+        self.assertEqual(["somearea/file1", "somearea/file2"], [key for _, key, _ in DssChecksums.Tagger._cache])
+
+    @patch('upload.common.dss_checksums.time.time')
+    def test_cache__prunes_expired_entries_when_adding_one(self, mock_time):
+        s3objs = [self.create_s3_object(object_key=f"somearea/file{i}") for i in range(2)]
+        mock_time.return_value = 1000
+        with patch.object(DssChecksums.Tagger, '_read_tags', return_value={}):
+            DssChecksums(s3_object=s3objs[0]).are_present()
+            mock_time.return_value += DssChecksums.Tagger.CACHE_TTL_SECONDS
+            DssChecksums(s3_object=s3objs[1]).are_present()
+
+        self.assertEqual(["somearea/file1"], [key for _, key, _ in DssChecksums.Tagger._cache])
@@ -0,0 +1,59 @@
+import unittest
+
+from upload.common.hash_backends import CrcHasher, HashBackend, HashBackendRegistry, hash_backends
+
+
+class _BrokenHasher:
+
+    def update(self, data):
+        pass
+
+    def hexdigest(self):
+        return "00000000"
+
+
+def _unavailable():
+    raise ImportError("not installed")
+
+
+def _zlib_crc32():
+    import zlib
+    return CrcHasher(zlib.crc32)  # crc32, not crc32c: fails the self-test
+
+
+class TestHashBackendRegistry(unittest.TestCase):
+
+    def test_default_registry__computes_known_answers(self):
+        for algorithm, answer in HashBackendRegistry.KNOWN_ANSWERS.items():
+            hasher = hash_backends.new(algorithm)
+            hasher.update(HashBackendRegistry.KNOWN_INPUT)
+
+            self.assertEqual(answer, hasher.hexdigest())
+
+    def test_select__skips_unavailable_and_incorrect_backends(self):
+        registry = HashBackendRegistry()
+        registry.register(HashBackend('crc32c', 'missing', _unavailable, accelerated=True))
+        registry.register(HashBackend('crc32c', 'broken', _BrokenHasher, accelerated=True))
+        registry.register(HashBackend('crc32c', 'wrong crc', _zlib_crc32, accelerated=True))
+        registry.register(hash_backends.backend('crc32c'))
+
+        registry.select()
+
+        self.assertIs(hash_backends.backend('crc32c'), registry.backend('crc32c'))
+        self.assertIsNotNone(registry.backend('crc32c').bytes_per_second)
+
+    def test_select__when_no_backend_works__raises(self):
+        registry = HashBackendRegistry()
+        registry.register(HashBackend('crc32c', 'missing', _unavailable, accelerated=True))
+
+        with self.assertRaises(RuntimeError):
+            registry.select()
+
+    def test_require_accelerated__when_a_slow_backend_was_selected__raises(self):
+        fast_crc32c = hash_backends.backend('crc32c')
+        registry = HashBackendRegistry()
+        registry.register(HashBackend('crc32c', 'slow', fast_crc32c.factory, accelerated=False))
+        registry.select()
+
+        with self.assertRaises(RuntimeError):
+            registry.require_accelerated()
@@ -0,0 +1,35 @@
+from upload.common.parallel_s3_reader import ParallelS3Reader
+from .. import UploadTestCaseUsingMockAWS
+from ... import FixtureFile
+
+
+class TestParallelS3Reader(UploadTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super().setUp()
+        self.test_file = FixtureFile.factory("foo")
+        self.s3obj = self.create_s3_object(object_key="somearea/foo", content=self.test_file.contents)
+        self.s3obj.load()
+
+    def test_parts__are_yielded_in_order(self):
+        reader = ParallelS3Reader(self.s3obj, part_size=3, concurrency=4)
+
+        parts = list(reader.parts())
+
+        self.assertEqual([3, 3, 3, 3, 3, 1], [len(part) for part in parts])
+        self.assertEqual(self.test_file.contents.encode('utf8'), b"".join(parts))
+
+    def test_parts__when_given_a_start_offset__skips_to_it(self):
+        reader = ParallelS3Reader(self.s3obj, part_size=5, start_offset=10)
+
+        self.assertEqual(b"corpse", b"".join(reader.parts()))
+
+    def test_window__is_bounded_by_max_buffered_bytes(self):
+        reader = ParallelS3Reader(self.s3obj, part_size=4, concurrency=10, max_buffered_bytes=12)
+
+        self.assertEqual(3, reader.window)
+
+    def test_window__is_at_least_one_part(self):
+        reader = ParallelS3Reader(self.s3obj, part_size=100, max_buffered_bytes=10)
+
+        self.assertEqual(1, reader.window)
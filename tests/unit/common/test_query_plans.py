@@ -0,0 +1,119 @@
+import uuid
+
+from sqlalchemy import event
+
+from upload.common.checksum_claim import ChecksumClaim
+from upload.common.checksum_event import ChecksumEvent
+from upload.common.checksum_reuse import ChecksumReuse
+from upload.common.database import UploadDB
+from upload.common.upload_area import UploadArea
+from upload.common.uploaded_file import UploadedFile
+from upload.common.validation_event import ValidationEvent
+from .. import UploadTestCaseUsingMockAWS
+
+
+class QueryPlanRecorder:
+    """
+    Records the statements an engine executes, so that we can EXPLAIN them with sequential scans disabled.
+    The planner then only chooses a sequential scan of a table if no index on it can be used.
+    """
+
+    EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(self.EXPLAINED_STATEMENTS):
+            self.statements.append((statement, parameters))
+
+    def sequentially_scanned_tables(self, statement, parameters):
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SET LOCAL enable_seqscan = off;")
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+            plan = cursor.fetchone()[0][0]['Plan']
+        finally:
+            connection.rollback()
+            connection.close()
+        return [node['Relation Name'] for node in self._nodes(plan) if node['Node Type'] == 'Seq Scan']
+
+    def _nodes(self, plan):
+        yield plan
+        for child in plan.get('Plans', []):
+            yield from self._nodes(child)
+
+
+class TestQueryPlans(UploadTestCaseUsingMockAWS):
+    """
+    Runs the database access paths of upload/common and checks that every query they make can use an index.
+    Tables in the test database are tiny, so the planner would rather scan them: see QueryPlanRecorder.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.upload_area = UploadArea(str(uuid.uuid4()))
+        self.upload_area.update_or_create()
+        s3object = self.create_s3_object(f"{self.upload_area.uuid}/file1")
+        self.uploaded_file = UploadedFile.from_s3_key(self.upload_area, s3object.key)
+        self.checksum_id = str(uuid.uuid4())
+        ChecksumEvent(checksum_id=self.checksum_id, file_id=self.uploaded_file.db_id, job_id="1",
+                      status="CHECKSUMMED").create_record()
+        self.validation_id = str(uuid.uuid4())
+        ValidationEvent(validation_id=self.validation_id, file_ids=[self.uploaded_file.db_id], job_id="2",
+                        status="VALIDATED").create_record()
+
+    def assert_queries_use_indices(self, access_path):
+        with QueryPlanRecorder(UploadDB().engine) as recorder:
+            access_path()
+
+        self.assertTrue(recorder.statements, "nothing was queried")
+        for statement, parameters in recorder.statements:
+            with self.subTest(statement=statement):
+                self.assertEqual([], recorder.sequentially_scanned_tables(statement, parameters))
+
+    def test_upload_area_queries_use_indices(self):
+        def access_path():
+            area = UploadArea(self.upload_area.uuid)
+            area.lock()
+            area.retrieve_file_checksum_statuses_for_upload_area()
+            area.retrieve_file_validation_statuses_for_upload_area()
+
+        self.assert_queries_use_indices(access_path)
+
+    def test_uploaded_file_queries_use_indices(self):
+        def access_path():
+            UploadedFile.from_s3_key(self.upload_area, self.uploaded_file.s3_key)
+            UploadedFile.from_s3_keys(self.upload_area, [self.uploaded_file.s3_key])
+            uploaded_file = UploadedFile.from_db_id(self.uploaded_file.db_id)
+            uploaded_file.retrieve_latest_file_checksum_status_and_values()
+            uploaded_file.retrieve_latest_file_validation_status_and_results()
+            uploaded_file.checksums = {}
+
+        self.assert_queries_use_indices(access_path)
+
+    def test_checksum_and_validation_queries_use_indices(self):
+        def access_path():
+            ChecksumEvent.load(self.checksum_id).update_record()
+            ValidationEvent.load(self.validation_id).update_record()
+            ChecksumReuse(self.uploaded_file).find()
+
+        self.assert_queries_use_indices(access_path)
+
+    def test_checksum_claim_queries_use_indices(self):
+        def access_path():
+            claim = ChecksumClaim(self.uploaded_file.s3_key, self.uploaded_file.s3_etag)
+            claim.acquire()
+            claim.extend(ChecksumClaim.BATCH_TTL_SECONDS)
+            claim.release()
+
+        self.assert_queries_use_indices(access_path)
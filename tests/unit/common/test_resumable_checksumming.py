@@ -0,0 +1,98 @@
+import unittest
+
+import boto3
+from moto import mock_s3
+
+from upload.common.resumable_checksumming import ResumableChecksummingSink, ChecksumCheckpoint
+from ... import FixtureFile
+
+
+class TestResumableChecksummingSink(unittest.TestCase):
+
+    def setUp(self):
+        self.test_file = FixtureFile.factory("foo")
+        self.data = self.test_file.contents.encode('utf8')
+
+    def test_get_checksums__matches_fixture_checksums(self):
+        with ResumableChecksummingSink(part_size=64 * 1024 * 1024) as sink:
+            sink.write(self.data)
+
+            self.assertEqual(self.test_file.checksums, sink.get_checksums())
+
+    def test_a_sink_restored_from_state__carries_on_where_the_original_left_off(self):
+        part_size = 4
+        with ResumableChecksummingSink(part_size) as sink:
+            for offset in range(0, len(self.data), part_size):
+                sink.write(self.data[offset:offset + part_size])
+            expected = sink.get_checksums()
+
+        with ResumableChecksummingSink(part_size) as first_attempt:
+            first_attempt.write(self.data[0:4])
+            first_attempt.write(self.data[4:8])
+            state = first_attempt.state()
+
+        with ResumableChecksummingSink(part_size, state=state, pipelined=True) as second_attempt:
+            self.assertEqual(8, second_attempt.offset)
+            second_attempt.write(self.data[8:12])
+            second_attempt.write(self.data[12:16])
+
+            self.assertEqual(expected, second_attempt.get_checksums())
+
+    def test_write__after_a_short_part__raises(self):
+        with ResumableChecksummingSink(part_size=4) as sink:
+            sink.write(b"ab")
+
+            with self.assertRaises(ValueError):
+                sink.write(b"cdef")
+
+
+class TestChecksumCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.s3_mock = mock_s3()
+        self.s3_mock.start()
+        self.bucket = boto3.resource('s3').Bucket("checkpoint-bucket")
+        self.bucket.create()
+        self.s3_url = "s3://bogobucket/somearea/foo"
+
+    def tearDown(self):
+        self.s3_mock.stop()
+
+    def _sink_with_progress(self):
+        sink = ResumableChecksummingSink(part_size=4)
+        sink.write(b"exqu")
+        return sink
+
+    def test_load__when_there_is_no_checkpoint__returns_none(self):
+        checkpoint = ChecksumCheckpoint(self.bucket, self.s3_url, "etag1")
+
+        self.assertIsNone(checkpoint.load(part_size=4))
+
+    def test_load__returns_saved_state(self):
+        sink = self._sink_with_progress()
+        ChecksumCheckpoint(self.bucket, self.s3_url, "etag1").save(sink)
+
+        state = ChecksumCheckpoint(self.bucket, self.s3_url, "etag1").load(part_size=4)
+
+        self.assertEqual(sink.state(), state)
+
+    def test_save__stores_the_checkpoint_in_the_bucket(self):
+        checkpoint = ChecksumCheckpoint(self.bucket, self.s3_url, "etag1")
+
+        checkpoint.save(self._sink_with_progress())
+
+        self.assertEqual([checkpoint.key], [obj.key for obj in self.bucket.objects.all()])
+        self.assertTrue(checkpoint.key.startswith(ChecksumCheckpoint.KEY_PREFIX))
+
+    def test_load__when_the_etag_has_changed__discards_the_checkpoint(self):
+        ChecksumCheckpoint(self.bucket, self.s3_url, "etag1").save(self._sink_with_progress())
+
+        checkpoint = ChecksumCheckpoint(self.bucket, self.s3_url, "etag2")
+
+        self.assertIsNone(checkpoint.load(part_size=4))
+        self.assertEqual([], list(self.bucket.objects.all()))
+
+    def test_load__when_the_part_size_has_changed__discards_the_checkpoint(self):
+        ChecksumCheckpoint(self.bucket, self.s3_url, "etag1").save(self._sink_with_progress())
+
+        self.assertIsNone(ChecksumCheckpoint(self.bucket, self.s3_url, "etag1").load(part_size=8))
@@ -42,6 +42,16 @@ class TestUploadAreaCreationExistenceAndDeletion(UploadAreaTest):
 
         self.assertEqual(db_area.id, area.db_id)
 
+    def test_update_or_create__when_area_exists__keeps_its_status(self):
+        db_area = self.create_upload_area(status='LOCKED', db_session=self.db)
+
+        area = UploadArea(uuid=db_area.uuid)
+        area.update_or_create()
+
+        self.assertEqual("LOCKED", area.status)
+        self.db.refresh(db_area)
+        self.assertEqual("LOCKED", db_area.status)
+
     def test_is_extant__for_nonexistent_area__returns_false(self):
         area_uuid = "an-area-that-will-not-exist"
 
@@ -168,6 +178,18 @@ class TestUploadAreaFileManipulation(UploadAreaTest):
         self.assertEqual(db_area.id, db_file.upload_area_id)
         self.assertEqual("some.json", db_file.name)
 
+    @patch('upload.common.upload_area.DssChecksums.compute')
+    def test_store_file__does_not_read_the_object_back_to_checksum_it(self, mock_compute):
+        db_area = self.create_upload_area()
+        area = UploadArea(uuid=db_area.uuid)
+
+        file = area.store_file("some.json", content="exquisite corpse",
+                               content_type='application/json; dcp-type="metadata/sample"')
+
+        mock_compute.assert_not_called()
+        self.assertEqual("29f5572dfbe07e1db9422a4c84e3f9e455aab9ac596f0bf3340be17841f26f70", file.checksums['sha256'])
+        self.assertEqual({'crc32c': "fe9ada52"}, self.upload_bucket.Object(file.s3_key).metadata)
+
     def test__store_redundant_file__only_uploaded_once(self):
         db_area = self.create_upload_area()
         area = UploadArea(uuid=db_area.uuid)
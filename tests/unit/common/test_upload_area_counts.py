@@ -0,0 +1,177 @@
+import threading
+import uuid
+
+from upload.common.checksum_event import ChecksumEvent
+from upload.common.database import UploadDB
+from upload.common.upload_area import UploadArea
+from upload.common.upload_area_counts import UploadAreaCounts
+from upload.common.uploaded_file import UploadedFile
+from upload.common.validation_event import ValidationEvent
+from .. import UploadTestCaseUsingMockAWS
+
+
+class TestUploadAreaCounts(UploadTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super().setUp()
+        self.upload_area = UploadArea(str(uuid.uuid4()))
+        self.upload_area.update_or_create()
+        self.counts = UploadAreaCounts(self.upload_area.db_id)
+
+    def _uploaded_file(self, filename, content="file content"):
+        s3object = self.create_s3_object(f"{self.upload_area.uuid}/{filename}", content=content)
+        return UploadedFile.from_s3_key(self.upload_area, s3object.key)
+
+    def _checksum(self, uploaded_file, status):
+        checksum_event = ChecksumEvent(checksum_id=str(uuid.uuid4()), file_id=uploaded_file.db_id,
+                                       job_id=str(uuid.uuid4()), status=status)
+        checksum_event.create_record()
+        return checksum_event
+
+    def _validation(self, uploaded_files, status):
+        validation_event = ValidationEvent(validation_id=str(uuid.uuid4()), job_id=str(uuid.uuid4()), status=status,
+                                           file_ids=[uploaded_file.db_id for uploaded_file in uploaded_files])
+        validation_event.create_record()
+        return validation_event
+
+    def _write_concurrently(self, first_query, first_params, second_query, second_params):
+        """
+        Run two queries in transactions at once: the second starts before the first commits, and commits after.
+        """
+        engine = UploadDB().engine
+        with engine.connect() as first, engine.connect() as second:
+            first_transaction = first.begin()
+            first.execute(first_query, first_params)
+            second_transaction = second.begin()
+            thread = threading.Thread(target=second.execute, args=(second_query, second_params))
+            thread.start()
+            thread.join(0.5)  # long enough for the second to finish, if the first does not hold it up
+            first_transaction.commit()
+            thread.join()
+            second_transaction.commit()
+
+    def assert_counts_are_correct(self):
+        counts = self.counts.read()
+        before, after = self.counts.repair()
+        self.assertEqual(after, before)
+        self.assertEqual(after, counts)
+
+    def test_read__for_an_empty_area__returns_no_counts(self):
+        self.assertEqual({'file_names': {}, 'checksum_files': {}, 'validation_files': {}}, self.counts.read())
+
+    def test_read__counts_distinct_file_names(self):
+        self._uploaded_file("file1")
+        self._uploaded_file("file1", content="a later version")
+        self._uploaded_file("file2")
+
+        self.assertEqual({'': 2}, self.counts.read()['file_names'])
+        self.assertEqual(2, self.upload_area.retrieve_file_count_for_upload_area())
+        self.assert_counts_are_correct()
+
+    def test_read__follows_checksum_status_changes(self):
+        uploaded_file = self._uploaded_file("file1")
+        checksum_event = self._checksum(uploaded_file, "SCHEDULED")
+        self.assertEqual({'SCHEDULED': 1}, self.counts.read()['checksum_files'])
+
+        checksum_event.status = "CHECKSUMMED"
+        checksum_event.update_record()
+
+        self.assertEqual({'CHECKSUMMED': 1}, self.counts.read()['checksum_files'])
+        self.assert_counts_are_correct()
+
+    def test_read__counts_a_file_once_per_checksum_status(self):
+        uploaded_file = self._uploaded_file("file1")
+        self._checksum(uploaded_file, "CHECKSUMMED")
+        self._checksum(uploaded_file, "CHECKSUMMED")
+        self._checksum(uploaded_file, "FAILED")
+
+        self.assertEqual({'CHECKSUMMED': 1, 'FAILED': 1}, self.counts.read()['checksum_files'])
+        self.assert_counts_are_correct()
+
+    def test_read__follows_validation_status_changes(self):
+        uploaded_files = [self._uploaded_file("file1"), self._uploaded_file("file2")]
+        validation_event = self._validation(uploaded_files, "SCHEDULED")
+        self.assertEqual({'SCHEDULED': 2}, self.counts.read()['validation_files'])
+
+        validation_event.status = "VALIDATED"
+        validation_event.update_record()
+
+        self.assertEqual({'VALIDATED': 2}, self.counts.read()['validation_files'])
+        self.assert_counts_are_correct()
+
+    def test_read__after_a_file_is_deleted__no_longer_counts_it(self):
+        uploaded_file = self._uploaded_file("file1")
+        self._uploaded_file("file2")
+        self._checksum(uploaded_file, "CHECKSUMMED")
+        self._validation([uploaded_file], "VALIDATED")
+
+        UploadDB().run_query_with_params("DELETE FROM file WHERE id = %s;", (uploaded_file.db_id,))
+
+        self.assertEqual({'file_names': {'': 1}, 'checksum_files': {}, 'validation_files': {}}, self.counts.read())
+        self.assert_counts_are_correct()
+
+    def test_read__counts_a_file_name_created_concurrently_once(self):
+        insert = "INSERT INTO file (s3_key, s3_etag, upload_area_id, name, size) VALUES (%s, 'etag', %s, 'file1', 1);"
+
+        self._write_concurrently(insert, (f"{self.upload_area.uuid}/file1-first", self.upload_area.db_id),
+                                 insert, (f"{self.upload_area.uuid}/file1-second", self.upload_area.db_id))
+
+        self.assertEqual({'': 1}, self.counts.read()['file_names'])
+        self.assert_counts_are_correct()
+
+    def test_read__counts_a_file_checksummed_concurrently_once(self):
+        uploaded_file = self._uploaded_file("file1")
+
+        insert = "INSERT INTO checksum (id, file_id, status) VALUES (%s, %s, 'CHECKSUMMING');"
+
+        self._write_concurrently(insert, (str(uuid.uuid4()), uploaded_file.db_id),
+                                 insert, (str(uuid.uuid4()), uploaded_file.db_id))
+
+        self.assertEqual({'CHECKSUMMING': 1}, self.counts.read()['checksum_files'])
+        self.assert_counts_are_correct()
+
+    def test_read__counts_a_file_added_to_a_validation_while_its_status_changes(self):
+        uploaded_files = [self._uploaded_file("file1"), self._uploaded_file("file2")]
+        validation_event = self._validation(uploaded_files[:1], "SCHEDULED")
+
+        self._write_concurrently("UPDATE validation SET status = 'VALIDATING' WHERE id = %s;",
+                                 (validation_event.id,),
+                                 "INSERT INTO validation_files (validation_id, file_id) VALUES (%s, %s);",
+                                 (validation_event.id, uploaded_files[1].db_id))
+
+        self.assertEqual({'VALIDATING': 2}, self.counts.read()['validation_files'])
+        self.assert_counts_are_correct()
+
+    def test_repair__corrects_counts_that_have_drifted(self):
+        uploaded_file = self._uploaded_file("file1")
+        self._checksum(uploaded_file, "CHECKSUMMED")
+        UploadDB().run_query_with_params("UPDATE upload_area_count SET total = 7 WHERE upload_area_id = %s;",
+                                         (self.upload_area.db_id,))
+
+        before, after = self.counts.repair()
+
+        self.assertEqual({'': 7}, before['file_names'])
+        self.assertEqual({'file_names': {'': 1}, 'checksum_files': {'CHECKSUMMED': 1}, 'validation_files': {}},
+                         after)
+        self.assertEqual(after, self.counts.read())
+
+    def test_retrieve_file_checksum_statuses_for_upload_area__reads_the_counts(self):
+        uploaded_file = self._uploaded_file("file1")
+        self._uploaded_file("file2")
+        self._checksum(uploaded_file, "CHECKSUMMING")
+
+        self.assertEqual({
+            'TOTAL_NUM_FILES': 2,
+            'CHECKSUMMING': 1,
+            'CHECKSUMMED': 0,
+            'CHECKSUMMING_UNSCHEDULED': 1
+        }, self.upload_area.retrieve_file_checksum_statuses_for_upload_area())
+
+    def test_retrieve_file_validation_statuses_for_upload_area__reads_the_counts(self):
+        self._validation([self._uploaded_file("file1")], "VALIDATING")
+
+        self.assertEqual({
+            'VALIDATING': 1,
+            'VALIDATED': 0,
+            'SCHEDULED': 0
+        }, self.upload_area.retrieve_file_validation_statuses_for_upload_area())
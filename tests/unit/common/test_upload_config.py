@@ -0,0 +1,126 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from upload.common.upload_config import CachedConfig
+
+
+class ExampleConfig(CachedConfig):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(component_name='upload', secret_name='example', deployment='test', **kwargs)
+
+
+class TestCachedConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.config_file = tempfile.NamedTemporaryFile('w', suffix='.json')
+        self._write_config({'foo': 'bar'})
+        ExampleConfig.reset()
+        ExampleConfig.fetch_count = 0
+        ExampleConfig.failed_fetch_count = 0
+
+    def tearDown(self):
+        self.config_file.close()
+
+    def _write_config(self, config):
+        self._write_config_text(json.dumps(config))
+
+    def _write_config_text(self, text):
+        self.config_file.seek(0)
+        self.config_file.truncate()
+        self.config_file.write(text)
+        self.config_file.flush()
+
+    def _config(self):
+        return ExampleConfig(source=self.config_file.name)
+
+    def test_the_config_is_fetched_once_and_shared_between_instances(self):
+        for _ in range(3):
+            self.assertEqual('bar', self._config().foo)
+
+        self.assertEqual(1, ExampleConfig.fetch_count)
+
+    def test_the_config_is_fetched_again_when_it_expires(self):
+        with patch('upload.common.upload_config.time.time', return_value=1000):
+            self.assertEqual('bar', self._config().foo)
+        self._write_config({'foo': 'baz'})
+
+        with patch('upload.common.upload_config.time.time', return_value=1000 + ExampleConfig.TTL_SECONDS - 1):
+            self.assertEqual('bar', self._config().foo)
+        with patch('upload.common.upload_config.time.time', return_value=1000 + ExampleConfig.TTL_SECONDS):
+            self.assertEqual('baz', self._config().foo)
+
+        self.assertEqual(2, ExampleConfig.fetch_count)
+
+    def test_when_fetching_an_expired_config_fails__the_expired_copy_is_used_until_a_retry_succeeds(self):
+        expired_at = 1000 + ExampleConfig.TTL_SECONDS
+        with patch('upload.common.upload_config.time.time', return_value=1000):
+            self.assertEqual('bar', self._config().foo)
+        self._write_config_text("{not json")
+
+        with patch('upload.common.upload_config.time.time', return_value=expired_at):
+            self.assertEqual('bar', self._config().foo)
+        self._write_config({'foo': 'baz'})
+        with patch('upload.common.upload_config.time.time', return_value=expired_at + ExampleConfig.RETRY_SECONDS - 1):
+            self.assertEqual('bar', self._config().foo)
+        with patch('upload.common.upload_config.time.time', return_value=expired_at + ExampleConfig.RETRY_SECONDS):
+            self.assertEqual('baz', self._config().foo)
+
+        self.assertEqual(3, ExampleConfig.fetch_count)
+        self.assertEqual(1, ExampleConfig.failed_fetch_count)
+
+    def test_after_a_failed_fetch__reads_do_not_fetch_again_until_the_retry_is_due(self):
+        with patch('upload.common.upload_config.time.time', return_value=1000):
+            self.assertEqual('bar', self._config().foo)
+        self._write_config_text("{not json")
+
+        with patch('upload.common.upload_config.time.time', return_value=1000 + ExampleConfig.TTL_SECONDS):
+            for _ in range(5):
+                self.assertEqual('bar', self._config().foo)
+
+        self.assertEqual(2, ExampleConfig.fetch_count)
+        self.assertEqual(1, ExampleConfig.failed_fetch_count)
+
+    def test_threads_reading_a_config_that_is_not_loaded_fetch_it_once(self):
+        load_from_file = ExampleConfig.load_from_file
+
+        def slow_load_from_file(config, path):
+            time.sleep(0.1)
+            load_from_file(config, path)
+
+        with patch.object(ExampleConfig, 'load_from_file', slow_load_from_file):
+            threads = [threading.Thread(target=lambda: self._config().foo) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(1, ExampleConfig.fetch_count)
+
+    def test_when_the_first_fetch_fails__the_error_is_raised(self):
+        self._write_config_text("{not json")
+
+        with self.assertRaises(ValueError):
+            self._config().foo
+        self.assertEqual(1, ExampleConfig.failed_fetch_count)
+
+    def test_refresh__fetches_the_config_now(self):
+        self.assertEqual('bar', self._config().foo)
+        self._write_config({'foo': 'baz'})
+
+        self._config().refresh()
+
+        self.assertEqual('baz', self._config().foo)
+        self.assertEqual(2, ExampleConfig.fetch_count)
+
+    def test_a_config_that_was_set_does_not_expire(self):
+        self._config().set({'foo': 'qux'})
+
+        with patch('upload.common.upload_config.time.time', return_value=2 ** 40):
+            self.assertEqual('qux', self._config().foo)
+
+        self.assertEqual(0, ExampleConfig.fetch_count)
@@ -1,9 +1,11 @@
 import os
 import random
 import uuid
+from unittest.mock import patch
 
 from sqlalchemy.orm.exc import NoResultFound
 
+from upload.common.database import UploadDB
 from upload.common.database_orm import DBSessionMaker, DbFile
 from upload.common.upload_area import UploadArea
 from upload.common.uploaded_file import UploadedFile
@@ -121,6 +123,32 @@ class TestUploadedFile(UploadTestCaseUsingMockAWS):
         self.assertEqual(s3object, uf.s3object)
         self.assertEqual(file_record.id, uf.db_id)
 
+    def test_from_s3_keys__loads_existing_records_and_creates_missing_ones_together(self):
+        existing_s3object = self.create_s3_object(f"{self.upload_area_id}/file-{random.randint(0, 999999999)}")
+        existing_record = self.create_file_record(existing_s3object)
+        new_s3objects = [self.create_s3_object(f"{self.upload_area_id}/file-{random.randint(0, 999999999)}")
+                         for _ in range(2)]
+        s3_keys = [new_s3objects[0].key, existing_s3object.key, new_s3objects[1].key]
+
+        with patch.object(UploadDB, 'create_pg_records', wraps=UploadDB().create_pg_records) as create_pg_records:
+            files = UploadedFile.from_s3_keys(self.upload_area, s3_keys)
+
+        self.assertEqual(1, create_pg_records.call_count)
+        self.assertEqual(s3_keys, [uf.s3_key for uf in files])
+        self.assertEqual(existing_record.id, files[1].db_id)
+        for uf in (files[0], files[2]):
+            record = self.db.query(DbFile).filter(DbFile.s3_key == uf.s3_key).one()
+            self.assertEqual(record.id, uf.db_id)
+            self.assertEqual(os.path.basename(uf.s3_key), record.name)
+
+    def test_from_s3_keys__creates_one_record_for_a_repeated_key(self):
+        s3object = self.create_s3_object(f"{self.upload_area_id}/file-{random.randint(0, 999999999)}")
+
+        files = UploadedFile.from_s3_keys(self.upload_area, [s3object.key, s3object.key])
+
+        self.assertEqual(1, self.db.query(DbFile).filter(DbFile.s3_key == s3object.key).count())
+        self.assertEqual(files[0].db_id, files[1].db_id)
+
     def test_from_db_id__initializes_correctly_and_figures_out_which_upload_area_to_use(self):
         filename = f"file-{random.randint(0, 999999999)}"
         s3object = self.create_s3_object(f"{self.upload_area_id}/{filename}")
@@ -178,3 +206,19 @@ class TestUploadedFile(UploadTestCaseUsingMockAWS):
             'checksums': test_file.checksums,
             'last_modified': s3object.last_modified.isoformat()
         }, uf.info())
+
+    def test_from_s3_keys__uses_a_record_created_concurrently_after_the_lookup(self):
+        s3object = self.create_s3_object(f"{self.upload_area_id}/file-{random.randint(0, 999999999)}")
+        record = self.create_file_record(s3object)
+        db_records_for_keys = UploadedFile._db_records_for_keys
+
+        def miss_the_record_at_first(db, keys):
+            lookup.side_effect = db_records_for_keys
+            return {}
+
+        with patch.object(UploadedFile, '_db_records_for_keys', side_effect=miss_the_record_at_first) as lookup:
+            files = UploadedFile.from_s3_keys(self.upload_area, [s3object.key])
+
+        self.assertEqual(2, lookup.call_count)
+        self.assertEqual(record.id, files[0].db_id)
+        self.assertEqual(1, self.db.query(DbFile).filter(DbFile.s3_key == s3object.key).count())
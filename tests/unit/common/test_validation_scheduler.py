@@ -5,8 +5,8 @@ from unittest.mock import patch
 from upload.common.database import UploadDB
 from upload.common.upload_area import UploadArea
 from upload.common.uploaded_file import UploadedFile
-from upload.common.validation_scheduler import ValidationScheduler, MAX_FILE_SIZE_IN_BYTES
-from .. import UploadTestCaseUsingMockAWS
+from upload.common.validation_scheduler import ValidationScheduler, QueuedValidation, MAX_FILE_SIZE_IN_BYTES
+from .. import UploadTestCaseUsingMockAWS, EnvironmentSetup
 
 
 class TestValidationScheduler(UploadTestCaseUsingMockAWS):
@@ -97,3 +97,64 @@ class TestValidationScheduler(UploadTestCaseUsingMockAWS):
         self.assertEqual(message_body["orig_validation_id"], "123456")
         self.assertEqual(message_body["upload_area_uuid"], uploaded_file.upload_area.uuid)
         self.assertEqual(record["status"], "SCHEDULING_QUEUED")
+
+    def _queued_validation(self, filename, docker_image):
+        uploaded_file = UploadedFile.create(upload_area=self.upload_area,
+                                            name=filename,
+                                            content_type="application/octet-stream; dcp-type=data",
+                                            data="file_content")
+        scheduler = ValidationScheduler(self.upload_area_id, [uploaded_file])
+        validation_id = str(uuid.uuid4())
+        scheduler._create_validation_event(docker_image, validation_id, None)
+        return QueuedValidation(scheduler=scheduler, validation_id=validation_id, docker_image=docker_image,
+                                env={"variable": filename}, orig_val_id=None)
+
+    @patch('upload.common.validation_scheduler.ValidationScheduler._find_or_create_job_definition_for_image')
+    @patch('upload.common.validation_scheduler.ValidationScheduler._enqueue_batch_job')
+    def test_schedule_batch_validations__submits_an_array_job_per_validator_image(self, mock_enqueue, mock_find):
+        mock_enqueue.return_value = "array-job-id"
+        validations = [self._queued_validation(f"file{i}", "fastq_validator") for i in range(3)]
+        validations.append(self._queued_validation("file3", "other_validator"))
+
+        with EnvironmentSetup({'API_HOST': 'bogohost'}):
+            unscheduled = ValidationScheduler.schedule_batch_validations(validations)
+
+        self.assertEqual([], unscheduled)
+        self.assertEqual(2, mock_enqueue.call_count)
+        array_call, single_call = mock_enqueue.call_args_list
+        self.assertEqual(3, array_call[1]['array_size'])
+        self.assertEqual(['/validator'], array_call[0][1])
+        manifest = json.loads(array_call[0][2]['VALIDATION_MANIFEST'])
+        self.assertEqual([validation.scheduler.file_s3_locations for validation in validations[:3]],
+                         [entry['s3_urls'] for entry in manifest])
+        self.assertEqual(validations[1].validation_id, manifest[1]['environment']['VALIDATION_ID'])
+        self.assertEqual("file1", manifest[1]['environment']['variable'])
+        self.assertNotIn('array_size', single_call[1])
+        record = UploadDB().get_pg_record("validation", validations[2].validation_id, column='id')
+        self.assertEqual("SCHEDULED", record["status"])
+        self.assertEqual("array-job-id:2", record["job_id"])
+
+    @patch('upload.common.validation_scheduler.MAX_MANIFEST_BYTES', 1)
+    @patch('upload.common.validation_scheduler.ValidationScheduler._find_or_create_job_definition_for_image')
+    @patch('upload.common.validation_scheduler.ValidationScheduler._enqueue_batch_job')
+    def test_schedule_batch_validations__splits_manifests_that_are_too_large(self, mock_enqueue, mock_find):
+        mock_enqueue.return_value = "job-id"
+        validations = [self._queued_validation(f"file{i}", "fastq_validator") for i in range(2)]
+
+        with EnvironmentSetup({'API_HOST': 'bogohost'}):
+            ValidationScheduler.schedule_batch_validations(validations)
+
+        self.assertEqual(2, mock_enqueue.call_count)
+        self.assertNotIn('array_size', mock_enqueue.call_args[1])
+
+    @patch('upload.common.validation_scheduler.ValidationScheduler._find_or_create_job_definition_for_image')
+    @patch('upload.common.validation_scheduler.ValidationScheduler._enqueue_batch_job')
+    def test_schedule_batch_validations__returns_validations_that_could_not_be_scheduled(self, mock_enqueue,
+                                                                                         mock_find):
+        mock_enqueue.side_effect = RuntimeError("Batch is down")
+        validations = [self._queued_validation(f"file{i}", "fastq_validator") for i in range(2)]
+
+        with EnvironmentSetup({'API_HOST': 'bogohost'}):
+            unscheduled = ValidationScheduler.schedule_batch_validations(validations)
+
+        self.assertEqual(validations, unscheduled)
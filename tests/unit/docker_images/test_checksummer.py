@@ -1,3 +1,4 @@
+import json
 import unittest
 import uuid
 from unittest.mock import patch
@@ -50,6 +51,46 @@ class TestChecksummerDockerImage(UploadTestCaseUsingMockAWS):
         self.assertEqual({'status': 'CHECKSUMMING'}, mock_update_checksum_event.call_args_list[0][1])
         self.assertEqual({'status': 'CHECKSUMMED'}, mock_update_checksum_event.call_args_list[1][1])
 
+    @patch('upload.docker_images.checksummer.checksummer.DssChecksums.save_as_tags_on_s3_object')
+    @patch('upload.docker_images.checksummer.checksummer.DssChecksums.compute')
+    @patch('upload.docker_images.checksummer.checksummer.Checksummer._update_checksum_event')
+    def test_checksummer__checkpoints_to_the_checkpoint_bucket(self, mock_update_checksum_event, mock_compute,
+                                                               mock_save_tags):
+        checkpoint_bucket = boto3.resource('s3').Bucket("csum-checkpoints")
+        checkpoint_bucket.create()
+        test_file = FixtureFile.factory("foo")
+        file_s3_key = f"somearea/{test_file.name}"
+        self.create_s3_object(file_s3_key, content=test_file.contents)
+        s3_url = f"s3://{self.upload_bucket.name}/{file_s3_key}"
+
+        from upload.docker_images.checksummer.checksummer import Checksummer
+        with EnvironmentSetup({'CSUM_CHECKPOINT_BUCKET': checkpoint_bucket.name}):
+            Checksummer([s3_url, test_file.e_tag])
+
+        checkpoint = mock_compute.call_args[1]['checkpoint']
+        self.assertEqual(checkpoint_bucket.name, checkpoint.bucket.name)
+        self.assertEqual(test_file.e_tag, checkpoint.s3_etag)
+
+    @patch('upload.docker_images.checksummer.checksummer.DssChecksums.compute')
+    @patch('upload.docker_images.checksummer.checksummer.Checksummer._update_checksum_event')
+    def test_checksummer__when_the_last_attempt_fails__reports_failure(self, mock_update_checksum_event,
+                                                                       mock_compute):
+        mock_compute.side_effect = RuntimeError("S3 is down")
+        test_file = FixtureFile.factory("foo")
+        file_s3_key = f"somearea/{test_file.name}"
+        self.create_s3_object(file_s3_key, content=test_file.contents)
+        s3_url = f"s3://{self.upload_bucket.name}/{file_s3_key}"
+
+        from upload.docker_images.checksummer.checksummer import Checksummer
+        for attempt, expected_statuses in (('1', ['CHECKSUMMING']), ('3', ['CHECKSUMMING', 'FAILED'])):
+            mock_update_checksum_event.reset_mock()
+            with EnvironmentSetup({'AWS_BATCH_JOB_ATTEMPT': attempt}):
+                with self.assertRaises(RuntimeError):
+                    Checksummer([s3_url, test_file.e_tag])
+
+            self.assertEqual(expected_statuses,
+                             [call[1]['status'] for call in mock_update_checksum_event.call_args_list])
+
     @patch('upload.docker_images.checksummer.checksummer.Checksummer._update_checksum_event')
     def test_checksummer__when_file_etag_is_wrong__aborts(self, mock_update_checksum_event):
         test_file = FixtureFile.factory("foo")
@@ -63,6 +104,47 @@ class TestChecksummerDockerImage(UploadTestCaseUsingMockAWS):
 
         mock_update_checksum_event.assert_called_once_with(status='ABORTED')
 
+    @patch('upload.docker_images.checksummer.checksummer.Checksummer._update_checksum_event')
+    def test_checksummer__given_a_manifest__checksums_every_file(self, mock_update_checksum_event):
+        test_file = FixtureFile.factory("foo")
+        manifest = []
+        for area in ("area1", "area2"):
+            file_s3_key = f"{area}/{test_file.name}"
+            self.create_s3_object(file_s3_key, content=test_file.contents,
+                                  checksum_value={'crc32c': test_file.crc32c})
+            manifest.append({'s3_url': f"s3://{self.upload_bucket.name}/{file_s3_key}",
+                             's3_etag': test_file.e_tag,
+                             'checksum_id': str(uuid.uuid4())})
+
+        from upload.docker_images.checksummer.checksummer import Checksummer
+        Checksummer(['--manifest', json.dumps(manifest)])
+
+        for area in ("area1", "area2"):
+            tagging = boto3.client('s3').get_object_tagging(Bucket=self.upload_bucket.name,
+                                                            Key=f"{area}/{test_file.name}")
+            self.assertEqual(test_file.s3_tagset, sorted(tagging['TagSet'], key=lambda x: x['Key']))
+        self.assertEqual(4, mock_update_checksum_event.call_count)
+
+    @patch('upload.docker_images.checksummer.checksummer.update_event')
+    def test_checksummer__given_checksums_to_audit__reports_them_with_ours(self, mock_update_event):
+        test_file = FixtureFile.factory("foo")
+        file_s3_key = f"somearea/{test_file.name}"
+        self.create_s3_object(file_s3_key, content=test_file.contents)
+        audit_checksums = dict(test_file.checksums, sha1="would-have-been-reused")
+        manifest = [{'s3_url': f"s3://{self.upload_bucket.name}/{file_s3_key}",
+                     's3_etag': test_file.e_tag,
+                     'checksum_id': str(uuid.uuid4()),
+                     'audit_checksums': audit_checksums}]
+
+        from upload.docker_images.checksummer.checksummer import Checksummer
+        Checksummer(['--manifest', json.dumps(manifest)])
+
+        checksumming_payload = mock_update_event.call_args_list[0][0][1]
+        checksummed_payload = mock_update_event.call_args_list[1][0][1]
+        self.assertNotIn('audit_checksums', checksumming_payload)
+        self.assertEqual(test_file.checksums, checksummed_payload['checksums'])
+        self.assertEqual(audit_checksums, checksummed_payload['audit_checksums'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -52,6 +52,21 @@ class TestValidatorHarness(UploadTestCaseUsingMockAWS):
             with open(expected_file_path, 'r') as fp:
                 self.assertEqual(self.file_contents, fp.read())
 
+    def test_init__in_an_array_job__finds_its_files_and_validation_id_in_the_manifest(self):
+        manifest = [
+            {'s3_urls': ["s3://bucket/area/other_file"], 'environment': {'VALIDATION_ID': "456", 'VARIABLE': "a"}},
+            {'s3_urls': [self.s3_url], 'environment': {'VALIDATION_ID': "789", 'VARIABLE': "b"}}
+        ]
+        array_environment = {'AWS_BATCH_JOB_ARRAY_INDEX': '1', 'VALIDATION_MANIFEST': json.dumps(manifest),
+                             'VARIABLE': None}
+
+        with EnvironmentSetup(array_environment):
+            harness = ValidatorHarness(path_to_validator=None, s3_urls_of_files_to_be_validated=[])
+
+            self.assertEqual([self.s3_url], harness.s3_file_urls)
+            self.assertEqual("789", harness.validation_id)
+            self.assertEqual("b", os.environ['VARIABLE'])
+
     def _mock_stage_file_succeeding_on_the_5th_try(self, s3_bucket_name, s3_object_key, staged_file_path):
         if self.mock_download_file_call_count < 4:
             pass
@@ -1,7 +1,9 @@
 import uuid
 from unittest.mock import patch
 
-from upload.common.database_orm import DBSessionMaker, DbChecksum, DbFile
+from upload.common.checksum_claim import ChecksumClaim
+from upload.common.database_orm import DBSessionMaker, DbChecksum, DbChecksumClaim, DbFile
+from upload.common.dss_checksums import DssChecksums
 from upload.common.upload_area import UploadArea
 from upload.common.uploaded_file import UploadedFile
 from upload.common.checksum_event import ChecksumEvent
@@ -88,6 +90,30 @@ class TestChecksumApi(UploadTestCaseUsingMockAWS):
 
         mock_format_and_send_notification.assert_not_called()
 
+    def test_post_checksum__with_a_failed_or_aborted_status__releases_the_claim(self):
+        db_area = self.create_upload_area()
+        upload_area = UploadArea(db_area.uuid)
+        for status in ("FAILED", "ABORTED"):
+            checksum_id = str(uuid.uuid4())
+            s3obj = self.mock_upload_file_to_s3(upload_area.uuid, f"{status}.json")
+            uploaded_file = UploadedFile(upload_area, s3object=s3obj)
+            ChecksumClaim(uploaded_file.s3_key, uploaded_file.s3_etag, '0059BB193641C4EAB0').acquire()
+            ChecksumEvent(file_id=uploaded_file.db_id, checksum_id=checksum_id, job_id='12345',
+                          status="CHECKSUMMING").create_record()
+
+            response = self.client.post(f"/v1/area/{upload_area.uuid}/update_checksum/{checksum_id}",
+                                        json={
+                                            "status": status,
+                                            "job_id": '12345',
+                                            "payload": uploaded_file.info()
+                                        })
+
+            self.assertEqual(204, response.status_code)
+            db_checksum = self.db.query(DbChecksum).filter(DbChecksum.id == checksum_id).one()
+            self.assertEqual(status, db_checksum.status)
+            claims = self.db.query(DbChecksumClaim).filter(DbChecksumClaim.s3_key == uploaded_file.s3_key)
+            self.assertEqual(0, claims.count())
+
     @patch('upload.lambdas.api_server.v1.area.IngestNotifier.format_and_send_notification')
     def test_post_checksum__with_a_checksummed_payload__updates_db_records_and_notifies_ingest(self, mock_fasn):
         checksum_id = str(uuid.uuid4())
@@ -150,6 +176,68 @@ class TestChecksumApi(UploadTestCaseUsingMockAWS):
 
         mock_fasn.assert_not_called()
 
+    @patch('upload.lambdas.api_server.v1.area.IngestNotifier.format_and_send_notification')
+    def test_post_checksum__for_an_obj_reuploaded_while_claimed__retags_it_and_notifies_ingest(self, mock_fasn):
+        checksum_id = str(uuid.uuid4())
+        db_area = self.create_upload_area()
+        upload_area = UploadArea(db_area.uuid)
+        s3obj = self.mock_upload_file_to_s3(upload_area.uuid, 'foo.json', checksums={})
+        uploaded_file = UploadedFile(upload_area, s3object=s3obj)
+        ChecksumClaim(uploaded_file.s3_key, uploaded_file.s3_etag, '0059BB193641C4EAB0').acquire()
+        ChecksumClaim(uploaded_file.s3_key, uploaded_file.s3_etag, '0059BB193641C4EAB5').acquire()  # coalesced
+        checksum_event = ChecksumEvent(file_id=uploaded_file.db_id,
+                                       checksum_id=checksum_id,
+                                       job_id='12345',
+                                       status="SCHEDULED")
+        checksum_event.create_record()
+        checksums = {'s3_etag': '1', 'sha1': '2', 'sha256': '3', 'crc32c': '4'}
+        response = self.client.post(f"/v1/area/{upload_area.uuid}/update_checksum/{checksum_id}",
+                                    json={
+                                        "status": "CHECKSUMMED",
+                                        "job_id": checksum_event.job_id,
+                                        "payload": {
+                                            "upload_area_id": upload_area.db_id,
+                                            "name": uploaded_file.name,
+                                            "checksums": checksums
+                                        }
+                                    })
+
+        self.assertEqual(204, response.status_code)
+        tags = DssChecksums(s3_object=s3obj)
+        tags.refresh()
+        self.assertEqual(checksums, dict(tags))
+        claims = self.db.query(DbChecksumClaim).filter(DbChecksumClaim.s3_key == uploaded_file.s3_key)
+        self.assertEqual(0, claims.count())
+        mock_fasn.assert_called()
+
+    @patch('upload.lambdas.api_server.v1.area.ChecksumReuse.compare')
+    @patch('upload.lambdas.api_server.v1.area.IngestNotifier.format_and_send_notification')
+    def test_post_checksum__with_checksums_to_audit__compares_them_with_the_computed_ones(self, mock_fasn,
+                                                                                          mock_compare):
+        checksum_id = str(uuid.uuid4())
+        db_area = self.create_upload_area()
+        upload_area = UploadArea(db_area.uuid)
+        s3obj = self.mock_upload_file_to_s3(upload_area.uuid, 'foo.json')
+        uploaded_file = UploadedFile(upload_area, s3object=s3obj)
+        ChecksumEvent(file_id=uploaded_file.db_id, checksum_id=checksum_id, job_id='12345',
+                      status="SCHEDULED").create_record()
+        checksums = {'s3_etag': '1', 'sha1': '2', 'sha256': '3', 'crc32c': '4'}
+        audit_checksums = {'s3_etag': '1', 'sha1': '2', 'sha256': '3', 'crc32c': 'different'}
+        response = self.client.post(f"/v1/area/{upload_area.uuid}/update_checksum/{checksum_id}",
+                                    json={
+                                        "status": "CHECKSUMMED",
+                                        "job_id": '12345',
+                                        "payload": {
+                                            "upload_area_id": upload_area.db_id,
+                                            "name": uploaded_file.name,
+                                            "checksums": checksums,
+                                            "audit_checksums": audit_checksums
+                                        }
+                                    })
+
+        self.assertEqual(204, response.status_code)
+        mock_compare.assert_called_once_with(uploaded_file.s3_key, checksums, audit_checksums)
+
     @patch('upload.lambdas.api_server.v1.area.IngestNotifier.format_and_send_notification')
     def test_checksum_statuses_for_upload_area(self, mock_format_and_send_notification):
         db_area = self.create_upload_area()
@@ -1,12 +1,15 @@
+import json
 import os
 import sys
 import uuid
 from unittest.mock import Mock, patch
 
 import boto3
+from botocore.exceptions import ClientError
 from sqlalchemy.orm.exc import NoResultFound
 
-from upload.common.database_orm import DBSessionMaker, DbFile, DbChecksum
+from upload.common.checksum_claim import ChecksumClaim
+from upload.common.database_orm import DBSessionMaker, DbFile, DbChecksum, DbChecksumClaim
 from upload.common.upload_area import UploadArea
 from .. import UploadTestCaseUsingMockAWS, EnvironmentSetup
 from ... import FixtureFile
@@ -43,6 +46,8 @@ class ChecksumDaemonTest(UploadTestCaseUsingMockAWS):
         self.upload_area.update_or_create()
         # daemon
         context = Mock()
+        context.get_remaining_time_in_millis.return_value = 15 * 60 * 1000
+        ChecksumDaemon._recent_bytes_per_second.clear()
         self.daemon = ChecksumDaemon(context)
         # File
         self.small_file = FixtureFile.factory('foo')
@@ -139,6 +144,279 @@ class TestChecksumDaemonSeeingS3ObjectsForTheFirstTime(ChecksumDaemonTest):
         self.assertEqual("SCHEDULED", checksum_record.status)
         self.assertEqual("fake-batch-job-id", checksum_record.job_id)
 
+    @patch('upload.common.upload_area.UploadedFile.size', 100 * 1024 * 1024 * 1024)
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_a_checksumming_batch_job_is_told_where_to_checkpoint(self, mock_enqueue_batch_job):
+        mock_enqueue_batch_job.return_value = "fake-batch-job-id"
+        with EnvironmentSetup({'CSUM_CHECKPOINT_BUCKET': 'csum-checkpoints'}):
+            daemon = ChecksumDaemon(self.daemon.context)
+
+        daemon.consume_events(self.events)
+
+        environment = mock_enqueue_batch_job.call_args[1]['environment']
+        self.assertEqual('csum-checkpoints', environment['CSUM_CHECKPOINT_BUCKET'])
+
+    @patch('upload.common.upload_area.UploadedFile.size', 100 * 1024 * 1024 * 1024)
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_for_several_large_s3_objects__one_manifest_batch_job_is_scheduled(self, mock_enqueue_batch_job):
+        job_id = str(uuid.uuid4())
+        mock_enqueue_batch_job.return_value = job_id
+        other_key = f"{self.area_uuid}/other_{self.small_file.name}"
+        self.upload_bucket.Object(other_key).put(Body=self.small_file.contents,
+                                                 ContentType=self.small_file.content_type)
+        other_event = dict(self.events['Records'][0], s3=dict(self.events['Records'][0]['s3'],
+                                                              object={'key': other_key}))
+        self.events['Records'].append(other_event)
+
+        self.daemon.consume_events(self.events)
+
+        mock_enqueue_batch_job.assert_called_once()
+        command = mock_enqueue_batch_job.call_args[1]['command']
+        self.assertEqual('--manifest', command[2])
+        self.assertEqual(2, len(json.loads(command[3])))
+        self.assertEqual(2, self.db.query(DbChecksum).filter(DbChecksum.job_id == job_id).count())
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_when_the_lambda_is_nearly_out_of_time__a_checksumming_batch_job_is_scheduled(self,
+                                                                                          mock_enqueue_batch_job):
+        mock_enqueue_batch_job.return_value = "fake-batch-job-id"
+        self.daemon.context.get_remaining_time_in_millis.return_value = ChecksumDaemon.RESERVED_MILLIS
+
+        self.daemon.consume_events(self.events)
+
+        mock_enqueue_batch_job.assert_called()
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.DssChecksums.compute')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_when_inline_checksumming_falls_behind__it_is_handed_off_to_batch(self, mock_enqueue_batch_job,
+                                                                              mock_compute):
+        mock_enqueue_batch_job.return_value = "fake-batch-job-id"
+        mock_compute.side_effect = ChecksumDaemon.InlineChecksummingFellBehind("too slow")
+
+        self.daemon.consume_events(self.events)
+
+        mock_enqueue_batch_job.assert_called()
+        file_record = self.db.query(DbFile).filter(DbFile.s3_key == self.file_key,
+                                                   DbFile.s3_etag == self.small_file.e_tag).one()
+        statuses = sorted(record.status for record in
+                          self.db.query(DbChecksum).filter(DbChecksum.file_id == file_record.id).all())
+        self.assertEqual(["ABORTED", "SCHEDULED"], statuses)
+
+
+class TestChecksumDaemonCoalescingDuplicateEvents(ChecksumDaemonTest):
+    """
+    Scenario: Ingest uploads the same file several times at once
+    """
+
+    def _claim(self, sequencer):
+        return ChecksumClaim(self.file_key, self.small_file.e_tag, sequencer)
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.DssChecksums.compute')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+    def test_when_the_contents_are_already_being_checksummed__the_event_is_ignored(self, mock_fasn, mock_compute):
+        self._claim('0059BB193641C4EAA0').acquire()
+
+        self.daemon.consume_events(self.events)
+
+        mock_compute.assert_not_called()
+        mock_fasn.assert_not_called()
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.DssChecksums.compute')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+    def test_when_the_object_has_been_overwritten_with_other_contents__the_event_is_ignored(self, mock_fasn,
+                                                                                            mock_compute):
+        self.events['Records'][0]['s3']['object']['eTag'] = "0123456789abcdef0123456789abcdef"
+
+        self.daemon.consume_events(self.events)
+
+        mock_compute.assert_not_called()
+        mock_fasn.assert_not_called()
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+    def test_when_checksumming_is_done__the_claim_is_released(self, mock_fasn):
+        self.daemon.consume_events(self.events)
+
+        self.assertEqual(0, self.db.query(DbChecksumClaim).filter(DbChecksumClaim.s3_key == self.file_key).count())
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumClaim.release')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.DssChecksums.save_as_tags_on_s3_object')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+    def test_when_the_object_is_reuploaded_while_being_checksummed__tags_are_reapplied(self, mock_fasn,
+                                                                                       mock_save_tags,
+                                                                                       mock_release):
+        mock_release.return_value = True
+
+        self.daemon.consume_events(self.events)
+
+        self.assertEqual(2, mock_save_tags.call_count)
+        mock_fasn.assert_called_once()
+
+    @patch('upload.common.upload_area.UploadedFile.size', 100 * 1024 * 1024 * 1024)
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_while_a_batch_job_is_checksumming__the_claim_is_held(self, mock_enqueue_batch_job):
+        mock_enqueue_batch_job.return_value = "fake-batch-job-id"
+
+        self.daemon.consume_events(self.events)
+
+        self.assertFalse(self._claim('0059BB193641C4EAC0').acquire())
+
+    @patch('upload.common.upload_area.UploadedFile.size', 100 * 1024 * 1024 * 1024)
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_when_a_later_event_fails__files_already_claimed_are_still_submitted(self, mock_enqueue_batch_job):
+        mock_enqueue_batch_job.return_value = "fake-batch-job-id"
+        record = self.events['Records'][0]
+        bad_record = dict(record, s3=dict(record['s3'], object={'key': f"{self.area_uuid}/no_such_file"}))
+
+        with self.assertRaises(Exception):
+            self.daemon.consume_events({'Records': [record, bad_record]})
+
+        mock_enqueue_batch_job.assert_called_once()
+        self.assertIn(self.file_key, mock_enqueue_batch_job.call_args[1]['command'][2])
+
+
+@patch('upload.lambdas.checksum_daemon.checksum_daemon.sqs')
+@patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+class TestChecksumDaemonDeferringIngestNotification(ChecksumDaemonTest):
+    """
+    Scenario: a file is uploaded without dcp-type in its content type, which is added shortly afterwards
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.object.put(Body=self.small_file.contents, ContentType="application/octet-stream")
+
+    def _deferred_events(self, mock_sqs):
+        mock_sqs.send_message.assert_called_once()
+        self.assertEqual(ChecksumDaemon.CHECK_CONTENT_TYPE_INTERVAL,
+                         mock_sqs.send_message.call_args[1]['DelaySeconds'])
+        events = json.loads(mock_sqs.send_message.call_args[1]['MessageBody'])
+        mock_sqs.reset_mock()
+        return events
+
+    def test_when_the_content_type_is_incomplete__the_notification_is_deferred_not_slept_on(self, mock_fasn,
+                                                                                            mock_sqs):
+        self.daemon.consume_events(self.events)
+
+        mock_fasn.assert_not_called()
+        deferred_events = self._deferred_events(mock_sqs)
+        self.assertEqual(ChecksumDaemon.CHECK_CONTENT_TYPE_TIMES - 1,
+                         deferred_events['Records'][0]['contentTypeChecksLeft'])
+
+    def test_when_the_content_type_is_fixed__the_deferred_notification_is_sent(self, mock_fasn, mock_sqs):
+        self.daemon.consume_events(self.events)
+        deferred_events = self._deferred_events(mock_sqs)
+        self.object.put(Body=self.small_file.contents, ContentType=self.small_file.content_type)
+
+        self.daemon.consume_events(deferred_events)
+
+        mock_sqs.send_message.assert_not_called()
+        mock_fasn.assert_called_once()
+        self.assertEqual(self.small_file.content_type, mock_fasn.call_args[0][0]['content_type'])
+
+    def test_while_the_content_type_is_incomplete__the_notification_is_deferred_again(self, mock_fasn, mock_sqs):
+        self.daemon.consume_events(self.events)
+        deferred_events = self._deferred_events(mock_sqs)
+
+        self.daemon.consume_events(deferred_events)
+
+        mock_fasn.assert_not_called()
+        self.assertEqual(ChecksumDaemon.CHECK_CONTENT_TYPE_TIMES - 2,
+                         self._deferred_events(mock_sqs)['Records'][0]['contentTypeChecksLeft'])
+
+    def test_when_no_checks_are_left__ingest_is_notified_anyway(self, mock_fasn, mock_sqs):
+        self.daemon.consume_events(self.events)
+        deferred_events = self._deferred_events(mock_sqs)
+        deferred_events['Records'][0]['contentTypeChecksLeft'] = 0
+
+        self.daemon.consume_events(deferred_events)
+
+        mock_sqs.send_message.assert_not_called()
+        mock_fasn.assert_called_once()
+
+    def test_when_the_notification_cannot_be_deferred__the_event_fails(self, mock_fasn, mock_sqs):
+        mock_sqs.send_message.side_effect = ClientError({'Error': {'Code': 'AccessDenied'}}, 'SendMessage')
+
+        with self.assertRaises(ClientError):
+            self.daemon.consume_events(self.events)
+
+        mock_fasn.assert_not_called()
+
+
+class TestChecksumDaemonConsumingSqsMessages(ChecksumDaemonTest):
+
+    def _message(self, message_id, file_key):
+        record = dict(self.events['Records'][0], s3=dict(self.events['Records'][0]['s3'], object={'key': file_key}))
+        return {'messageId': message_id, 'body': json.dumps({'Records': [record]})}
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+    def test_every_message_is_processed_and_failures_are_reported(self, mock_fasn):
+        messages = [self._message("good", self.file_key),
+                    self._message("bad", f"{self.area_uuid}/no_such_file")]
+
+        failed_message_ids = self.daemon.consume_sqs_messages(messages)
+
+        self.assertEqual(["bad"], failed_message_ids)
+        file_record = self.db.query(DbFile).filter(DbFile.s3_key == self.file_key).one()
+        self.assertEqual(self.small_file.checksums, file_record.checksums)
+
+    @patch('upload.common.upload_area.UploadedFile.size', 100 * 1024 * 1024 * 1024)
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_when_a_batch_job_cannot_be_submitted__its_messages_are_reported(self, mock_enqueue_batch_job):
+        mock_enqueue_batch_job.side_effect = RuntimeError("Batch is down")
+
+        failed_message_ids = self.daemon.consume_sqs_messages([self._message("large", self.file_key)])
+
+        self.assertEqual(["large"], failed_message_ids)
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.DssChecksums.compute')
+    def test_concurrent_messages_share_the_read_concurrency_and_buffer(self, mock_compute, mock_fasn):
+        other_key = f"{self.area_uuid}/other_{self.small_file.name}"
+        self.upload_bucket.Object(other_key).put(Body=self.small_file.contents,
+                                                 ContentType=self.small_file.content_type)
+        messages = [self._message("first", self.file_key), self._message("second", other_key)]
+
+        self.daemon.consume_sqs_messages(messages)
+
+        self.assertEqual(2, mock_compute.call_count)
+        for call in mock_compute.call_args_list:
+            self.assertEqual(ChecksumDaemon.READ_CONCURRENCY // 2, call[1]['concurrency'])
+            self.assertEqual(ChecksumDaemon.MAX_BUFFERED_BYTES // 2, call[1]['max_buffered_bytes'])
+
+
+class TestChecksumDaemonRouting(ChecksumDaemonTest):
+
+    def setUp(self):
+        super().setUp()
+        self.daemon.uploaded_file = Mock(size=1024 * 1024 * 1024)
+
+    def test_with_no_measurements__the_assumed_throughput_is_used(self):
+        self.assertEqual(ChecksumDaemon.ASSUMED_BYTES_PER_SECOND, self.daemon._estimated_bytes_per_second())
+
+    def test_small_inline_runs_are_not_measured(self):
+        ChecksumDaemon._record_throughput(size=1024, seconds=1)
+
+        self.assertEqual(ChecksumDaemon.ASSUMED_BYTES_PER_SECOND, self.daemon._estimated_bytes_per_second())
+
+    def test_routing_uses_measured_throughput(self):
+        self.daemon.context.get_remaining_time_in_millis.return_value = ChecksumDaemon.RESERVED_MILLIS + 60 * 1000
+
+        ChecksumDaemon._record_throughput(size=1024 * 1024 * 1024, seconds=10)
+        self.assertTrue(self.daemon._file_is_small_enough_to_checksum_inline())
+
+        for _ in range(2):
+            ChecksumDaemon._record_throughput(size=1024 * 1024 * 1024, seconds=100)
+        self.assertFalse(self.daemon._file_is_small_enough_to_checksum_inline())
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.time.time')
+    def test_watchdog__raises_when_projected_time_exceeds_the_budget(self, mock_time):
+        mock_time.return_value = 1000 + ChecksumDaemon.MIN_SECONDS_BEFORE_HANDOFF
+        watchdog = self.daemon._inline_progress_watchdog(start_time=1000, available_seconds=60)
+
+        watchdog(self.daemon.uploaded_file.size // 2)  # projected 20s
+        with self.assertRaises(ChecksumDaemon.InlineChecksummingFellBehind):
+            watchdog(self.daemon.uploaded_file.size // 10)  # projected 100s
+
 
 class TestChecksumDaemonSeeingS3ObjectsForWhichAFileRecordAlreadyExists(ChecksumDaemonTest):
     """
@@ -190,3 +468,51 @@ class TestChecksumDaemonSeeingS3ObjectsForWhichAFileRecordAlreadyExists(Checksum
             'url': f"s3://{self.upload_config.bucket_name}/{self.area_uuid}/{self.small_file.name}",
             'checksums': self.small_file.checksums
         })
+
+
+class TestChecksumDaemonSeeingS3ObjectsIdenticalToFilesInOtherAreas(ChecksumDaemonTest):
+    """
+    Scenario: a file is uploaded whose contents were already checksummed in another upload area
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.daemon.reuse_audit_fraction = 0
+
+        other_area = UploadArea(str(uuid.uuid4()))
+        other_area.update_or_create()
+        other_key = f"{other_area.uuid}/{self.small_file.name}"
+        self.upload_bucket.Object(other_key).put(Body=self.small_file.contents,
+                                                 ContentType=self.small_file.content_type)
+        self.db.add(self._make_dbfile(other_area, self.small_file, checksums=self.small_file.checksums))
+        self.db.commit()
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.DssChecksums.compute')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.IngestNotifier.format_and_send_notification')
+    def test_checksums_are_reused_not_recomputed(self, mock_fasn, mock_compute):
+        self.daemon.consume_events(self.events)
+
+        mock_compute.assert_not_called()
+        file_record = self.db.query(DbFile).filter(DbFile.s3_key == self.file_key,
+                                                   DbFile.s3_etag == self.small_file.e_tag).one()
+        self.assertEqual(self.small_file.checksums, file_record.checksums)
+        tagging = boto3.client('s3').get_object_tagging(Bucket=self.upload_config.bucket_name, Key=self.file_key)
+        self.assertEqual(self.small_file.s3_tagset, sorted(tagging['TagSet'], key=lambda x: x['Key']))
+        checksum_record = self.db.query(DbChecksum).filter(DbChecksum.file_id == file_record.id).one()
+        self.assertEqual("CHECKSUMMED", checksum_record.status)
+        mock_fasn.assert_called_once()
+
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._file_is_small_enough_to_checksum_inline')
+    @patch('upload.lambdas.checksum_daemon.checksum_daemon.ChecksumDaemon._enqueue_batch_job')
+    def test_when_a_file_being_audited_goes_to_batch__the_job_gets_the_checksums_to_audit(self,
+                                                                                          mock_enqueue_batch_job,
+                                                                                          mock_small_enough):
+        mock_enqueue_batch_job.return_value = "fake-batch-job-id"
+        mock_small_enough.return_value = False
+        self.daemon.reuse_audit_fraction = 1
+
+        self.daemon.consume_events(self.events)
+
+        command = mock_enqueue_batch_job.call_args[1]['command']
+        self.assertEqual('--audit-checksums', command[4])
+        self.assertEqual(self.small_file.checksums, json.loads(command[5]))
@@ -1,15 +1,53 @@
 import hashlib
 import json
 import os
+import re
+import threading
+import time
 
 import boto3
+from botocore.exceptions import ClientError
 
+from .logging import get_logger
 from .retry import retry_on_aws_too_many_requests
 
+logger = get_logger(__name__)
+
 batch = boto3.client('batch')
 
 
 class JobDefinition:
+    """
+    An AWS Batch job definition for a Docker image.
+
+    Resolving one costs a describe_job_definitions call, which is throttled under bursts of submissions,
+    so find_or_create_cached() remembers them per process for CACHE_TTL_SECONDS.  submit_job() resolves
+    the definition afresh and tries again if Batch rejects a cached one, e.g. because it was deregistered.
+
+        job_defn = JobDefinition.find_or_create_cached(docker_image, deployment, job_role_arn)
+        job = job_defn.submit_job(jobName=name, jobQueue=queue_arn, containerOverrides=overrides)
+    """
+
+    CACHE_TTL_SECONDS = 15 * 60
+    ATTEMPTS = 3  # Batch runs a failing job this many times in all
+    _cache = {}  # (docker_image, deployment) -> (JobDefinition, time cached)
+    _cache_lock = threading.Lock()
+
+    @classmethod
+    def find_or_create_cached(cls, docker_image, deployment, job_role_arn):
+        key = (docker_image, deployment)
+        with cls._cache_lock:  # so a burst of submissions from one process resolves the definition only once
+            cached = cls._cache.get(key)
+            if cached and time.time() - cached[1] < cls.CACHE_TTL_SECONDS:
+                return cached[0]
+            job_defn = cls(docker_image=docker_image, deployment=deployment).find_or_create(job_role_arn)
+            cls._cache[key] = (job_defn, time.time())
+            return job_defn
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._cache_lock:
+            cls._cache.clear()
 
     @classmethod
     def clear_all(cls):
@@ -17,6 +55,7 @@ class JobDefinition:
         for jobdef in batch.describe_job_definitions(status='ACTIVE')['jobDefinitions']:
             cls(metadata=jobdef).delete()
             deleted_count += 1
+        cls.clear_cache()
         return deleted_count
 
     def __init__(self, docker_image=None, deployment=None, arn=None, metadata=None):
@@ -32,6 +71,7 @@ class JobDefinition:
         print(f"Job definition {self.name} for {self.docker_image}:")
 
     def find_or_create(self, job_role_arn):
+        self.job_role_arn = job_role_arn
         if self.load():
             print(f"\tfound {self.arn}")
         else:
@@ -74,13 +114,37 @@ class JobDefinition:
                 ]
             },
             retryStrategy={
-                'attempts': 3
+                'attempts': self.ATTEMPTS
             }
         )
         self.arn = self.metadata['jobDefinitionArn']
         print(f"\tcreated {self.arn}")
         print(json.dumps(self.metadata, indent=4))
 
+    def forget(self):
+        """ Remove this job definition from the cache, so the next lookup describes it afresh. """
+        with self._cache_lock:
+            cached = self._cache.get((self.docker_image, self.deployment))
+            if cached and cached[0].arn == self.arn:
+                del self._cache[(self.docker_image, self.deployment)]
+
+    def submit_job(self, **submit_job_args):
+        try:
+            return batch.submit_job(jobDefinition=self.arn, **submit_job_args)
+        except ClientError as e:
+            if not self._is_rejection_of_job_definition(e):
+                raise
+            logger.warning(f"Batch rejected job definition {self.arn}, looking it up again: {e}")
+            self.forget()
+            current = self.find_or_create_cached(self.docker_image, self.deployment, self.job_role_arn)
+            self.arn, self.metadata = current.arn, current.metadata
+            return batch.submit_job(jobDefinition=self.arn, **submit_job_args)
+
+    @staticmethod
+    def _is_rejection_of_job_definition(error):
+        return error.response['Error']['Code'] == 'ClientException' and \
+            re.search(r"job ?definition", error.response['Error'].get('Message', ""), re.IGNORECASE) is not None
+
     def delete(self):
         print(f"Deleting job definition {self.name} ({self.docker_image})")
         batch.deregister_job_definition(jobDefinition=self.arn)
@@ -0,0 +1,98 @@
+import uuid
+
+from .database import UploadDB
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class ChecksumClaim:
+    """
+    Coalesces the S3 events for one version of an object, so its contents are only checksummed once.
+
+    Ingest often uploads the same file several times at once, and every upload produces an event.
+    Before checksumming, the checksum daemon claims the object's (s3_key, s3_etag) in the checksum_claim
+    table.  Only one claim can be live at a time: events for the same content that arrive while it is
+    live are dropped, but their S3 sequencer is recorded.  When the holder releases the claim it learns
+    whether the object was re-uploaded (a later sequencer) meanwhile, in which case the re-upload will
+    have erased the holder's checksum tags and they must be applied again.
+
+    Claims expire, so a holder that dies cannot block checksumming forever.
+
+        claim = ChecksumClaim(s3_key, s3_etag, sequencer)
+        if claim.acquire():
+            checksums = compute()
+            if claim.release():
+                checksums.save_as_tags_on_s3_object()
+    """
+
+    INLINE_TTL_SECONDS = 15 * 60  # a Lambda cannot run for longer
+    BATCH_TTL_SECONDS = 12 * 60 * 60
+    SEQUENCER_WIDTH = 32
+
+    def __init__(self, s3_key, s3_etag, sequencer=None):
+        self.s3_key = s3_key
+        self.s3_etag = s3_etag
+        self.sequencer = self.normalize_sequencer(sequencer)
+        self.claim_id = str(uuid.uuid4())
+        self._db = UploadDB()
+
+    @classmethod
+    def normalize_sequencer(cls, sequencer):
+        """
+        S3 sequencers are hex strings of varying length.  Left padded with zeros to the same length
+        they can be compared lexicographically, which is how Postgres's GREATEST() compares them.
+        """
+        return (sequencer or "").upper().rjust(cls.SEQUENCER_WIDTH, "0")
+
+    def acquire(self, ttl_seconds=INLINE_TTL_SECONDS):
+        """ Returns True if we now hold the claim, False if another live claim exists. """
+        query_result = self._db.run_query_with_params(
+            "INSERT INTO checksum_claim AS claim "
+            "(s3_key, s3_etag, claim_id, claimed_sequencer, latest_sequencer, expires_at, created_at, updated_at) "
+            "VALUES (%s, %s, %s, %s, %s, now() + %s * interval '1 second', now(), now()) "
+            "ON CONFLICT (s3_key, s3_etag) DO UPDATE SET "
+            "claim_id = CASE WHEN claim.expires_at < now() THEN EXCLUDED.claim_id ELSE claim.claim_id END, "
+            "claimed_sequencer = CASE WHEN claim.expires_at < now() "
+            "THEN EXCLUDED.claimed_sequencer ELSE claim.claimed_sequencer END, "
+            "expires_at = CASE WHEN claim.expires_at < now() THEN EXCLUDED.expires_at ELSE claim.expires_at END, "
+            "latest_sequencer = GREATEST(claim.latest_sequencer, EXCLUDED.latest_sequencer), "
+            "updated_at = now() "
+            "RETURNING claim_id;",
+            (self.s3_key, self.s3_etag, self.claim_id, self.sequencer, self.sequencer, ttl_seconds))
+        holder = query_result.fetchone()[0]
+        if holder != self.claim_id:
+            logger.info(f"{self.s3_key} (etag {self.s3_etag}) is already being checksummed by claim {holder}")
+            return False
+        return True
+
+    def extend(self, ttl_seconds):
+        """ Keep holding the claim for ttl_seconds from now, e.g. while a Batch job checksums the file. """
+        self._db.run_query_with_params(
+            "UPDATE checksum_claim SET expires_at = now() + %s * interval '1 second', updated_at = now() "
+            "WHERE s3_key = %s AND s3_etag = %s AND claim_id = %s;",
+            (ttl_seconds, self.s3_key, self.s3_etag, self.claim_id))
+
+    def release(self):
+        """ Returns True if the object was re-uploaded with the same contents while we held the claim. """
+        query_result = self._db.run_query_with_params(
+            "DELETE FROM checksum_claim WHERE s3_key = %s AND s3_etag = %s AND claim_id = %s "
+            "RETURNING claimed_sequencer, latest_sequencer;",
+            (self.s3_key, self.s3_etag, self.claim_id))
+        return self._reuploaded_while_claimed(query_result.fetchone())
+
+    @classmethod
+    def release_by_key(cls, s3_key, s3_etag):
+        """ Release whichever claim is held on this content, for when the holder's claim_id is not known. """
+        query_result = UploadDB().run_query_with_params(
+            "DELETE FROM checksum_claim WHERE s3_key = %s AND s3_etag = %s "
+            "RETURNING claimed_sequencer, latest_sequencer;",
+            (s3_key, s3_etag))
+        return cls._reuploaded_while_claimed(query_result.fetchone())
+
+    @staticmethod
+    def _reuploaded_while_claimed(row):
+        if row is None:
+            return False
+        claimed_sequencer, latest_sequencer = row
+        return latest_sequencer > claimed_sequencer
@@ -0,0 +1,111 @@
+import random
+
+import boto3
+from botocore.exceptions import ClientError
+
+from .database import UploadDB
+from .dss_checksums import DssChecksums
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+KB = 1024
+MB = KB * KB
+
+
+class ChecksumReuse:
+    """
+    Finds checksums that were already computed for identical content elsewhere in the upload bucket.
+
+    Wranglers often copy the same file into many upload areas.  Every copy has the same S3 ETag and size,
+    so before reading a file we look for another file record with that (s3_etag, size) and a complete set
+    of checksums.  An ETag match is not trusted blindly:
+
+    - a random SAMPLE_SIZE byte range of the candidate's S3 object must match the same range of ours;
+    - a fraction (audit_fraction) of would-be hits are deliberately not reused: the caller computes
+      checksums as normal and passes them to audit(), which reports any disagreement.  If they are
+      computed in Batch, audited_checksums go with the job and compare() is called when it reports back.
+
+        reuse = ChecksumReuse(uploaded_file)
+        checksums = reuse.find()
+        if not checksums:
+            checksums = compute()
+            reuse.audit(checksums)
+    """
+
+    SAMPLE_SIZE = 1 * MB
+    MAX_CANDIDATES = 5
+    DEFAULT_AUDIT_FRACTION = 0.01
+
+    def __init__(self, uploaded_file, audit_fraction=DEFAULT_AUDIT_FRACTION):
+        self.uploaded_file = uploaded_file
+        self.audit_fraction = audit_fraction
+        self.audited_checksums = None
+        self._db = UploadDB()
+        self._s3client = boto3.client('s3')
+
+    def find(self):
+        """ Return checksums of a verified identical file, or None. """
+        for candidate in self._candidates():
+            if not self._sample_matches(candidate['s3_key']):
+                continue
+            if random.random() < self.audit_fraction:
+                logger.info(f"Auditing checksum reuse: recomputing checksums for {self.uploaded_file.s3_key} "
+                            f"instead of reusing those of {candidate['s3_key']}")
+                self.audited_checksums = candidate['checksums']
+                return None
+            logger.info(f"Reusing checksums of {candidate['s3_key']} for {self.uploaded_file.s3_key}")
+            return candidate['checksums']
+        return None
+
+    def audit(self, computed_checksums):
+        """ Compare freshly computed checksums with those we would have reused. """
+        return self.compare(self.uploaded_file.s3_key, computed_checksums, self.audited_checksums)
+
+    @staticmethod
+    def compare(s3_key, computed_checksums, audited_checksums):
+        """ audit(), for checksums computed by a Batch job that reported back on behalf of another process. """
+        if audited_checksums is None:
+            return True
+        if dict(computed_checksums) == audited_checksums:
+            logger.info(f"Checksum reuse audit passed for {s3_key}")
+            return True
+        logger.error(f"Checksum reuse audit FAILED for {s3_key}: computed {dict(computed_checksums)}"
+                     f" but would have reused {audited_checksums}")
+        return False
+
+    def _candidates(self):
+        # Files without checksums have JSON null (not SQL NULL) in their checksums column.
+        query_result = self._db.run_query_with_params(
+            "SELECT s3_key, checksums FROM file "
+            "WHERE s3_etag = %s AND size = %s AND id != %s AND jsonb_typeof(checksums) = 'object' "
+            "ORDER BY id DESC LIMIT %s;",
+            (self.uploaded_file.s3_etag, self.uploaded_file.size, self.uploaded_file.db_id, self.MAX_CANDIDATES))
+        for s3_key, checksums in query_result.fetchall():
+            if sorted(checksums.keys()) == sorted(DssChecksums.CHECKSUM_NAMES):
+                yield {'s3_key': s3_key, 'checksums': checksums}
+
+    def _sample_matches(self, candidate_s3_key):
+        size = self.uploaded_file.size
+        if size == 0:
+            return True
+        sample_size = min(self.SAMPLE_SIZE, size)
+        offset = random.randint(0, size - sample_size)
+        try:
+            ours = self._read_range(self.uploaded_file.s3_key, offset, sample_size)
+            theirs = self._read_range(candidate_s3_key, offset, sample_size)
+        except ClientError as e:
+            logger.debug(f"Cannot sample {candidate_s3_key}: {e}")
+            return False
+        if ours != theirs:
+            logger.warning(f"{candidate_s3_key} has the same etag and size as {self.uploaded_file.s3_key} "
+                           f"but different contents at offset {offset}")
+            return False
+        return True
+
+    def _read_range(self, s3_key, offset, length):
+        response = self._s3client.get_object(Bucket=self.uploaded_file.upload_area.bucket_name,
+                                             Key=s3_key,
+                                             Range=f"bytes={offset}-{offset + length - 1}",
+                                             IfMatch=f'"{self.uploaded_file.s3_etag}"')
+        return response['Body'].read()
@@ -0,0 +1,132 @@
+import queue
+import threading
+
+from dcplib.checksumming_io import S3Etag
+
+from .hash_backends import hash_backends
+
+DEFAULT_HASH_FUNCTIONS = ('crc32c', 'sha1', 'sha256', 's3_etag')
+
+
+class ChecksummingSink:
+    """
+    Computes checksums of everything written to it, like dcplib's ChecksummingSink, but uses the
+    crc32c/sha1/sha256 implementations chosen by the hash backend registry (see hash_backends).
+
+        with ChecksummingSink(multipart_chunksize) as sink:
+            sink.write(data)
+            checksums = sink.get_checksums()
+    """
+
+    def __init__(self, write_chunk_size, hash_functions=DEFAULT_HASH_FUNCTIONS):
+        self._hashers = {}
+        for hash_function in hash_functions:
+            if hash_function == 's3_etag':
+                self._hashers[hash_function] = S3Etag(write_chunk_size)
+            else:
+                self._hashers[hash_function] = hash_backends.new(hash_function)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def write(self, data):
+        for hasher in self._hashers.values():
+            hasher.update(data)
+        return len(data)
+
+    def get_checksums(self):
+        return {name: hasher.hexdigest() for name, hasher in self._hashers.items()}
+
+
+class PipelinedChecksummingSink:
+    """
+    A drop-in replacement for ChecksummingSink that computes each checksum on its own thread.
+
+    ChecksummingSink.write() runs every hash function over each chunk one after another.  Here each
+    chunk is wrapped in a memoryview and handed to one worker per hash function, so the hashes run
+    concurrently (hashlib and the crc32c extension release the GIL on large buffers) and nothing
+    is copied.  Each worker has a short queue, so a slow hash function applies back-pressure to
+    writers rather than letting chunks pile up in memory.
+
+    Chunks must not be modified after they have been written.
+
+        with PipelinedChecksummingSink(multipart_chunksize) as sink:
+            for part in parts:
+                sink.write(part)
+            checksums = sink.get_checksums()
+    """
+
+    QUEUE_DEPTH = 4
+
+    def __init__(self, write_chunk_size, hash_functions=DEFAULT_HASH_FUNCTIONS):
+        self._workers = [self._HashWorker(write_chunk_size, hash_function, self.QUEUE_DEPTH)
+                         for hash_function in hash_functions]
+        self._checksums = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data):
+        if self._checksums is not None:
+            raise ValueError("write to a PipelinedChecksummingSink after get_checksums()")
+        view = memoryview(data)
+        for worker in self._workers:
+            worker.put(view)
+        return len(view)
+
+    def get_checksums(self):
+        if self._checksums is None:
+            self.close()
+            checksums = {}
+            for worker in self._workers:
+                checksums.update(worker.get_checksums())
+            self._checksums = checksums
+        return self._checksums
+
+    def close(self):
+        for worker in self._workers:
+            worker.finish()
+
+    class _HashWorker:
+
+        def __init__(self, write_chunk_size, hash_function, queue_depth):
+            self.hash_function = hash_function
+            self._sink = ChecksummingSink(write_chunk_size, hash_functions=[hash_function])
+            self._queue = queue.Queue(maxsize=queue_depth)
+            self._error = None
+            self._thread = threading.Thread(target=self._run, name=f"hash-{hash_function}", daemon=True)
+            self._thread.start()
+
+        def put(self, view):
+            self._raise_if_failed()
+            self._queue.put(view)
+
+        def finish(self):
+            if self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join()
+
+        def get_checksums(self):
+            self._raise_if_failed()
+            return self._sink.get_checksums()
+
+        def _run(self):
+            while True:
+                view = self._queue.get()
+                if view is None:
+                    return
+                if self._error is None:
+                    try:
+                        self._sink.write(view)
+                    except Exception as e:
+                        self._error = e
+
+        def _raise_if_failed(self):
+            if self._error is not None:
+                raise RuntimeError(f"{self.hash_function} hashing failed") from self._error
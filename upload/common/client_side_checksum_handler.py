@@ -1,11 +1,14 @@
+import mmap
 import os
-import sys
 import time
+from urllib.parse import urlparse
 
-from dcplib.checksumming_io import ChecksummingSink
+import boto3
 from dcplib.s3_multipart import get_s3_multipart_chunk_size
 
+from .checksumming_io import ChecksummingSink
 from .logging import get_logger
+from .parallel_s3_reader import ParallelS3Reader
 
 logger = get_logger(__name__)
 
@@ -18,9 +21,10 @@ class ClientSideChecksumHandler:
     check-summing the file on the client-side, returning a tag that can be used as metadata when the file is uploaded
     to S3."""
 
-    def __init__(self, filename=None, data=None):
+    def __init__(self, filename=None, data=None, checksum_names=CHECKSUM_NAMES):
         self._filename = filename
         self._data = data
+        self._checksum_names = checksum_names
         self._checksums = {}
 
         self._compute_checksum()
@@ -35,8 +39,12 @@ class ClientSideChecksumHandler:
     def _compute_checksum(self):
         """ Calculates checksums for a given file. """
         if self._filename is not None and self._filename.startswith("s3://"):
-            logger.warning("Did not perform client-side checksumming for file in S3. To be implemented.")
-            pass
+            url = urlparse(self._filename)
+            s3obj = boto3.resource('s3').Bucket(url.netloc).Object(url.path.lstrip('/'))
+            s3obj.load()
+            checksumCalculator = self.ChecksumCalculator(s3obj.content_length, s3obj=s3obj,
+                                                         checksums=self._checksum_names)
+            self._checksums = checksumCalculator.compute()
         elif self._filename is None and self._data is None:
             logger.warning("Did not perform client-side checksumming because no data was provided.")
             pass
@@ -47,41 +55,64 @@ class ClientSideChecksumHandler:
             pass
         else:
             if self._filename is not None:
-                checksumCalculator = self.ChecksumCalculator(os.path.getsize(self._filename), filename=self._filename)
+                checksumCalculator = self.ChecksumCalculator(os.path.getsize(self._filename), filename=self._filename,
+                                                             checksums=self._checksum_names)
                 self._checksums = checksumCalculator.compute()
             else:
-                checksumCalculator = self.ChecksumCalculator(
-                    sys.getsizeof(self._data),
-                    data=self._data if isinstance(self._data, (bytes, bytearray)) else self._data.encode())
+                data = self._data if isinstance(self._data, (bytes, bytearray)) else self._data.encode()
+                checksumCalculator = self.ChecksumCalculator(len(data), data=data, checksums=self._checksum_names)
                 self._checksums = checksumCalculator.compute()
 
     class ChecksumCalculator:
         """ The ChecksumCalculator encapsulates calling various library functions based on the required checksum to
         be calculated on a file."""
 
-        def __init__(self, data_size, data=None, filename=None, checksums=CHECKSUM_NAMES):
+        MAX_BUFFERED_BYTES = 256 * 1024 * 1024
+
+        def __init__(self, data_size, data=None, filename=None, s3obj=None, checksums=CHECKSUM_NAMES):
             self._data = data
             self._filename = filename
+            self._s3obj = s3obj
             self._data_size = data_size
             self._checksums = checksums
 
         def compute(self):
             """ Compute the checksum(s) for the given file and return a map of the value by the hash function name. """
             start_time = time.time()
-            if self._data:
-                with ChecksummingSink(self._data_size, hash_functions=self._checksums) as sink:
-                    sink.write(self._data)
+            if self._data is not None:
+                # The s3_etag must use the part size the object would be uploaded with, written a part at a time.
+                _multipart_chunksize = get_s3_multipart_chunk_size(self._data_size)
+                with ChecksummingSink(_multipart_chunksize, hash_functions=self._checksums) as sink:
+                    with memoryview(self._data) as _view:
+                        for offset in range(0, len(_view), _multipart_chunksize):
+                            sink.write(_view[offset:offset + _multipart_chunksize])
                     checksums = sink.get_checksums()
             elif self._filename:
                 _multipart_chunksize = get_s3_multipart_chunk_size(self._data_size)
                 with ChecksummingSink(_multipart_chunksize, hash_functions=self._checksums) as sink:
-                    with open(self._filename, 'rb') as _file_object:
-                        while True:
-                            data = _file_object.read(_multipart_chunksize)
-                            if not data:
-                                break
-                            sink.write(data)
+                    for chunk in self._mapped_chunks(_multipart_chunksize):
+                        sink.write(chunk)
+                    checksums = sink.get_checksums()
+            elif self._s3obj:
+                # Stream the object with concurrent ranged GETs; at most MAX_BUFFERED_BYTES is held in memory.
+                _multipart_chunksize = get_s3_multipart_chunk_size(self._data_size)
+                reader = ParallelS3Reader(self._s3obj, _multipart_chunksize,
+                                          max_buffered_bytes=self.MAX_BUFFERED_BYTES)
+                with ChecksummingSink(_multipart_chunksize, hash_functions=self._checksums) as sink:
+                    for part in reader.parts():
+                        sink.write(part)
                     checksums = sink.get_checksums()
 
             logger.info("Checksumming took %.2f milliseconds to compute" % ((time.time() - start_time) * 1000))
             return checksums
+
+        def _mapped_chunks(self, chunk_size):
+            """ Yield the file as read-only memoryview slices of a memory map: no chunk is ever copied. """
+            if self._data_size == 0:
+                return  # empty files cannot be mapped
+            with open(self._filename, 'rb') as _file_object:
+                with mmap.mmap(_file_object.fileno(), 0, access=mmap.ACCESS_READ) as _mapped_file:
+                    with memoryview(_mapped_file) as _view:
+                        for offset in range(0, len(_view), chunk_size):
+                            with _view[offset:offset + chunk_size] as chunk:
+                                yield chunk
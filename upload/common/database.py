@@ -1,33 +1,115 @@
+import os
 import re
+import threading
 from datetime import datetime
 
 import requests
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import and_, bindparam, create_engine, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.util import LRUCache
 from sqlalchemy.exc import OperationalError, IntegrityError, DatabaseError
 
+from .database_orm import Base
 from .exceptions import UploadException
 from .upload_config import UploadDbConfig
 
 
 class UploadDB:
+    """
+    All UploadDB instances in a process share one engine and so one connection pool.
+
+    The default pool suits a Lambda handling one request at a time.  Entry points that query from several
+    threads at once call configure() before first use, so that every thread can keep a connection: a pool
+    only keeps pool_size connections open and closes overflow connections as soon as they are returned.
+
+    Statements for the hot lookups are built once by select_statement() and run by run_select_statement()
+    on a copy of the engine with a compiled_cache, so their compiled SQL is reused rather than recompiled
+    on every query.  Other statements are built afresh for every query and would only churn the cache.
+
+    Tables are defined by the models in database_orm, not reflected from the database, so the first query
+    in a process is not preceded by catalog queries.  Set UPLOAD_DB_CHECK_SCHEMA to have the first UploadDB
+    in a process compare those definitions with the live schema, see check_schema().
+    """
+
+    RECORD_TYPES = ('upload_area', 'file', 'notification', 'validation', 'checksum', 'validation_files',
+                    'upload_area_count')
+
+    POOL_SETTINGS = {
+        'pool_size': 1,
+        'max_overflow': 10,
+        'pool_pre_ping': False,  # pgbouncer connections are cheap to test, but Lambdas rarely idle long
+        'pool_recycle': -1
+    }
+    COMPILED_CACHE_SIZE = 100
+    BULK_INSERT_ROWS = 1000  # per INSERT statement in create_pg_records()
 
     _engine = None
-    _record_type_table_map = None
+    _select_engine = None  # _engine with a compiled_cache, sharing its pool
+    _record_type_table_map = {record_type: Base.metadata.tables[record_type] for record_type in RECORD_TYPES}
+    _schema_checked = False
+    _pool_settings = dict(POOL_SETTINGS)
+    _select_statements = {}
+    _lock = threading.Lock()
 
     def __init__(self):
-        if self.__class__._record_type_table_map is None:
-            config = UploadDbConfig()
-            self.__class__._engine = create_engine(config.pgbouncer_uri, pool_size=1)
-            meta = MetaData(self.engine)
-            meta.reflect()
-            self.__class__._record_type_table_map = {
-                "upload_area": meta.tables['upload_area'],
-                "file": meta.tables['file'],
-                "notification": meta.tables['notification'],
-                "validation": meta.tables['validation'],
-                "checksum": meta.tables['checksum'],
-                "validation_files": meta.tables['validation_files']
-            }
+        with self.__class__._lock:
+            if self.__class__._engine is None:
+                self.__class__._engine = self._create_engine()
+                self.__class__._select_engine = self.__class__._engine.execution_options(
+                    compiled_cache=LRUCache(self.COMPILED_CACHE_SIZE))
+            if os.environ.get('UPLOAD_DB_CHECK_SCHEMA') and not self.__class__._schema_checked:
+                self._check_schema_or_raise()
+                self.__class__._schema_checked = True
+
+    @classmethod
+    def configure(cls, **pool_settings):
+        """
+        Set the pool size, overflow, pre-ping and recycle time used by this process's engine.
+        Takes the keyword arguments in POOL_SETTINGS; those not given revert to their defaults.
+        """
+        unknown_settings = set(pool_settings) - set(cls.POOL_SETTINGS)
+        if unknown_settings:
+            raise ValueError(f"Unknown pool settings: {', '.join(sorted(unknown_settings))}")
+        with cls._lock:
+            cls._pool_settings = {**cls.POOL_SETTINGS, **pool_settings}
+            if cls._engine is not None:
+                cls._engine.dispose()
+                cls._engine = None
+                cls._select_engine = None
+
+    @classmethod
+    def _create_engine(cls):
+        config = UploadDbConfig()
+        return create_engine(config.pgbouncer_uri, **cls._pool_settings)
+
+    def check_schema(self):
+        """
+        Compare our table definitions with the live database's.
+        :return: a list of differences, empty if every table and column we use exists with the same nullability.
+        """
+        inspector = inspect(self.engine)
+        live_tables = set(inspector.get_table_names())
+        differences = []
+        for record_type in self.RECORD_TYPES:
+            table = self.table(table_name=record_type)
+            if table.name not in live_tables:
+                differences.append(f"table {table.name} does not exist")
+                continue
+            live_columns = {column['name']: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in live_columns:
+                    differences.append(f"column {table.name}.{column.name} does not exist")
+                elif live_columns[column.name]['nullable'] != column.nullable:
+                    differences.append(f"column {table.name}.{column.name} nullable is "
+                                       f"{live_columns[column.name]['nullable']}, expected {column.nullable}")
+            for column_name in set(live_columns) - set(table.columns.keys()):
+                differences.append(f"column {table.name}.{column_name} is not defined in database_orm")
+        return differences
+
+    def _check_schema_or_raise(self):
+        differences = self.check_schema()
+        if differences:
+            raise RuntimeError(f"Database schema differs from database_orm: {'; '.join(differences)}")
 
     @property
     def engine(self):
@@ -56,6 +138,76 @@ class UploadDB:
             else:
                 raise e
 
+    def create_pg_records(self, record_type, prop_vals_dicts, conflict_columns=None):
+        """
+        Create many records of one type in one transaction, with a multi-row INSERT per BULK_INSERT_ROWS
+        records rather than a round trip per record.  Every dict must have the same keys.
+        :param conflict_columns: columns of a unique index.  If given, records that already exist, or are
+                                 being created by a concurrent transaction, are skipped with ON CONFLICT DO NOTHING
+                                 rather than failing the whole transaction, and have a primary key of None.
+        :return: the primary keys of the new records, in the same order as prop_vals_dicts
+        """
+        if not prop_vals_dicts:
+            return []
+        now = datetime.utcnow()
+        rows = [{**prop_vals_dict, 'created_at': now, 'updated_at': now} for prop_vals_dict in prop_vals_dicts]
+        table = self.table(table_name=record_type)
+        try:
+            return self._insert_rows(table, rows, conflict_columns)
+        except IntegrityError as e:
+            if re.search("duplicate key value violates unique constraint", e.orig.pgerror):
+                raise UploadException(status=requests.codes.conflict,
+                                      title=f"{record_type} Already Exists",
+                                      detail=f"One of {len(rows)} new {record_type} records already exists")
+            else:
+                raise e
+
+    def _insert_rows(self, table, rows, conflict_columns=None):
+        try:
+            return self._insert_rows_in_transaction(table, rows, conflict_columns)
+        except OperationalError:
+            self.engine.dispose()  # see run_query()
+            return self._insert_rows_in_transaction(table, rows, conflict_columns)
+
+    def _insert_rows_in_transaction(self, table, rows, conflict_columns=None):
+        primary_key = list(table.primary_key.columns)[0]
+        primary_keys = []
+        with self.engine.begin() as connection:
+            for start in range(0, len(rows), self.BULK_INSERT_ROWS):
+                batch = rows[start:start + self.BULK_INSERT_ROWS]
+                if conflict_columns is None:
+                    insert = table.insert().values(batch).returning(primary_key)
+                    # Postgres returns the rows of a multi-row VALUES in the order they were given.
+                    primary_keys.extend(row[0] for row in connection.execute(insert))
+                else:
+                    # Skipped rows are not returned, so match the ones that are by their conflict columns.
+                    insert = postgresql.insert(table).values(batch).on_conflict_do_nothing(
+                        index_elements=list(conflict_columns)
+                    ).returning(primary_key, *[table.columns[column] for column in conflict_columns])
+                    created = {tuple(row[1:]): row[0] for row in connection.execute(insert)}
+                    primary_keys.extend(created.get(tuple(row[column] for column in conflict_columns))
+                                        for row in batch)
+        return primary_keys
+
+    def upsert_pg_record(self, record_type, prop_vals_dict, conflict_columns=('id',), update_columns=None):
+        """
+        Create a record or, if one with the same conflict_columns already exists, update it, with one
+        INSERT ... ON CONFLICT DO UPDATE.  Concurrent upserts of the same record cannot race.
+        :param conflict_columns: columns of a unique index that identify the record
+        :param update_columns: the columns to set when the record exists, by default all those given
+        :return: the record as it now is, as a dict
+        """
+        now = datetime.utcnow()
+        table = self.table(table_name=record_type)
+        if update_columns is None:
+            update_columns = [column for column in prop_vals_dict if column not in conflict_columns]
+        insert = postgresql.insert(table).values({**prop_vals_dict, 'created_at': now, 'updated_at': now})
+        upsert = insert.on_conflict_do_update(
+            index_elements=list(conflict_columns),
+            set_=dict({column: insert.excluded[column] for column in update_columns}, updated_at=now)
+        ).returning(*table.columns)
+        return dict(self.run_query(upsert).fetchone())
+
     def update_pg_record(self, record_type, prop_vals_dict, column='id'):
         record_id = prop_vals_dict[column]
         del prop_vals_dict[column]
@@ -95,10 +247,22 @@ class UploadDB:
                 results.append(output)
         return results
 
+    def select_statement(self, record_type, *columns):
+        """
+        :return: SELECT * FROM record_type WHERE column = :column AND ..., one for each of columns.
+                 The same statement object is returned every time, so run_select_statement() can reuse
+                 its compiled form.
+        """
+        key = (record_type, columns)
+        if key not in self._select_statements:
+            table = self.table(table_name=record_type)
+            self._select_statements[key] = table.select().where(
+                and_(*[table.columns[column] == bindparam(column) for column in columns]))
+        return self._select_statements[key]
+
     def _run_select_query(self, record_type, record_id, column):
-        table = self.table(table_name=record_type)
-        select = table.select().where(table.columns[column] == record_id)
-        result = self.run_query(select)
+        select = self.select_statement(record_type, column)
+        result = self.run_select_statement(select, {column: record_id})
         return result
 
     # Engine.dispose() protects us from situations where the client thinks it has
@@ -123,3 +287,13 @@ class UploadDB:
             self.engine.dispose()
             results = self.engine.execute(query, params)
         return results
+
+    def run_select_statement(self, query, params):
+        """ run_query_with_params() for a statement from select_statement(), reusing its compiled SQL. """
+        select_engine = self.__class__._select_engine
+        try:
+            results = select_engine.execute(query, params)
+        except (OperationalError, DatabaseError) as e:
+            select_engine.dispose()  # disposes the pool it shares with self.engine
+            results = select_engine.execute(query, params)
+        return results
@@ -1,36 +1,39 @@
 from datetime import datetime
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import BIGINT, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 
 from upload.common.upload_config import UploadDbConfig
 
 
+# These models are also the schema UploadDB queries through, so they must match the tables the alembic
+# migrations in database/versions create.  UploadDB.check_schema() compares them with a live database.
 Base = declarative_base()
 
 
 class DbUploadArea(Base):
     __tablename__ = 'upload_area'
     id = Column(Integer(), primary_key=True)
-    uuid = Column(String(), nullable=False)
+    uuid = Column(String(), nullable=False, unique=True)
     bucket_name = Column(String(), nullable=False)
     status = Column(String(), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
 
 
 class DbFile(Base):
     __tablename__ = 'file'
     id = Column(Integer(), primary_key=True)
     s3_key = Column(String(), nullable=False)
-    s3_etag = Column(String(), nullable=True)
+    s3_etag = Column(String(), nullable=False)
     upload_area_id = Column(Integer(), ForeignKey('upload_area.id'), nullable=False)
     name = Column(String(), nullable=False)
-    size = Column(Integer(), nullable=False)
-    checksums = Column(JSON(), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+    size = Column(BIGINT(), nullable=False)
+    checksums = Column(JSONB(), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
 
     upload_area = relationship("DbUploadArea", back_populates="files")
 
@@ -38,41 +41,74 @@ class DbFile(Base):
 class DbChecksum(Base):
     __tablename__ = 'checksum'
     id = Column(String(), primary_key=True)
-    file_id = Column(String(), ForeignKey('file.id'), nullable=False)
-    job_id = Column(String(), nullable=False)
+    file_id = Column(Integer(), ForeignKey('file.id'), nullable=False)
+    job_id = Column(String(), nullable=True)
     status = Column(String(), nullable=False)
-    checksum_started_at = Column(DateTime(), nullable=False)
-    checksum_ended_at = Column(DateTime(), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+    checksum_started_at = Column(DateTime(timezone=True), nullable=True)
+    checksum_ended_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
 
     file = relationship("DbFile", back_populates='checksum_records')
 
 
+class DbChecksumClaim(Base):
+    __tablename__ = 'checksum_claim'
+    s3_key = Column(String(), primary_key=True)
+    s3_etag = Column(String(), primary_key=True)
+    claim_id = Column(String(), nullable=False)
+    claimed_sequencer = Column(String(), nullable=False)
+    latest_sequencer = Column(String(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+
+
 class DbValidation(Base):
     __tablename__ = 'validation'
     id = Column(String(), primary_key=True)
-    job_id = Column(String(), nullable=False)
+    job_id = Column(String(), nullable=True)
     status = Column(String(), nullable=False)
-    results = Column(String(), nullable=False)
-    validation_started_at = Column(DateTime(), nullable=False)
-    validation_ended_at = Column(DateTime(), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+    results = Column(JSONB(), nullable=True)
+    validation_started_at = Column(DateTime(timezone=True), nullable=True)
+    validation_ended_at = Column(DateTime(timezone=True), nullable=True)
+    docker_image = Column(String(), nullable=True)
+    original_validation_id = Column(String(), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
 
 
 class DbNotification(Base):
     __tablename__ = 'notification'
     id = Column(String(), primary_key=True)
-    file_id = Column(String(), ForeignKey('file.id'), nullable=False)
+    file_id = Column(Integer(), ForeignKey('file.id'), nullable=False)
     status = Column(String(), nullable=False)
-    payload = Column(JSON(), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+    payload = Column(JSONB(), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
 
     file = relationship("DbFile", back_populates='notifications')
 
 
+class DbValidationFiles(Base):
+    __tablename__ = 'validation_files'
+    id = Column(Integer(), primary_key=True)
+    validation_id = Column(String(), ForeignKey('validation.id'), nullable=False)
+    file_id = Column(Integer(), ForeignKey('file.id'), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+
+
+class DbUploadAreaCount(Base):
+    __tablename__ = 'upload_area_count'
+    upload_area_id = Column(Integer(), ForeignKey('upload_area.id'), primary_key=True)
+    counter = Column(String(), primary_key=True)
+    status = Column(String(), primary_key=True)
+    total = Column(BIGINT(), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False, onupdate=datetime.utcnow)
+
+
 DbUploadArea.files = relationship('DbFile', order_by=DbFile.id, back_populates='upload_area')
 DbFile.checksum_records = relationship('DbChecksum', order_by=DbChecksum.created_at,
                                        back_populates='file',
@@ -85,8 +121,8 @@ DbFile.notifications = relationship('DbNotification',
 
 class DBSessionMaker:
 
-    def __init__(self):
-        engine = create_engine(UploadDbConfig().database_uri)
+    def __init__(self, **engine_options):
+        engine = create_engine(UploadDbConfig().database_uri, **engine_options)
         Base.metadata.bind = engine
         self.session_maker = sessionmaker()
         self.session_maker.bind = engine
@@ -1,16 +1,21 @@
+import collections
 import collections.abc
+import math
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 
 import boto3
-from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
-from dcplib.checksumming_io import ChecksummingSink
-from dcplib.s3_multipart import get_s3_multipart_chunk_size, MULTIPART_THRESHOLD
+from dcplib.s3_multipart import get_s3_multipart_chunk_size
 from tenacity import retry, wait_fixed, stop_after_attempt
 
+from .checksumming_io import ChecksummingSink, PipelinedChecksummingSink
 from .exceptions import UploadException
 from .logging import get_logger
+from .parallel_s3_reader import ParallelS3Reader
+from .resumable_checksumming import ResumableChecksummingSink
 
 logger = get_logger(__name__)
 
@@ -34,17 +39,24 @@ class DssChecksums(collections.abc.MutableMapping):
     CLIENTSIDE_CHECKSUM_NAMES = ['crc32c']
     CHECKSUM_TAGS = ('hca-dss-sha1', 'hca-dss-sha256', 'hca-dss-crc32c', 'hca-dss-s3_etag')
 
-    def __init__(self, s3_object,
-                 checksums=None  # only used during testing
-                 ):
+    def __init__(self, s3_object, checksums=None):
+        """
+        Checksums are read from the object's tags the first time they are needed, unless they are provided.
+        """
         self._s3obj = s3_object
         self._s3client = boto3.client('s3')
         self._tagger = self.Tagger(s3_object)
-        self._checksums = self._tagger.read_checksums_from_object() or checksums or {}
+        self._checksums = dict(checksums) if checksums else None
         self._validator = self.Validator(s3_object, self.CLIENTSIDE_CHECKSUM_NAMES)
 
+    @property
+    def _loaded_checksums(self):
+        if self._checksums is None:
+            self._checksums = self._tagger.read_checksums_from_object() or {}
+        return self._checksums
+
     def __getitem__(self, name):
-        return self._checksums[name]
+        return self._loaded_checksums[name]
 
     def __setitem__(self, name, value):
         raise NotImplemented
@@ -53,27 +65,28 @@ class DssChecksums(collections.abc.MutableMapping):
         raise NotImplemented
 
     def __iter__(self):
-        return iter(self._checksums)
+        return iter(self._loaded_checksums)
 
     def __len__(self):
-        return len(self._checksums)
+        return len(self._loaded_checksums)
 
     def keys(self):
-        return self._checksums.keys()
+        return self._loaded_checksums.keys()
 
     def refresh(self):
-        self._checksums = self._tagger.read_checksums_from_object() or {}
+        """ Re-read checksums from the object's tags, bypassing the tag cache. """
+        self._checksums = self._tagger.read_checksums_from_object(use_cache=False) or {}
 
     def are_present(self):
         return sorted(self.keys()) == sorted(self.CHECKSUM_NAMES)
 
-    def compute(self, report_progress=False):
-        computer = self.ChecksumComputer(s3obj=self._s3obj)
+    def compute(self, report_progress=False, **computer_options):
+        computer = self.ChecksumComputer(s3obj=self._s3obj, **computer_options)
         self._checksums = computer.compute(report_progress)
         return self
 
     def save_as_tags_on_s3_object(self):
-        self._validator.validate_clientside_checksum_against_serverside_checksum(self._checksums)
+        self._validator.validate_clientside_checksum_against_serverside_checksum(self._loaded_checksums)
         self._tagger.save_tags(self)
 
     class Validator:
@@ -108,17 +121,65 @@ class DssChecksums(collections.abc.MutableMapping):
                                       detail="No such file in that upload area while attempting to read metadata")
 
     class Tagger:
+        """
+        Reads and writes checksum tags.
+
+        Tags read from S3 are cached per process, keyed by (bucket, key, etag), for up to CACHE_TTL_SECONDS.
+        Writing tags through save_tags() invalidates the entry.  Overwriting an object with identical contents
+        erases its tags without changing its etag, so callers that need to notice that must read with
+        use_cache=False.
+
+        A long-lived process sees an endless stream of objects, so each insertion prunes expired entries and
+        then evicts the oldest beyond CACHE_MAX_ENTRIES.
+        """
+
+        CACHE_TTL_SECONDS = 60
+        CACHE_MAX_ENTRIES = 1000
+        _cache = collections.OrderedDict()  # (bucket, key, etag) -> (time cached, tags), oldest first
+        _cache_lock = threading.Lock()
 
         def __init__(self, s3obj):
             self._s3obj = s3obj
             self._s3client = boto3.client('s3')
 
-        def read_checksums_from_object(self):
+        @classmethod
+        def clear_cache(cls):
+            with cls._cache_lock:
+                cls._cache.clear()
+
+        @classmethod
+        def _cache_put(cls, cache_key, tags_dict):
+            now = time.time()
+            with cls._cache_lock:
+                cls._cache.pop(cache_key, None)
+                cls._cache[cache_key] = (now, tags_dict)
+                while cls._cache:
+                    oldest_key, (cached_at, _) = next(iter(cls._cache.items()))
+                    if now - cached_at < cls.CACHE_TTL_SECONDS and len(cls._cache) <= cls.CACHE_MAX_ENTRIES:
+                        break
+                    del cls._cache[oldest_key]
+
+        @classmethod
+        def _cache_discard(cls, cache_key):
+            with cls._cache_lock:
+                cls._cache.pop(cache_key, None)
+
+        def read_checksums_from_object(self, use_cache=True):
             if not self._s3obj:
                 return None
-            tags_dict = self._read_tags()
+            cache_key = self._cache_key()
+            with self._cache_lock:
+                cached = self._cache.get(cache_key) if use_cache else None
+            if cached and time.time() - cached[0] < self.CACHE_TTL_SECONDS:
+                tags_dict = cached[1]
+            else:
+                tags_dict = self._read_tags()
+                self._cache_put(cache_key, tags_dict)
             return self._cut_off_tag_prefix_for_dss_tags(tags_dict)
 
+        def _cache_key(self):
+            return self._s3obj.bucket_name, self._s3obj.key, self._s3obj.e_tag
+
         @retry(reraise=True, wait=wait_fixed(2), stop=stop_after_attempt(5))
         def _read_tags(self):
             try:
@@ -139,9 +200,11 @@ class DssChecksums(collections.abc.MutableMapping):
             tags = {f"{DssChecksums.TAG_PREFIX}{csum_name}": csum for csum_name, csum in checksums.items()}
 
             tagging = dict(TagSet=self._encode_s3_tagset(tags))
+            self._cache_discard(self._cache_key())
             self._s3client.put_object_tagging(Bucket=self._s3obj.bucket_name, Key=self._s3obj.key, Tagging=tagging)
 
             saved_checksums = self._read_tags()
+            self._cache_put(self._cache_key(), saved_checksums)
             if len(saved_checksums) != len(checksums):
                 raise UploadException(status=500,
                                       title=f"Tags {tags} did not stick to {self._s3obj.key}",
@@ -167,13 +230,43 @@ class DssChecksums(collections.abc.MutableMapping):
             return reduce(lambda x, y: dict(x, **y), simplified_dicts)
 
     class ChecksumComputer:
+        """
+        Computes all DSS checksums for an S3 object in a single pass.
 
-        def __init__(self, s3obj):
+        The object is read with concurrent ranged GETs aligned to its multipart chunk size
+        (see ParallelS3Reader), and the parts are fed to the hashers in order.  With pipelined=True
+        each hash function runs on its own thread (see PipelinedChecksummingSink), which pays off
+        on multi-core hosts such as the Batch checksummer.
+
+        Given a ChecksumCheckpoint, progress is saved periodically and a previous attempt's
+        progress is resumed (see ResumableChecksummingSink).
+
+        progress_listener, if given, is called with the number of bytes checksummed so far after every
+        part.  It may raise to abandon the computation.
+
+        If the object was uploaded in parts of the standard multipart chunk size, its S3 ETag already
+        is the s3_etag checksum.  In that case the ETag is used as-is and the s3_etag is not recomputed;
+        s3_etag_was_computed records which happened.
+        """
+
+        def __init__(self, s3obj, concurrency=ParallelS3Reader.DEFAULT_CONCURRENCY,
+                     max_buffered_bytes=ParallelS3Reader.DEFAULT_MAX_BUFFERED_BYTES, pipelined=False,
+                     checkpoint=None, progress_listener=None):
             self._s3obj = s3obj
             self._s3client = boto3.client('s3')
+            self.concurrency = concurrency
+            self.max_buffered_bytes = max_buffered_bytes
+            self.pipelined = pipelined
+            self.sink_class = PipelinedChecksummingSink if pipelined else ChecksummingSink
+            self.checkpoint = checkpoint
+            if checkpoint and not ResumableChecksummingSink.is_supported():
+                logger.warning("libcrypto not found, checksumming will not be checkpointed")
+                self.checkpoint = None
+            self.progress_listener = progress_listener
             self.bytes_checksummed = 0
             self.start_time = None
             self.last_diag_output_time = None
+            self.s3_etag_was_computed = None
 
         def compute(self, report_progress=False):
             if report_progress:
@@ -188,16 +281,85 @@ class DssChecksums(collections.abc.MutableMapping):
 
         def _compute_checksums(self, progress_callback=None):
             multipart_chunksize = get_s3_multipart_chunk_size(self._s3obj.content_length)
-            with ChecksummingSink(multipart_chunksize) as sink:
-                self._s3client.download_fileobj(self._s3obj.bucket_name,
-                                                self._s3obj.key, sink,
-                                                Callback=progress_callback,
-                                                Config=self._transfer_config())
+            s3_etag = self._s3_etag_from_object_etag(multipart_chunksize)
+            self.s3_etag_was_computed = s3_etag is None
+            hash_functions = [name for name in DssChecksums.CHECKSUM_NAMES if name != 's3_etag' or not s3_etag]
+            logger.info(f"{self._s3obj.key}: computing {hash_functions}"
+                        f"{'' if self.s3_etag_was_computed else ', s3_etag taken from object ETag'}")
+            if self.checkpoint:
+                checksums = self._compute_checksums_with_checkpoints(multipart_chunksize, hash_functions,
+                                                                     progress_callback)
+            else:
+                with self.sink_class(multipart_chunksize, hash_functions=hash_functions) as sink:
+                    self._feed_sink(sink, multipart_chunksize, 0, progress_callback)
+                    checksums = sink.get_checksums()
+            if s3_etag:
+                checksums['s3_etag'] = s3_etag
+            if len(DssChecksums.CHECKSUM_NAMES) != len(checksums):
+                error = f"checksums {checksums} for {self._s3obj.key} do not meet requirements"
+                raise UploadException(status=500, title=error, detail=str(checksums))
+            return checksums
+
+        def _compute_checksums_with_checkpoints(self, multipart_chunksize, hash_functions, progress_callback):
+            state = self.checkpoint.load(multipart_chunksize)
+            with ResumableChecksummingSink(multipart_chunksize, state=state, pipelined=self.pipelined,
+                                           hash_functions=hash_functions) as sink:
+                if progress_callback and sink.offset:
+                    progress_callback(sink.offset)
+                self._feed_sink(sink, multipart_chunksize, sink.offset, progress_callback,
+                                after_write=self.checkpoint.save_if_due)
                 checksums = sink.get_checksums()
-                if len(DssChecksums.CHECKSUM_NAMES) != len(checksums):
-                    error = f"checksums {checksums} for {self._s3obj.key} do not meet requirements"
-                    raise UploadException(status=500, title=error, detail=str(checksums))
-                return checksums
+            self.checkpoint.discard()
+            return checksums
+
+        def _feed_sink(self, sink, multipart_chunksize, start_offset, progress_callback, after_write=None):
+            reader = ParallelS3Reader(self._s3obj, part_size=multipart_chunksize,
+                                      start_offset=start_offset,
+                                      concurrency=self.concurrency,
+                                      max_buffered_bytes=self.max_buffered_bytes,
+                                      s3client=self._s3client)
+            offset = start_offset
+            for part in reader.parts():
+                sink.write(part)
+                offset += len(part)
+                if progress_callback:
+                    progress_callback(len(part))
+                if after_write:
+                    after_write(sink)
+                if self.progress_listener:
+                    self.progress_listener(offset)
+
+        def _s3_etag_from_object_etag(self, multipart_chunksize):
+            """
+            Return the object's ETag if it is what S3Etag would compute for the object's contents, else None.
+
+            Objects encrypted with KMS or a customer key have ETags that are not MD5s of their contents (or
+            parts), so never qualify.  Otherwise, a single-part upload's ETag is the MD5 of the contents, which
+            is the s3_etag of anything that fits in one chunk.  A multipart upload's ETag is
+            "<MD5 of part MD5s>-<part count>", which is the s3_etag if every part but the last was
+            multipart_chunksize bytes long.  S3 allows parts of differing sizes, so we HEAD every part to check.
+            """
+            if self._s3obj.server_side_encryption == 'aws:kms' or self._s3obj.sse_customer_algorithm:
+                return None
+            e_tag = self._s3obj.e_tag.strip('\"')
+            size = self._s3obj.content_length
+            expected_part_count = max(1, math.ceil(size / multipart_chunksize))
+            if '-' not in e_tag:
+                return e_tag if expected_part_count == 1 else None
+            part_count = int(e_tag.split('-')[1])
+            if part_count != expected_part_count or part_count == 1:
+                return None
+            expected_part_sizes = [multipart_chunksize] * (part_count - 1) + \
+                [size - (part_count - 1) * multipart_chunksize]
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, part_count)) as executor:
+                part_sizes = list(executor.map(self._part_size, range(1, part_count + 1)))
+            return e_tag if part_sizes == expected_part_sizes else None
+
+        @retry(reraise=True, wait=wait_fixed(2), stop=stop_after_attempt(3))
+        def _part_size(self, part_number):
+            return self._s3client.head_object(Bucket=self._s3obj.bucket_name, Key=self._s3obj.key,
+                                              IfMatch=self._s3obj.e_tag,
+                                              PartNumber=part_number)['ContentLength']
 
         def _compute_checksums_progress_callback(self, bytes_transferred):
             self.bytes_checksummed += bytes_transferred
@@ -205,8 +367,3 @@ class DssChecksums(collections.abc.MutableMapping):
                 logger.info("elapsed=%0.1f bytes_checksummed=%d" %
                             (time.time() - self.start_time, self.bytes_checksummed))
                 self.last_diag_output_time = time.time()
-
-        def _transfer_config(self) -> TransferConfig:
-            multipart_chunksize = get_s3_multipart_chunk_size(self._s3obj.content_length)
-            return TransferConfig(multipart_threshold=MULTIPART_THRESHOLD,
-                                  multipart_chunksize=multipart_chunksize)
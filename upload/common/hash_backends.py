@@ -0,0 +1,159 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+KB = 1024
+MB = KB * KB
+
+
+class HashBackend:
+    """
+    One implementation of a hash algorithm.
+
+    factory() returns a new hasher with update() and hexdigest(), and raises ImportError if the
+    implementation is not available on this host.  accelerated is False for implementations that
+    are too slow to checksum large files with (e.g. pure Python CRCs).
+    """
+
+    def __init__(self, algorithm, name, factory, accelerated):
+        self.algorithm = algorithm
+        self.name = name
+        self.factory = factory
+        self.accelerated = accelerated
+        self.bytes_per_second = None
+
+    def __repr__(self):
+        return f"HashBackend({self.algorithm}={self.name}, accelerated={self.accelerated})"
+
+    def new(self):
+        return self.factory()
+
+
+class CrcHasher:
+    """ Adapts a crcmod-style function, fn(data, crc) -> crc, to the hashlib interface. """
+
+    def __init__(self, crc_function, value=0):
+        self._crc_function = crc_function
+        self.value = value
+
+    def update(self, data):
+        self.value = self._crc_function(data, self.value)
+
+    def hexdigest(self):
+        return "%08x" % self.value
+
+
+class HashBackendRegistry:
+    """
+    Chooses an implementation for each hash algorithm we compute.
+
+    Backends are registered in order of preference.  select() tries each in turn, and picks the first
+    that is available and produces the right answer for a known input.  It measures its throughput and
+    logs the choice.  require_accelerated() refuses to run with a slow fallback.
+
+        hash_backends.new('crc32c').update(data)
+    """
+
+    SELF_TEST_BYTES = 256 * KB
+    KNOWN_ANSWERS = {
+        'crc32c': 'e3069283',
+        'sha1': 'f7c3bc1d808e04732adf679965ccc34ca7ae3441',
+        'sha256': '15e2b0d3c33891ebb0f1ef609ec419420c20e320ce94c65fbc8c3312448eb225'
+    }
+    KNOWN_INPUT = b"123456789"
+
+    def __init__(self):
+        self._candidates = OrderedDict()
+        self._selected = {}
+
+    def register(self, backend):
+        self._candidates.setdefault(backend.algorithm, []).append(backend)
+
+    def select(self):
+        for algorithm, candidates in self._candidates.items():
+            for backend in candidates:
+                if self._self_test(backend):
+                    self._selected[algorithm] = backend
+                    logger.info(f"Using {backend.name} for {algorithm}"
+                                f" ({backend.bytes_per_second / MB:.0f} MB/s, accelerated={backend.accelerated})")
+                    break
+            else:
+                raise RuntimeError(f"No working implementation of {algorithm}")
+        return self
+
+    def backend(self, algorithm):
+        return self._selected[algorithm]
+
+    def new(self, algorithm):
+        return self._selected[algorithm].new()
+
+    def require_accelerated(self):
+        slow = [backend for backend in self._selected.values() if not backend.accelerated]
+        if slow:
+            raise RuntimeError(f"Refusing to checksum with slow hash implementations: {slow}")
+
+    def _self_test(self, backend):
+        try:
+            hasher = backend.new()
+        except ImportError:
+            logger.debug(f"{backend} is not available")
+            return False
+        hasher.update(self.KNOWN_INPUT)
+        if hasher.hexdigest() != self.KNOWN_ANSWERS[backend.algorithm]:
+            logger.warning(f"{backend} failed its self-test, not using it")
+            return False
+        data = bytes(self.SELF_TEST_BYTES)
+        start_time = time.time()
+        backend.new().update(data)
+        backend.bytes_per_second = len(data) / max(time.time() - start_time, 1e-6)
+        return True
+
+
+def _crc32c_package():
+    import crc32c
+    return CrcHasher(getattr(crc32c, 'crc32c', None) or crc32c.crc32)
+
+
+def _crcmod(require_extension):
+    def factory():
+        from crcmod import crcmod
+        from crcmod.predefined import mkPredefinedCrcFun
+        if require_extension and not crcmod._usingExtension:
+            raise ImportError("crcmod C extension is not installed")
+        return CrcHasher(mkPredefinedCrcFun('crc-32c'))
+    return factory
+
+
+def _openssl(algorithm):
+    def factory():
+        import _hashlib
+        return _hashlib.new(algorithm)
+    return factory
+
+
+def _builtin(algorithm):
+    def factory():
+        return hashlib.new(algorithm)
+    return factory
+
+
+def _default_registry():
+    registry = HashBackendRegistry()
+    registry.register(HashBackend('crc32c', 'crc32c', _crc32c_package, accelerated=True))
+    registry.register(HashBackend('crc32c', 'crcmod C extension', _crcmod(require_extension=True), accelerated=True))
+    registry.register(HashBackend('crc32c', 'crcmod pure Python', _crcmod(require_extension=False), accelerated=False))
+    for algorithm in ('sha1', 'sha256'):
+        registry.register(HashBackend(algorithm, 'OpenSSL', _openssl(algorithm), accelerated=True))
+        registry.register(HashBackend(algorithm, 'hashlib builtin', _builtin(algorithm), accelerated=False))
+    return registry.select()
+
+
+hash_backends = _default_registry()
+
+if os.environ.get('DEPLOYMENT_STAGE') == 'prod':
+    hash_backends.require_accelerated()
@@ -98,10 +98,7 @@ class IngestNotifier:
 
     def _create_or_update_db_notification(self, notification_id, status, payload):
         notification_props = self._format_notification_props(notification_id, status, payload)
-        if self.db.get_pg_record("notification", notification_id):
-            self.db.update_pg_record("notification", notification_props)
-        else:
-            self.db.create_pg_record("notification", notification_props)
+        self.db.upsert_pg_record("notification", notification_props)
 
     def _format_notification_props(self, notification_id, status, payload):
         notification_props = {
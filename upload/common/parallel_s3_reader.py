@@ -0,0 +1,93 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+from tenacity import retry, retry_if_exception, wait_fixed, stop_after_attempt
+
+from .exceptions import UploadException
+
+KB = 1024
+MB = KB * KB
+
+
+class ParallelS3Reader:
+    """
+    Reads an S3 object as a sequence of consecutive parts, fetching them with concurrent ranged GETs.
+
+    Parts are yielded strictly in order, so they may be fed straight into a hasher.  Parts that arrive
+    early are held in a bounded reorder buffer: no more than max_buffered_bytes worth of parts are
+    ever in flight or waiting to be consumed, however many connections are used.
+
+        reader = ParallelS3Reader(s3obj, part_size=get_s3_multipart_chunk_size(s3obj.content_length))
+        for part in reader.parts():
+            sink.write(part)
+    """
+
+    DEFAULT_CONCURRENCY = 10
+    DEFAULT_MAX_BUFFERED_BYTES = 512 * MB
+
+    def __init__(self, s3obj, part_size, start_offset=0,
+                 concurrency=DEFAULT_CONCURRENCY, max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES,
+                 s3client=None):
+        self._s3obj = s3obj
+        self._s3client = s3client or boto3.client('s3')
+        self.part_size = part_size
+        self.start_offset = start_offset
+        self.concurrency = concurrency
+        self.window = max(1, min(concurrency * 2, max_buffered_bytes // part_size))
+
+    @property
+    def size(self):
+        return self._s3obj.content_length
+
+    @property
+    def e_tag(self):
+        return self._s3obj.e_tag
+
+    def parts(self):
+        """ Yield the object's contents from start_offset to the end, one part at a time, in order. """
+        offsets = iter(range(self.start_offset, self.size, self.part_size))
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                for offset in offsets:
+                    pending.append(executor.submit(self._read_part, offset))
+                    if len(pending) >= self.window:
+                        break
+                while pending:
+                    part = pending.popleft().result()
+                    next_offset = next(offsets, None)
+                    if next_offset is not None:
+                        pending.append(executor.submit(self._read_part, next_offset))
+                    yield part
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _read_part(self, offset):
+        try:
+            return self._get_range(offset)
+        except ClientError as e:
+            if _is_precondition_failure(e):
+                raise UploadException(status=409, title="File changed while being read",
+                                      detail=f"{self._s3obj.key} no longer has etag {self.e_tag}")
+            raise e
+
+    @retry(reraise=True, retry=retry_if_exception(lambda e: not _is_precondition_failure(e)),
+           wait=wait_fixed(2), stop=stop_after_attempt(5))
+    def _get_range(self, offset):
+        last_byte = min(offset + self.part_size, self.size) - 1
+        response = self._s3client.get_object(Bucket=self._s3obj.bucket_name,
+                                             Key=self._s3obj.key,
+                                             Range=f"bytes={offset}-{last_byte}",
+                                             IfMatch=self.e_tag)
+        part = response['Body'].read()
+        if len(part) != last_byte - offset + 1:
+            raise RuntimeError(f"Short read of {self._s3obj.key} at offset {offset}: "
+                               f"expected {last_byte - offset + 1} bytes, got {len(part)}")
+        return part
+
+
+def _is_precondition_failure(e):
+    return isinstance(e, ClientError) and e.response['Error']['Code'] in ('PreconditionFailed', '412')
@@ -0,0 +1,244 @@
+import binascii
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from .hash_backends import hash_backends
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class _LibCrypto:
+    """
+    Locates OpenSSL's libcrypto so we can use its low-level SHA functions.
+
+    hashlib objects cannot be serialized, but OpenSSL's SHA_CTX/SHA256_CTX are plain structs
+    containing no pointers, so their bytes can be saved and restored later in another process.
+    """
+
+    CANDIDATE_NAMES = ('libcrypto.so', 'libcrypto.so.3', 'libcrypto.so.1.1', 'libcrypto.so.1.0.0',
+                       'libcrypto.so.10')
+    _lib = None
+
+    @classmethod
+    def load(cls):
+        if cls._lib is None:
+            cls._lib = cls._find() or False
+        return cls._lib or None
+
+    @classmethod
+    def _find(cls):
+        names = [ctypes.util.find_library('crypto')] + list(cls.CANDIDATE_NAMES)
+        try:
+            import _hashlib  # linked against libcrypto, dlsym() will search its dependencies
+            names.append(_hashlib.__file__)
+        except ImportError:
+            pass
+        for name in names:
+            if not name:
+                continue
+            try:
+                lib = ctypes.CDLL(name)
+                lib.SHA1_Init, lib.SHA256_Init
+                return lib
+            except (OSError, AttributeError):
+                continue
+        return None
+
+
+class _OpenSSLHasher:
+
+    CTX_SIZE = 256  # larger than both SHA_CTX (96) and SHA256_CTX (112)
+    ALGORITHMS = {
+        'sha1': ('SHA1_Init', 'SHA1_Update', 'SHA1_Final', 20),
+        'sha256': ('SHA256_Init', 'SHA256_Update', 'SHA256_Final', 32)
+    }
+
+    def __init__(self, name, state=None):
+        self.name = name
+        lib = _LibCrypto.load()
+        init, update, final, self._digest_size = self.ALGORITHMS[name]
+        self._update = getattr(lib, update)
+        self._final = getattr(lib, final)
+        self._ctx = ctypes.create_string_buffer(self.CTX_SIZE)
+        if state:
+            ctypes.memmove(self._ctx, binascii.unhexlify(state), self.CTX_SIZE)
+        else:
+            getattr(lib, init)(self._ctx)
+
+    def update(self, data):
+        self._update(self._ctx, ctypes.c_char_p(data), ctypes.c_size_t(len(data)))
+
+    def hexdigest(self):
+        ctx = ctypes.create_string_buffer(self._ctx.raw, self.CTX_SIZE)  # Final destroys the context
+        digest = ctypes.create_string_buffer(self._digest_size)
+        self._final(digest, ctx)
+        return binascii.hexlify(digest.raw).decode('ascii')
+
+    def state(self):
+        return binascii.hexlify(self._ctx.raw).decode('ascii')
+
+
+class _Crc32cHasher:
+
+    def __init__(self, state=None):
+        self._hasher = hash_backends.new('crc32c')
+        self._hasher.value = state or 0
+
+    def update(self, data):
+        self._hasher.update(data)
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+    def state(self):
+        return self._hasher.value
+
+
+class _S3EtagHasher:
+    """ Produces the same value as dcplib's S3Etag, but only accepts whole parts so it can be checkpointed. """
+
+    def __init__(self, state=None):
+        self._part_digests = [binascii.unhexlify(digest) for digest in (state or [])]
+
+    def update(self, part):
+        self._part_digests.append(hashlib.md5(part).digest())
+
+    def hexdigest(self):
+        if len(self._part_digests) > 1:
+            return f"{hashlib.md5(b''.join(self._part_digests)).hexdigest()}-{len(self._part_digests)}"
+        elif self._part_digests:
+            return binascii.hexlify(self._part_digests[0]).decode('ascii')
+        else:
+            return hashlib.md5().hexdigest()
+
+    def state(self):
+        return [binascii.hexlify(digest).decode('ascii') for digest in self._part_digests]
+
+
+class ResumableChecksummingSink:
+    """
+    Computes sha1, sha256, crc32c and s3_etag, and can export its progress as JSON-able state from
+    which another process can carry on.
+
+    Data must be written in whole multipart chunks (the last one may be short).  With pipelined=True
+    the hashes of each chunk are computed concurrently.
+    """
+
+    HASHERS = {
+        'sha1': lambda state: _OpenSSLHasher('sha1', state),
+        'sha256': lambda state: _OpenSSLHasher('sha256', state),
+        'crc32c': _Crc32cHasher,
+        's3_etag': _S3EtagHasher
+    }
+
+    def __init__(self, part_size, state=None, pipelined=False, hash_functions=tuple(HASHERS)):
+        if state and not all(name in state for name in hash_functions):
+            logger.warning(f"Saved state does not include all of {hash_functions}, starting from scratch")
+            state = None
+        state = state or {}
+        self.part_size = part_size
+        self.offset = state.get('offset', 0)
+        self._hashers = {name: self.HASHERS[name](state.get(name)) for name in hash_functions}
+        self._executor = ThreadPoolExecutor(max_workers=len(self._hashers)) if pipelined else None
+
+    @staticmethod
+    def is_supported():
+        return _LibCrypto.load() is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._executor:
+            self._executor.shutdown()
+
+    def write(self, part):
+        if self.offset % self.part_size != 0:
+            raise ValueError(f"cannot write after a short part (offset {self.offset})")
+        part = bytes(part)
+        if self._executor:
+            for future in [self._executor.submit(hasher.update, part) for hasher in self._hashers.values()]:
+                future.result()
+        else:
+            for hasher in self._hashers.values():
+                hasher.update(part)
+        self.offset += len(part)
+
+    def get_checksums(self):
+        return {name: hasher.hexdigest() for name, hasher in self._hashers.items()}
+
+    def state(self):
+        return dict(offset=self.offset, **{name: hasher.state() for name, hasher in self._hashers.items()})
+
+
+class ChecksumCheckpoint:
+    """
+    Persists the progress of a ResumableChecksummingSink to an S3 object, so a retried Batch job can
+    pick up where the last attempt stopped, even on another instance after a Spot interruption.
+
+    A checkpoint is only valid for the exact object contents it was taken from: it records the
+    object's etag, and load() discards it if the etag we are now checksumming is different.
+    """
+
+    FORMAT_VERSION = 1
+    KEY_PREFIX = "checkpoints/"
+
+    def __init__(self, bucket, s3_url, s3_etag, interval_seconds=60):
+        """
+        :param bucket: boto3 Bucket to keep checkpoints in.  Not an upload bucket: writing to one would
+                       produce S3 events for the checksum daemon.
+        """
+        self.bucket = bucket
+        self.s3_url = s3_url
+        self.s3_etag = s3_etag
+        self.interval_seconds = interval_seconds
+        self.key = self.KEY_PREFIX + hashlib.sha1(s3_url.encode('utf8')).hexdigest() + ".json"
+        self._last_saved_at = time.time()
+
+    def load(self, part_size):
+        """ Return the saved sink state, or None if there is no usable checkpoint. """
+        try:
+            checkpoint = json.loads(self.bucket.Object(self.key).get()['Body'].read())
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                logger.warning(f"Cannot read checkpoint {self.key}, starting from the beginning: {e}")
+            return None
+        except ValueError:
+            return None
+        if checkpoint.get('version') != self.FORMAT_VERSION \
+                or checkpoint.get('s3_url') != self.s3_url \
+                or checkpoint.get('s3_etag') != self.s3_etag \
+                or checkpoint.get('part_size') != part_size:
+            logger.info(f"Discarding stale checkpoint {self.key} for etag {checkpoint.get('s3_etag')}")
+            self.discard()
+            return None
+        logger.info(f"Resuming checksumming of {self.s3_url} from offset {checkpoint['state']['offset']}")
+        return checkpoint['state']
+
+    def save_if_due(self, sink):
+        if time.time() - self._last_saved_at >= self.interval_seconds:
+            self.save(sink)
+
+    def save(self, sink):
+        checkpoint = {
+            'version': self.FORMAT_VERSION,
+            's3_url': self.s3_url,
+            's3_etag': self.s3_etag,
+            'part_size': sink.part_size,
+            'state': sink.state()
+        }
+        # A PUT replaces the whole object or nothing, so an interrupted save leaves the previous checkpoint.
+        self.bucket.Object(self.key).put(Body=json.dumps(checkpoint).encode('utf8'),
+                                         ContentType="application/json")
+        self._last_saved_at = time.time()
+        logger.debug(f"Checkpointed {self.s3_url} at offset {sink.offset}")
+
+    def discard(self):
+        self.bucket.Object(self.key).delete()  # succeeds if there is no such object
@@ -12,6 +12,7 @@ from .client_side_checksum_handler import ClientSideChecksumHandler
 from .dss_checksums import DssChecksums
 from .exceptions import UploadException
 from .logging import get_logger
+from .upload_area_counts import UploadAreaCounts
 from .upload_config import UploadConfig
 from .uploaded_file import UploadedFile
 
@@ -71,12 +72,14 @@ class UploadArea:
         return f"s3://{self._bucket.name}/{self.key_prefix}"
 
     def update_or_create(self):
-        self._db_load()
-        if self.db_id:
-            self._db_update()
-        else:
-            self.status = "UNLOCKED"
-            self.db_id = self._db_create()
+        # An existing area keeps its status.
+        record = self.db.upsert_pg_record("upload_area", {
+            "uuid": self.uuid,
+            "bucket_name": self.bucket_name,
+            "status": "UNLOCKED"
+        }, conflict_columns=('uuid',), update_columns=('bucket_name',))
+        self.db_id = record['id']
+        self.status = record['status']
 
     def is_extant(self) -> bool:
         self._db_load()
@@ -163,9 +166,12 @@ class UploadArea:
                                   detail="Content-Type is missing parameter 'dcp-type',"
                                          " e.g. 'application/json; dcp-type=\"metadata/sample\"'.")
 
-        # Compute client-side checksums for the file being uploaded
-        checksum_handler = ClientSideChecksumHandler(data=content)
-        clientside_checksums = checksum_handler.get_checksum_metadata_tag()
+        # Compute all DSS checksums in a single pass over the body we already hold in memory.
+        # Only the client-side ones are stored as metadata; the rest are applied as tags below,
+        # so the object never has to be read back from S3.
+        checksum_handler = ClientSideChecksumHandler(data=content, checksum_names=DssChecksums.CHECKSUM_NAMES)
+        all_checksums = checksum_handler.get_checksum_metadata_tag()
+        clientside_checksums = {name: all_checksums[name] for name in DssChecksums.CLIENTSIDE_CHECKSUM_NAMES}
         file = UploadedFile.create(upload_area=self, checksums=clientside_checksums, name=filename,
                                    content_type=str(media_type), data=content)
         if file.recently_uploaded:
@@ -175,8 +181,7 @@ class UploadArea:
                                            status="CHECKSUMMING")
             checksum_event.create_record()
 
-            checksums = DssChecksums(s3_object=file.s3object)
-            checksums.compute(report_progress=True)
+            checksums = DssChecksums(s3_object=file.s3object, checksums=all_checksums)
             checksums.save_as_tags_on_s3_object()
             file.checksums = dict(checksums)
 
@@ -218,50 +223,34 @@ class UploadArea:
         key = f"{self.key_prefix}{filename}"
         return UploadedFile.from_s3_key(self, key)
 
+    def uploaded_files(self, filenames):
+        keys = [f"{self.key_prefix}{filename}" for filename in filenames]
+        return UploadedFile.from_s3_keys(self, keys)
+
     def retrieve_file_checksum_statuses_for_upload_area(self):
+        counts = UploadAreaCounts(self.db_id).read()
         checksum_status = {
-            'TOTAL_NUM_FILES': self.retrieve_file_count_for_upload_area(),
+            'TOTAL_NUM_FILES': counts[UploadAreaCounts.FILE_NAMES].get('', 0),
             'CHECKSUMMING': 0,
             'CHECKSUMMED': 0,
             'CHECKSUMMING_UNSCHEDULED': 0
         }
-        query_result = self.db.run_query_with_params(
-            "SELECT status, COUNT(DISTINCT checksum.file_id) "
-            "FROM checksum "
-            "INNER JOIN file ON checksum.file_id = file.id "
-            "WHERE file.upload_area_id = %s GROUP BY status;", (self.db_id,))
-        results = query_result.fetchall()
-        checksumming_file_count = 0
-        if results:
-            for status in results:
-                checksum_status[status[0]] = status[1]
-                checksumming_file_count += status[1]
+        checksum_status.update(counts[UploadAreaCounts.CHECKSUM_FILES])
+        checksumming_file_count = sum(counts[UploadAreaCounts.CHECKSUM_FILES].values())
         checksum_status['CHECKSUMMING_UNSCHEDULED'] = checksum_status['TOTAL_NUM_FILES'] - checksumming_file_count
         return checksum_status
 
     def retrieve_file_validation_statuses_for_upload_area(self):
-        query_result = self.db.run_query_with_params(
-            "SELECT status, COUNT(validation.id) "
-            "FROM validation "
-            "INNER JOIN validation_files ON validation.id = validation_files.validation_id  "
-            "INNER JOIN file ON validation_files.file_id = file.id "
-            "WHERE file.upload_area_id = %s GROUP BY status;", (self.db_id,))
-        results = query_result.fetchall()
         validation_status_dict = {
             'VALIDATING': 0,
             'VALIDATED': 0,
             'SCHEDULED': 0
         }
-        if results:
-            for status in results:
-                validation_status_dict[status[0]] = status[1]
+        validation_status_dict.update(UploadAreaCounts(self.db_id).read()[UploadAreaCounts.VALIDATION_FILES])
         return validation_status_dict
 
     def retrieve_file_count_for_upload_area(self):
-        query_result = self.db.run_query_with_params("SELECT COUNT(DISTINCT name) FROM file WHERE upload_area_id=%s",
-                                                     self.db_id)
-        results = query_result.fetchall()
-        return results[0][0]
+        return UploadAreaCounts(self.db_id).read()[UploadAreaCounts.FILE_NAMES].get('', 0)
 
     def _file_list(self):
         """ Returns a list UploadedFile objects representing files that exists in the current bucket."""
@@ -310,11 +299,6 @@ class UploadArea:
             data["id"] = self.db_id
         return data
 
-    def _db_create(self):
-        prop_vals_dict = self._db_serialize()
-        new_row_id = self.db.create_pg_record("upload_area", prop_vals_dict)
-        return new_row_id
-
     def _db_update(self):
         prop_vals_dict = self._db_serialize()
         self.db.update_pg_record("upload_area", prop_vals_dict)
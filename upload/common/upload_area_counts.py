@@ -0,0 +1,88 @@
+from .database import UploadDB
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class UploadAreaCounts:
+    """
+    How many files an upload area has, and how many of them are in each checksum and validation status.
+
+    Counting these from the file, checksum and validation tables takes time proportional to the size of the
+    area, so they are kept in the upload_area_count table instead, one row per (counter, status), and read
+    with one indexed lookup.  Database triggers (see migration a83f5c2d917e) update them in the transaction
+    that changes the underlying records, whatever code makes the change.
+
+        FILE_NAMES        distinct file names, status is ''
+        CHECKSUM_FILES    files with a checksum record in each status
+        VALIDATION_FILES  (validation, file) pairs whose validation is in each status
+
+    Triggers of concurrent transactions that change the same count wait for each other, so the counts
+    stay exact.  repair() recounts an area from scratch, e.g. after the triggers have been disabled.
+
+        UploadAreaCounts(upload_area.db_id).read()[UploadAreaCounts.CHECKSUM_FILES]  ->  {'CHECKSUMMED': 3}
+    """
+
+    FILE_NAMES = 'file_names'
+    CHECKSUM_FILES = 'checksum_files'
+    VALIDATION_FILES = 'validation_files'
+    COUNTERS = (FILE_NAMES, CHECKSUM_FILES, VALIDATION_FILES)
+
+    RECOUNT_QUERIES = [
+        "INSERT INTO upload_area_count (upload_area_id, counter, status, total) "
+        "SELECT %(upload_area_id)s, 'file_names', '', COUNT(DISTINCT name) "
+        "FROM file WHERE upload_area_id = %(upload_area_id)s;",
+
+        "INSERT INTO upload_area_count (upload_area_id, counter, status, total) "
+        "SELECT %(upload_area_id)s, 'checksum_files', checksum.status, COUNT(DISTINCT checksum.file_id) "
+        "FROM checksum INNER JOIN file ON checksum.file_id = file.id "
+        "WHERE file.upload_area_id = %(upload_area_id)s GROUP BY checksum.status;",
+
+        "INSERT INTO upload_area_count (upload_area_id, counter, status, total) "
+        "SELECT %(upload_area_id)s, 'validation_files', validation.status, COUNT(*) "
+        "FROM validation INNER JOIN validation_files ON validation.id = validation_files.validation_id "
+        "INNER JOIN file ON validation_files.file_id = file.id "
+        "WHERE file.upload_area_id = %(upload_area_id)s GROUP BY validation.status;",
+    ]
+
+    @classmethod
+    def repair_all(cls):
+        """ Recount every upload area, each in its own transaction. """
+        query_result = UploadDB().run_query("SELECT id FROM upload_area ORDER BY id;")
+        for row in query_result.fetchall():
+            cls(row[0]).repair()
+
+    def __init__(self, upload_area_db_id):
+        self.upload_area_db_id = upload_area_db_id
+        self._db = UploadDB()
+
+    def read(self):
+        """
+        :return: {counter: {status: count}} for every counter, leaving out statuses with a count of zero
+        """
+        counts = {counter: {} for counter in self.COUNTERS}
+        query_result = self._db.run_query_with_params(
+            "SELECT counter, status, total FROM upload_area_count WHERE upload_area_id = %s;",
+            (self.upload_area_db_id,))
+        for counter, status, total in query_result.fetchall():
+            if total:
+                counts[counter][status] = total
+        return counts
+
+    def repair(self):
+        """
+        Replace this area's counts with ones computed from its files, checksums and validations.
+        Deleting the old counts first makes triggers in concurrent transactions wait for us to commit,
+        after which they apply their changes, which we did not see, to the new counts.
+        :return: the counts as read() would, before and after the repair
+        """
+        before = self.read()
+        parameters = {'upload_area_id': self.upload_area_db_id}
+        with self._db.engine.begin() as connection:
+            connection.execute("DELETE FROM upload_area_count WHERE upload_area_id = %(upload_area_id)s;", parameters)
+            for query in self.RECOUNT_QUERIES:
+                connection.execute(query, parameters)
+        after = self.read()
+        if after != before:
+            logger.warning(f"Repaired counts of upload area {self.upload_area_db_id}: {before} -> {after}")
+        return before, after
@@ -1,22 +1,119 @@
+import json
+import os
+import threading
+import time
+
 from dcplib.config import Config
 
+from .logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class CachedConfig(Config):
+    """
+    A Config whose secret is fetched at most once every TTL_SECONDS per process.
+
+    dcplib's Config shares one copy of a secret between all instances of a class, so creating instances
+    in hot paths is cheap, but it keeps that copy for the life of the process: a warm Lambda never sees a
+    rotated secret.  Here the copy expires TTL_SECONDS after it was fetched and is fetched again on next
+    use.  refresh() fetches it now.  Configs given with set() (e.g. in tests) do not expire.
+
+    If fetching an expired copy fails, the error is logged and the expired copy is used for another
+    RETRY_SECONDS before the fetch is tried again, so a Secrets Manager outage neither takes down a warm
+    Lambda nor slows down every config read with a failing fetch.  Fetches are made under a lock, so
+    threads that find the copy expired at the same time fetch it once.
+
+    Every fetch, failed or not, is counted in fetch_count and, in a Lambda, reported as a SecretFetches
+    CloudWatch metric using the embedded metric format.  Failed fetches are also counted in
+    failed_fetch_count and reported as SecretFetchFailures.
+    """
+
+    TTL_SECONDS = 5 * 60
+    RETRY_SECONDS = 30
+    METRIC_NAMESPACE = 'UploadService'
+
+    fetch_count = 0
+    failed_fetch_count = 0
+    _expires_at = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        super().reset()
+        cls._expires_at = None
+
+    def set(self, config):
+        super().set(config)
+        self.__class__._expires_at = None
+
+    def load(self):
+        with CachedConfig._lock:
+            if not self.config_is_loaded():  # unless another thread fetched it while we waited
+                self._fetch()
+        return True
+
+    def refresh(self):
+        with CachedConfig._lock:
+            self._fetch()
+
+    def _fetch(self):
+        self.__class__.fetch_count += 1
+        try:
+            super().load()
+        except Exception as e:
+            self.__class__.failed_fetch_count += 1
+            self._report_fetch(failed=True)
+            if self.config is None:
+                raise
+            logger.error(f"Failed to fetch {self._component_name}/{self._secret_name} config,"
+                         f" using the expired copy for {self.RETRY_SECONDS}s: {e!r}")
+            self.__class__._expires_at = time.time() + self.RETRY_SECONDS
+            return
+        self.__class__._expires_at = time.time() + self.TTL_SECONDS
+        self._report_fetch(failed=False)
+
+    def config_is_loaded(self):
+        expires_at = self.__class__._expires_at
+        return super().config_is_loaded() and (expires_at is None or time.time() < expires_at)
+
+    def _report_fetch(self, failed):
+        if not failed:
+            logger.info(f"Fetched {self._component_name}/{self._secret_name} config"
+                        f" ({self.__class__.fetch_count} fetches in this process)")
+        if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+            print(json.dumps({
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': self.METRIC_NAMESPACE,
+                        'Dimensions': [['Secret']],
+                        'Metrics': [{'Name': 'SecretFetches', 'Unit': 'Count'},
+                                    {'Name': 'SecretFetchFailures', 'Unit': 'Count'}]
+                    }]
+                },
+                'Secret': self._secret_name,
+                'SecretFetches': 1,
+                'SecretFetchFailures': 1 if failed else 0
+            }))
+
 
-class UploadConfig(Config):
+class UploadConfig(CachedConfig):
 
     def __init__(self, *args, **kwargs):
         super().__init__('upload', **kwargs)
 
 
-class UploadDbConfig(Config):
+class UploadDbConfig(CachedConfig):
     def __init__(self, *args, **kwargs):
         super().__init__(component_name='upload', secret_name='database', **kwargs)
 
 
-class UploadOutgoingIngestAuthConfig(Config):
+class UploadOutgoingIngestAuthConfig(CachedConfig):
     def __init__(self, *args, **kwargs):
         super().__init__(component_name='upload', secret_name='outgoing_ingest_auth', **kwargs)
 
 
-class UploadVersion(Config):
+class UploadVersion(CachedConfig):
     def __init__(self, *args, **kwargs):
         super().__init__(component_name='upload', secret_name='upload_service_version', **kwargs)
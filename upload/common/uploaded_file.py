@@ -2,13 +2,13 @@ import os
 
 import boto3
 from botocore.exceptions import ClientError
-from sqlalchemy.sql import and_
 from tenacity import retry, stop_after_attempt, wait_fixed
 
 from .dss_checksums import DssChecksums
 from .exceptions import UploadException
 
 if not os.environ.get("CONTAINER"):
+    from sqlalchemy import tuple_
     from .database import UploadDB
 
 s3 = boto3.resource('s3')
@@ -49,6 +49,50 @@ class UploadedFile:
         s3object = s3.Bucket(upload_area.bucket_name).Object(s3_key)
         return cls(upload_area, s3object=s3object, recently_uploaded=False)
 
+    @classmethod
+    def from_s3_keys(cls, upload_area, s3_keys):
+        """
+        Like from_s3_key() for many files at once, but their DB records are looked up with one query
+        and any that are missing are created with one multi-row INSERT.  Records created concurrently by
+        someone else in the meantime are skipped by the INSERT and looked up again.
+        """
+        bucket = s3.Bucket(upload_area.bucket_name)
+        files = [cls(upload_area, s3object=bucket.Object(s3_key), load_db_record=False) for s3_key in s3_keys]
+        if not files:
+            return files
+        db = UploadDB()
+        records = cls._db_records_for_keys(db, [(file.s3_key, file.s3_etag) for file in files])
+        files_without_records = {}
+        for file in files:
+            record = records.get((file.s3_key, file.s3_etag))
+            if record:
+                file._apply_db_record(record)
+            else:
+                files_without_records.setdefault((file.s3_key, file.s3_etag), []).append(file)
+        new_records = []
+        for same_files in files_without_records.values():
+            checksums = same_files[0]._checksums_from_s3_object_tags()
+            for file in same_files:
+                file._properties['checksums'] = checksums
+            new_records.append(same_files[0]._db_serialize())
+        file_ids = db.create_pg_records('file', new_records, conflict_columns=('s3_key', 's3_etag'))
+        lost_keys = [key for key, file_id in zip(files_without_records, file_ids) if file_id is None]
+        records = cls._db_records_for_keys(db, lost_keys) if lost_keys else {}
+        for key, file_id in zip(files_without_records, file_ids):
+            for file in files_without_records[key]:
+                if file_id is None:
+                    file._apply_db_record(records[key])
+                else:
+                    file._properties['id'] = file_id
+        return files
+
+    @staticmethod
+    def _db_records_for_keys(db, keys):
+        """ :return: {(s3_key, s3_etag): record} for the file records with those keys """
+        table = db.table('file')
+        query = table.select().where(tuple_(table.columns['s3_key'], table.columns['s3_etag']).in_(keys))
+        return {(record['s3_key'], record['s3_etag']): record for record in db.run_query(query).fetchall()}
+
     @classmethod
     def from_db_id(cls, db_id):
         db = UploadDB()
@@ -59,11 +103,12 @@ class UploadedFile:
         s3object = upload_area.s3_object_for_file(file_props['name'])
         return cls(upload_area, s3object=s3object)
 
-    def __init__(self, upload_area, s3object, recently_uploaded=False):
+    def __init__(self, upload_area, s3object, recently_uploaded=False, load_db_record=True):
         """
         The object of init() is to:
         - populate properties from the S3 object
-        - create a DB record for this file of one does not exist
+        - create a DB record for this file of one does not exist (unless load_db_record is False,
+          in which case the caller must load or create it, see from_s3_keys())
         - initialize a DssChecksums object
         """
         self.upload_area = upload_area
@@ -92,7 +137,8 @@ class UploadedFile:
 
         self._db = UploadDB()
         e_tag = self.s3object.e_tag.strip('\"')
-        if self._db_load(self.s3object.key, e_tag) is None:
+        if load_db_record and self._db_load(self.s3object.key, e_tag) is None:
+            self._properties['checksums'] = self._checksums_from_s3_object_tags()
             self._db_create()
 
     def __str__(self):
@@ -201,21 +247,22 @@ class UploadedFile:
                 raise e
 
     def _populate_properties_from_s3_object(self):
-        checksums = DssChecksums(self.s3object)
         self._properties = {
             **self._properties,
             's3_key': self.s3object.key,
             's3_etag': self.s3object.e_tag.strip('\"'),
             'name': self.s3object.key[self.upload_area.key_prefix_length:],  # cut off upload-area-id/
-            'size': self.s3object.content_length,
-            'checksums': dict(checksums) if checksums.are_present() else None
+            'size': self.s3object.content_length
         }
 
+    def _checksums_from_s3_object_tags(self):
+        # Only needed when there is no DB record yet: otherwise the record's checksums are authoritative.
+        checksums = DssChecksums(self.s3object)
+        return dict(checksums) if checksums.are_present() else None
+
     def _db_load(self, s3_key, s3_etag):
-        sql_table = self._db.table('file')
-        query = sql_table.select().where(and_(sql_table.columns['s3_key'] == s3_key,
-                                              sql_table.columns['s3_etag'] == s3_etag))
-        result = self._db.run_query(query)
+        query = self._db.select_statement('file', 's3_key', 's3_etag')
+        result = self._db.run_select_statement(query, {'s3_key': s3_key, 's3_etag': s3_etag})
         rows = result.fetchall()
         if not rows:
             return None
@@ -223,21 +270,24 @@ class UploadedFile:
             raise UploadException(status=500, title=">1 match for File query",
                                   detail=f"{len(rows)} matched query for {s3_key} {s3_etag}")
         else:
-            if self.s3object:
-                # Sanity checks:
-                assert rows[0][result.keys().index('name')] == os.path.basename(s3_key)  # Yes, !Windows :)
-                assert rows[0][result.keys().index('size')] == self.s3object.content_length
-            self._properties = {
-                **self._properties,
-                'id': rows[0][result.keys().index('id')],
-                's3_key': s3_key,
-                's3_etag': s3_etag,
-                'name': rows[0][result.keys().index('name')],
-                'size': rows[0][result.keys().index('size')],
-                'checksums': rows[0][result.keys().index('checksums')]
-            }
+            self._apply_db_record(rows[0])
             return True
 
+    def _apply_db_record(self, record):
+        if self.s3object:
+            # Sanity checks:
+            assert record['name'] == os.path.basename(record['s3_key'])  # Yes, !Windows :)
+            assert record['size'] == self.s3object.content_length
+        self._properties = {
+            **self._properties,
+            'id': record['id'],
+            's3_key': record['s3_key'],
+            's3_etag': record['s3_etag'],
+            'name': record['name'],
+            'size': record['size'],
+            'checksums': record['checksums']
+        }
+
     def _db_serialize(self):
         prop_vals_dict = self._properties.copy()
         if prop_vals_dict['id'] is None:
@@ -245,8 +295,12 @@ class UploadedFile:
         return prop_vals_dict
 
     def _db_create(self):
+        # Another process may have created the record since we looked for it: if so, load that one.
         prop_vals_dict = self._db_serialize()
-        self._properties['id'] = self._db.create_pg_record("file", prop_vals_dict)
+        record = self._db.upsert_pg_record("file", prop_vals_dict,
+                                           conflict_columns=('s3_key', 's3_etag'), update_columns=())
+        self._properties['id'] = record['id']
+        self._properties['checksums'] = record['checksums']
 
     def _db_update(self):
         prop_vals_dict = self._db_serialize()
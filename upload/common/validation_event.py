@@ -63,9 +63,8 @@ class ValidationEvent:
     def create_record(self):
         prop_vals_dict = self._format_prop_vals_dict()
         self.db.create_pg_record("validation", prop_vals_dict)
-        for file_id in self.file_ids:
-            validation_files_props = {'file_id': file_id, 'validation_id': self.id}
-            self.db.create_pg_record("validation_files", validation_files_props)
+        self.db.create_pg_records("validation_files", [{'file_id': file_id, 'validation_id': self.id}
+                                                       for file_id in self.file_ids])
 
     def update_record(self):
         prop_vals_dict = self._format_prop_vals_dict()
@@ -3,6 +3,7 @@ import os
 import re
 import urllib.parse
 import uuid
+from collections import namedtuple, OrderedDict
 
 import boto3
 from tenacity import retry, wait_fixed, stop_after_attempt
@@ -15,7 +16,6 @@ from .upload_config import UploadConfig
 from .exceptions import UploadException
 from .logging import get_logger
 
-batch = boto3.client('batch')
 sqs = boto3.resource('sqs')
 # 1tb volume limit for staging files from s3 during validation process
 KB = 1000
@@ -23,6 +23,13 @@ MB = KB * KB
 GB = MB * KB
 TB = GB * KB
 MAX_FILE_SIZE_IN_BYTES = TB
+# Bulk validations are submitted as array jobs of up to this many children.  The manifest describing them
+# travels in the job's environment, and SubmitJob requests are limited to 30 KiB.
+MAX_ARRAY_JOB_SIZE = 10000
+MAX_MANIFEST_BYTES = 20 * KB
+
+# A validation waiting in the validation queue to be scheduled.
+QueuedValidation = namedtuple('QueuedValidation', ['scheduler', 'validation_id', 'docker_image', 'env', 'orig_val_id'])
 
 logger = get_logger(__name__)
 
@@ -86,6 +93,83 @@ class ValidationScheduler:
 
     def schedule_batch_validation(self, validation_id: str, docker_image: str, env: dict, orig_val_id=None) -> str:
         job_defn = self._find_or_create_job_definition_for_image(docker_image)
+        env = self._job_environment(validation_id, env, orig_val_id)
+        command = ['/validator']
+        for file_s3_loc in self.file_s3_locations:
+            command.append(file_s3_loc)
+        logger.info(f"scheduling batch job with {env}")
+        self.batch_job_id = self._enqueue_batch_job(job_defn, command, env, validation_id)
+        self._update_validation_event(docker_image, validation_id, orig_val_id)
+        return validation_id
+
+    @classmethod
+    def schedule_batch_validations(cls, validations: list) -> list:
+        """
+        Schedule many QueuedValidations at once.  Returns those that could not be scheduled.
+
+        Validations that use the same validator image are submitted together as AWS Batch array jobs,
+        saving a submit_job call per validation.  Child N of an array job validates entry N of the job's
+        manifest, which is passed in the VALIDATION_MANIFEST environment variable (see ValidatorHarness).
+        """
+        validations_by_image = OrderedDict()
+        for validation in validations:
+            validations_by_image.setdefault(validation.docker_image, []).append(validation)
+        unscheduled = []
+        for docker_image, validations_using_image in validations_by_image.items():
+            for group in cls._manifest_sized_groups(validations_using_image):
+                try:
+                    if len(group) == 1:
+                        validation = group[0]
+                        validation.scheduler.schedule_batch_validation(validation.validation_id, docker_image,
+                                                                       validation.env, validation.orig_val_id)
+                    else:
+                        cls._schedule_array_validation(docker_image, group)
+                except Exception as e:
+                    logger.exception(f"Failed to schedule {len(group)} validations using {docker_image}: {e}")
+                    unscheduled.extend(group)
+        return unscheduled
+
+    @classmethod
+    def _manifest_sized_groups(cls, validations):
+        group, group_bytes = [], 0
+        for validation in validations:
+            entry_bytes = len(json.dumps(validation.scheduler._manifest_entry(validation)))
+            if group and (len(group) == MAX_ARRAY_JOB_SIZE or group_bytes + entry_bytes > MAX_MANIFEST_BYTES):
+                yield group
+                group, group_bytes = [], 0
+            group.append(validation)
+            group_bytes += entry_bytes
+        if group:
+            yield group
+
+    @classmethod
+    def _schedule_array_validation(cls, docker_image, validations):
+        leader = validations[0].scheduler
+        job_defn = leader._find_or_create_job_definition_for_image(docker_image)
+        manifest = [validation.scheduler._manifest_entry(validation) for validation in validations]
+        env = {
+            'DEPLOYMENT_STAGE': os.environ['DEPLOYMENT_STAGE'],
+            'API_HOST': os.environ['API_HOST'],
+            'CONTAINER': 'DOCKER',
+            'VALIDATION_MANIFEST': json.dumps(manifest)
+        }
+        logger.info(f"scheduling batch array job of {len(validations)} validations using {docker_image}")
+        job_id = leader._enqueue_batch_job(job_defn, ['/validator'], env, validations[0].validation_id,
+                                           array_size=len(validations))
+        for index, validation in enumerate(validations):
+            validation.scheduler.batch_job_id = f"{job_id}:{index}"  # the ID Batch gives the child job
+            validation.scheduler._update_validation_event(docker_image, validation.validation_id,
+                                                          validation.orig_val_id)
+
+    def _manifest_entry(self, validation):
+        return {
+            's3_urls': self.file_s3_locations,
+            'environment': self._job_environment(validation.validation_id, dict(validation.env),
+                                                 validation.orig_val_id)
+        }
+
+    @staticmethod
+    def _job_environment(validation_id, env, orig_val_id):
         env['DEPLOYMENT_STAGE'] = os.environ['DEPLOYMENT_STAGE']
         env['API_HOST'] = os.environ['API_HOST']
         env['CONTAINER'] = 'DOCKER'
@@ -96,13 +180,7 @@ class ValidationScheduler:
             env['VALIDATION_ID'] = orig_val_id
         else:
             env['VALIDATION_ID'] = validation_id
-        command = ['/validator']
-        for file_s3_loc in self.file_s3_locations:
-            command.append(file_s3_loc)
-        logger.info(f"scheduling batch job with {env}")
-        self.batch_job_id = self._enqueue_batch_job(job_defn, command, env, validation_id)
-        self._update_validation_event(docker_image, validation_id, orig_val_id)
-        return validation_id
+        return env
 
     def _create_validation_event(self, validator_docker_image, validation_id, orig_val_id, status="SCHEDULING_QUEUED"):
         validation_event = ValidationEvent(file_ids=self.file_db_ids,
@@ -124,25 +202,23 @@ class ValidationScheduler:
         return validation_event
 
     def _find_or_create_job_definition_for_image(self, validator_docker_image):
-        job_defn = JobDefinition(docker_image=validator_docker_image, deployment=os.environ['DEPLOYMENT_STAGE'])
-        if job_defn.load():
-            return job_defn
-        else:
-            job_defn.create(job_role_arn=self.config.validation_job_role_arn)
-        return job_defn
+        return JobDefinition.find_or_create_cached(docker_image=validator_docker_image,
+                                                   deployment=os.environ['DEPLOYMENT_STAGE'],
+                                                   job_role_arn=self.config.validation_job_role_arn)
 
     @retry_on_aws_too_many_requests
-    def _enqueue_batch_job(self, job_defn, command, environment, validation_id):
+    def _enqueue_batch_job(self, job_defn, command, environment, validation_id, array_size=None):
         job_name = "-".join(["validation", os.environ['DEPLOYMENT_STAGE'], self.upload_area_uuid, validation_id])
         job_name = re.sub(self.JOB_NAME_ALLOWABLE_CHARS, "", job_name)[0:128]
-        job = batch.submit_job(
+        array_properties = {'arrayProperties': {'size': array_size}} if array_size else {}
+        job = job_defn.submit_job(
             jobName=job_name,
             jobQueue=self.config.validation_job_q_arn,
-            jobDefinition=job_defn.arn,
             containerOverrides={
                 'command': command,
                 'environment': [dict(name=k, value=v) for k, v in environment.items()]
-            }
+            },
+            **array_properties
         )
         print(f"Enqueued job {job['jobId']} to validate {self.file_keys} "
               f"using job definition {job_defn.arn}:")
@@ -1,35 +1,87 @@
 #!/usr/bin/env python
 
 import argparse
+import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from urllib3.util import parse_url
 
 import boto3
 
+from upload.common.batch import JobDefinition
 from upload.common.logging import get_logger
 from upload.common.dss_checksums import DssChecksums
+from upload.common.resumable_checksumming import ChecksumCheckpoint
 from upload.common.checksum_event import ChecksumEvent
 from upload.common.upload_api_client import update_event
 from upload.common.upload_config import UploadConfig
 
 logger = get_logger(f"CHECKSUMMER [{os.environ.get('AWS_BATCH_JOB_ID')}]")
 
+KB = 1024
+MB = KB * KB
+GB = MB * KB
+
 
 class Checksummer:
 
-    def __init__(self, argv):
+    # Batch jobs get 4 vCPUs and ~15GB of memory (see JobDefinition.create), so we can afford
+    # more connections, a bigger reorder buffer and a thread per hash function.
+    READ_CONCURRENCY = 16
+    MAX_BUFFERED_BYTES = 4 * GB
+    # Batch retries failed jobs (see JobDefinition.create), often on another instance after a Spot interruption.
+    # Progress is checkpointed to the $CSUM_CHECKPOINT_BUCKET bucket so a retry does not start again from byte 0.
+    CHECKPOINT_INTERVAL_SECONDS = 60
+    # In manifest mode this many files are checksummed at once, sharing the read concurrency and buffer.
+    MANIFEST_CONCURRENCY = 4
+
+    def __init__(self, argv, share=1):
+        """
+        Checksum one file, or with --manifest, every file in a JSON list of
+        {"s3_url": ..., "s3_etag": ..., "checksum_id": ..., "audit_checksums": ...}, the last of which is optional.
+        share is the number of files being checksummed concurrently in this container.
+        """
         self.bucket_name = None
         self.s3_object_key = None
         self.upload_area_id = None
         self.file_name = None
+        self.share = share
         UploadConfig.use_env = True  # AWS Secrets are not available to batch jobs, use environment
         self._parse_args(argv)
+        if self.args.manifest:
+            self._checksum_manifest(json.loads(self.args.manifest))
+        else:
+            self._checksum_file()
+
+    def _checksum_manifest(self, manifest):
+        logger.info(f"Checksumming {len(manifest)} files from manifest")
+        concurrency = min(self.MANIFEST_CONCURRENCY, len(manifest))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(self._checksum_manifest_entry, entry, concurrency): entry for entry in manifest}
+        failures = [entry['s3_url'] for future, entry in futures.items() if future.exception()]
+        if failures:
+            # Let Batch retry the job: files that were finished are tagged and will be skipped next time.
+            raise RuntimeError(f"Failed to checksum {len(failures)} of {len(manifest)} files: {failures}")
+
+    def _checksum_manifest_entry(self, entry, share):
+        argv = [entry['s3_url'], entry['s3_etag'], '--checksum-id', entry['checksum_id']]
+        if entry.get('audit_checksums'):
+            argv += ['--audit-checksums', json.dumps(entry['audit_checksums'])]
+        if self.args.test:
+            argv.append('--test')
+        try:
+            Checksummer(argv, share=share)
+        except Exception as e:
+            logger.exception(f"Failed to checksum {entry['s3_url']}: {e}")
+            raise
+
+    def _checksum_file(self):
         s3 = boto3.resource('s3')
         s3obj = s3.Bucket(self.bucket_name).Object(self.s3_object_key)
         self.checksums = DssChecksums(s3obj)
 
-        self.checksum_event = ChecksumEvent(checksum_id=os.environ['CHECKSUM_ID'],
+        self.checksum_event = ChecksumEvent(checksum_id=self.args.checksum_id or os.environ['CHECKSUM_ID'],
                                             job_id=os.environ['AWS_BATCH_JOB_ID'])
 
         if self._object_contents_are_not_what_we_expect(s3obj):
@@ -43,17 +95,34 @@ class Checksummer:
         else:
             logger.info(f"Checksumming {self.s3_object_key}...")
             self._update_checksum_event(status="CHECKSUMMING")
-            self.checksums.compute(report_progress=True)
-            self.checksums.save_as_tags_on_s3_object()
+            try:
+                self.checksums.compute(report_progress=True,
+                                       concurrency=max(1, self.READ_CONCURRENCY // self.share),
+                                       max_buffered_bytes=self.MAX_BUFFERED_BYTES // self.share,
+                                       pipelined=True,
+                                       checkpoint=self._checkpoint())
+                self.checksums.save_as_tags_on_s3_object()
+            except Exception:
+                if self._is_last_attempt():
+                    self._update_checksum_event(status="FAILED")  # so the Upload API releases the checksum claim
+                raise
             self._update_checksum_event(status="CHECKSUMMED")
             logger.info(f"Checksums {dict(self.checksums)} used to tag file {self.s3_object_key}")
 
     def _parse_args(self, argv):
         parser = argparse.ArgumentParser()
-        parser.add_argument('s3_url', metavar="S3_URL", help="S3 URL of file to checksum")
-        parser.add_argument('s3_etag', metavar="S3_ETAG", help="Expected Etag of file we are checksumming")
+        parser.add_argument('s3_url', metavar="S3_URL", nargs='?', help="S3 URL of file to checksum")
+        parser.add_argument('s3_etag', metavar="S3_ETAG", nargs='?', help="Expected Etag of file we are checksumming")
+        parser.add_argument('--checksum-id', help="ID of the checksum event to update (default: $CHECKSUM_ID)")
+        parser.add_argument('--manifest', help="JSON list of files to checksum, instead of S3_URL and S3_ETAG")
+        parser.add_argument('--audit-checksums', help="JSON checksums the daemon would have reused, "
+                                                      "reported back with ours for the Upload API to compare")
         parser.add_argument('-t', '--test', action='store_true', help="Test only, do not submit results to Upload API")
         self.args = parser.parse_args(args=argv)
+        if self.args.manifest:
+            return
+        if not (self.args.s3_url and self.args.s3_etag):
+            parser.error("S3_URL and S3_ETAG are required unless --manifest is given")
         url_bits = parse_url(self.args.s3_url)
         if url_bits.scheme != 's3':
             raise RuntimeError(f"This is not an S3 URL: {self.args.s3_url}")
@@ -66,15 +135,32 @@ class Checksummer:
             url=self.args.s3_url, bucket=self.bucket_name, key=self.s3_object_key, area=self.upload_area_id,
             filename=self.file_name))
 
+    def _checkpoint(self):
+        bucket_name = os.environ.get('CSUM_CHECKPOINT_BUCKET')
+        if not bucket_name:
+            return None
+        return ChecksumCheckpoint(bucket=boto3.resource('s3').Bucket(bucket_name),
+                                  s3_url=self.args.s3_url,
+                                  s3_etag=self.args.s3_etag,
+                                  interval_seconds=self.CHECKPOINT_INTERVAL_SECONDS)
+
+    @staticmethod
+    def _is_last_attempt():
+        """ Batch will not retry this job if it fails.  Assumed so outside Batch. """
+        return int(os.environ.get('AWS_BATCH_JOB_ATTEMPT', JobDefinition.ATTEMPTS)) >= JobDefinition.ATTEMPTS
+
     def _object_contents_are_not_what_we_expect(self, s3obj):
         return s3obj.e_tag.strip('\"') != self.args.s3_etag
 
     def _update_checksum_event(self, status):
         self.checksum_event.status = status
+        payload = {'upload_area_id': self.upload_area_id,
+                   'name': self.file_name,
+                   'checksums': dict(self.checksums)}
+        if status == "CHECKSUMMED" and self.args.audit_checksums:
+            payload['audit_checksums'] = json.loads(self.args.audit_checksums)
         if not self.args.test:
-            update_event(self.checksum_event, {'upload_area_id': self.upload_area_id,
-                                               'name': self.file_name,
-                                               'checksums': dict(self.checksums)})
+            update_event(self.checksum_event, payload)
 
 
 if __name__ == '__main__':
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 import pathlib
@@ -29,10 +30,22 @@ class ValidatorHarness:
         self.staging_folder = staging_folder or self.DEFAULT_STAGING_AREA
         self.version = self._find_version()
         self.job_id = os.environ['AWS_BATCH_JOB_ID']
+        if not self.s3_file_urls and 'AWS_BATCH_JOB_ARRAY_INDEX' in os.environ:
+            self._load_array_job_manifest_entry()
         self.validation_id = os.environ['VALIDATION_ID']
         self._log(f"VALIDATOR STARTING version={self.version}, job_id={self.job_id}, "
                   f"validation_id={self.validation_id} attempt={os.environ['AWS_BATCH_JOB_ATTEMPT']}")
 
+    def _load_array_job_manifest_entry(self):
+        """
+        Bulk validations are scheduled as array jobs (see ValidationScheduler.schedule_batch_validations).
+        Each child finds its files and environment in the manifest entry with its array index.
+        """
+        index = int(os.environ['AWS_BATCH_JOB_ARRAY_INDEX'])
+        entry = json.loads(os.environ['VALIDATION_MANIFEST'])[index]
+        os.environ.update(entry['environment'])
+        self.s3_file_urls = entry['s3_urls']
+
     def validate(self, test_only=False):
         self._log("VERSION {version}, attempt {attempt} with argv: {argv}".format(
             version=self.version, attempt=os.environ['AWS_BATCH_JOB_ATTEMPT'], argv=sys.argv))
@@ -7,7 +7,9 @@ from ....common.validation_scheduler import ValidationScheduler
 from ....common.upload_area import UploadArea
 from ....common.uploaded_file import UploadedFile
 from ....common.dss_checksums import DssChecksums
+from ....common.checksum_claim import ChecksumClaim
 from ....common.checksum_event import ChecksumEvent
+from ....common.checksum_reuse import ChecksumReuse
 from ....common.validation_event import ValidationEvent
 from ....common.exceptions import UploadException
 from ....common.ingest_notifier import IngestNotifier
@@ -85,11 +87,8 @@ def schedule_validation(upload_area_uuid: str, json_request_body: str):
     orig_val_id = body.get('original_validation_id')
     image = body['validator_image']
     env = body['environment'] if 'environment' in body else {}
-    files = []
     file_names = body['files']
-    for file_name in file_names:
-        unquoted_file_name = urllib.parse.unquote(file_name)
-        files.append(upload_area.uploaded_file(unquoted_file_name))
+    files = upload_area.uploaded_files([urllib.parse.unquote(file_name) for file_name in file_names])
     validation_scheduler = ValidationScheduler(upload_area_uuid, files)
     if not validation_scheduler.check_files_can_be_validated():
         raise UploadException(status=requests.codes.bad_request, title="File too large for validation")
@@ -138,18 +137,29 @@ def update_checksum_event(upload_area_uuid: str, checksum_id: str, body: str):
     checksum_event.status = body['status']
     checksum_event.job_id = body['job_id']
 
-    if checksum_event.status == "CHECKSUMMED":
+    if checksum_event.status in ("FAILED", "ABORTED"):
+        uploaded_file = UploadedFile.from_db_id(checksum_event.file_id)
+        ChecksumClaim.release_by_key(uploaded_file.s3_key, uploaded_file.s3_etag)  # let a new event claim it
+    elif checksum_event.status == "CHECKSUMMED":
         uploaded_file = UploadedFile.from_db_id(checksum_event.file_id)
         uploaded_file.checksums = payload['checksums']
+        ChecksumReuse.compare(uploaded_file.s3_key, payload['checksums'], payload.get('audit_checksums'))
+        reuploaded = ChecksumClaim.release_by_key(uploaded_file.s3_key, uploaded_file.s3_etag)
 
         """
         Do a last minute check to see if the S3 object for this file still has checksum
         tags.  The tags are erased if the file is overwritten, which happens a lot as
         Ingest tends to upload the same file multiple times simultaneously.  If the
         checksums are gone don't notify Ingest.  Some other checksummer kicked off by
-        the new upload will take care of that.
+        the new upload will take care of that, unless the new upload had identical
+        contents: the checksum daemon coalesced its event into this job, so re-tag here.
         """
-        if DssChecksums(s3_object=uploaded_file.s3object).are_present():
+        checksums = DssChecksums(s3_object=uploaded_file.s3object)
+        checksums.refresh()  # bypass the tag cache: an identical overwrite erases tags but keeps the etag
+        if not checksums.are_present() and reuploaded:
+            checksums = DssChecksums(s3_object=uploaded_file.s3object, checksums=payload['checksums'])
+            checksums.save_as_tags_on_s3_object()
+        if checksums.are_present():
             _notify_ingest(checksum_event.file_id, uploaded_file.info(), "file_uploaded")
     checksum_event.update_record()
 
@@ -187,10 +197,7 @@ def file_info(upload_area_uuid: str, filename: str):
 def files_info(upload_area_uuid: str, body: str):
     filename_list = json.loads(body)
     upload_area = _load_upload_area(upload_area_uuid)
-    response_data = []
-    for filename in filename_list:
-        uploaded_file = upload_area.uploaded_file(filename)
-        response_data.append(uploaded_file.info())
+    response_data = [uploaded_file.info() for uploaded_file in upload_area.uploaded_files(filename_list)]
     return response_data, requests.codes.ok
 
 
@@ -1,18 +1,26 @@
+import collections
+import copy
 import json
 import os
 import re
+import statistics
 import time
 import uuid
 
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
 from six.moves import urllib
 
 from ...common.batch import JobDefinition
+from ...common.checksum_claim import ChecksumClaim
 from ...common.checksum_event import ChecksumEvent
+from ...common.checksum_reuse import ChecksumReuse
 from ...common.database_orm import DBSessionMaker, DbChecksum
 from ...common.dss_checksums import DssChecksums
 from ...common.ingest_notifier import IngestNotifier
 from ...common.logging import get_logger
+from ...common.parallel_s3_reader import ParallelS3Reader
 from ...common.retry import retry_on_aws_too_many_requests
 from ...common.upload_area import UploadArea
 from ...common.upload_config import UploadConfig, UploadVersion
@@ -23,7 +31,7 @@ KB = 1024
 MB = KB * KB
 GB = MB * KB
 
-batch = boto3.client('batch')
+sqs = boto3.client('sqs')
 
 
 class ChecksumDaemon:
@@ -33,9 +41,32 @@ class ChecksumDaemon:
         'ObjectCreated:CompleteMultipartUpload',
         'ObjectCreated:Copy'
     )
-    USE_BATCH_IF_FILE_LARGER_THAN = 10 * GB
+    DEFERRED_NOTIFICATION_EVENT = 'UploadService:NotifyIngest'
+
+    # Files are checksummed inline if we expect to finish within the Lambda's remaining time, else in Batch.
+    # The estimate uses the median throughput of recent inline runs in this Lambda container.
+    ASSUMED_BYTES_PER_SECOND = 50 * MB  # until we have measured anything
+    MIN_BYTES_TO_MEASURE = 16 * MB  # smaller files' throughput is dominated by request latency
+    INLINE_SAFETY_FACTOR = 1.5
+    RESERVED_MILLIS = 30 * 1000  # for tagging, DB updates, notifying Ingest, or handing off to Batch
+    MIN_SECONDS_BEFORE_HANDOFF = 10  # don't judge an inline run on its first few parts
+    _recent_bytes_per_second = collections.deque(maxlen=20)
+
+    # Files that must be checksummed in Batch are collected while consuming a batch of events and then
+    # submitted together, up to this many per job, so that they share one container's start-up costs.
+    MAX_FILES_PER_MANIFEST = 10
+    # SQS messages in one Lambda invocation are processed concurrently, up to this many at once.
+    # Messages being checksummed at the same time share these S3 read connections and buffer between them.
+    MAX_CONCURRENT_MESSAGES = 8
+    READ_CONCURRENCY = ParallelS3Reader.DEFAULT_CONCURRENCY
+    MAX_BUFFERED_BYTES = ParallelS3Reader.DEFAULT_MAX_BUFFERED_BYTES
+
+    class InlineChecksummingFellBehind(Exception):
+        pass
 
     def __init__(self, context):
+        self.context = context
+        self.share = 1  # the number of daemons consuming events concurrently in this process, see _fork()
         self.request_id = context.aws_request_id
         logger.debug(f"Ahm ahliiivvve! request_id={self.request_id}")
         self.config = UploadConfig()
@@ -44,35 +75,122 @@ class ChecksumDaemon:
         self._read_environment()
         self.upload_area = None
         self.uploaded_file = None
+        self._files_awaiting_batch = []
+        self._reuse_audits = {}  # s3url -> checksums ChecksumReuse is auditing, for files awaiting Batch
 
     def _read_environment(self):
         self.deployment_stage = os.environ['DEPLOYMENT_STAGE']
         self.docker_image = os.environ['CSUM_DOCKER_IMAGE']
         self.api_host = os.environ["API_HOST"]
+        self.checkpoint_bucket = os.environ.get('CSUM_CHECKPOINT_BUCKET')
+        self.reuse_audit_fraction = float(os.environ.get('CSUM_REUSE_AUDIT_FRACTION',
+                                                         ChecksumReuse.DEFAULT_AUDIT_FRACTION))
+
+    def consume_sqs_messages(self, messages):
+        """
+        Consume the S3 events in a batch of SQS messages.  Returns the messageIds of the messages that
+        could not be processed, so that only those are retried.
+        """
+        concurrency = max(1, min(self.MAX_CONCURRENT_MESSAGES, len(messages)))
+        workers = {message['messageId']: self._fork(share=concurrency) for message in messages}
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(workers[message['messageId']]._consume_events, json.loads(message['body'])):
+                       message['messageId'] for message in messages}
+        failed_message_ids = set()
+        files_from_message = {}
+        for future, message_id in futures.items():
+            if future.exception():
+                logger.error(f"Failed to process message {message_id}: {future.exception()!r}")
+                failed_message_ids.add(message_id)
+            # Files claimed before a failure are submitted too, else nothing would release their claims.
+            for uploaded_file in workers[message_id]._files_awaiting_batch:
+                files_from_message[uploaded_file.s3url] = message_id
+                self._files_awaiting_batch.append(uploaded_file)
+            self._reuse_audits.update(workers[message_id]._reuse_audits)
+        for uploaded_file in self._submit_batch_checksumming():
+            failed_message_ids.add(files_from_message[uploaded_file.s3url])
+        return [message_id for message_id in workers if message_id in failed_message_ids]
 
     def consume_events(self, events):
+        try:
+            self._consume_events(events)
+        finally:
+            # Files claimed before a failure are submitted too, else nothing would release their claims.
+            unsubmitted_files = self._submit_batch_checksumming()
+        if unsubmitted_files:
+            raise RuntimeError(f"Failed to schedule checksumming of {[f.s3_key for f in unsubmitted_files]}")
+
+    def _consume_events(self, events):
         for event in events['Records']:
             if event['eventName'] in self.RECOGNIZED_S3_EVENTS:
                 self._consume_event(event)
+            elif event['eventName'] == self.DEFERRED_NOTIFICATION_EVENT:
+                self._consume_deferred_notification(event)
             else:
                 logger.warning(f"Unexpected event: {event['eventName']}")
 
+    def _fork(self, share):
+        """ A daemon sharing this one's configuration, but with its own per-event state, to use on another thread. """
+        worker = copy.copy(self)
+        worker.share = share
+        worker.upload_area = None
+        worker.uploaded_file = None
+        worker._files_awaiting_batch = []
+        worker._reuse_audits = {}
+        return worker
+
     def _consume_event(self, event):
         file_key = event['s3']['object']['key']
         self._get_file_record(file_key)
+        if self._event_is_superseded(event):
+            return
 
         if self.uploaded_file.checksums:
             checksums = DssChecksums(s3_object=self.uploaded_file.s3object, checksums=self.uploaded_file.checksums)
             checksums.save_as_tags_on_s3_object()
             self._notify_ingest()
         else:
-            if self._file_is_small_enough_to_checksum_inline():
-                checksums = self._compute_checksums()
-                checksums.save_as_tags_on_s3_object()
-                self.uploaded_file.checksums = dict(checksums)  # saves to DB
-                self._notify_ingest()
-            else:
-                self._schedule_checksumming()
+            claim = ChecksumClaim(self.uploaded_file.s3_key, self.uploaded_file.s3_etag,
+                                  event['s3']['object'].get('sequencer'))
+            if claim.acquire():
+                try:
+                    self._checksum_claimed_file(claim)
+                except Exception:
+                    claim.release()  # so that a retry of this event is not mistaken for a duplicate
+                    raise
+
+    def _event_is_superseded(self, event):
+        """
+        The object may have been overwritten with different contents since this event was sent.
+        The event for the newer version will take care of it, so don't read the old one's bytes.
+        """
+        event_etag = event['s3']['object'].get('eTag')
+        if event_etag and event_etag.strip('"') != self.uploaded_file.s3_etag:
+            logger.info(f"Ignoring event for {self.uploaded_file.s3_key} etag {event_etag}: "
+                        f"superseded by etag {self.uploaded_file.s3_etag}")
+            return True
+        return False
+
+    def _checksum_claimed_file(self, claim):
+        reuse = ChecksumReuse(self.uploaded_file, audit_fraction=self.reuse_audit_fraction)
+        reused_checksums = reuse.find()
+        if reused_checksums:
+            checksums = self._apply_reused_checksums(reused_checksums)
+        elif self._file_is_small_enough_to_checksum_inline():
+            checksums = self._compute_checksums()
+            if checksums is None:
+                self._schedule_checksumming(claim, reuse.audited_checksums)
+                return
+            reuse.audit(checksums)
+            checksums.save_as_tags_on_s3_object()
+            self.uploaded_file.checksums = dict(checksums)  # saves to DB
+        else:
+            self._schedule_checksumming(claim, reuse.audited_checksums)
+            return
+        if claim.release():
+            logger.info(f"{self.uploaded_file.s3_key} was re-uploaded while being checksummed, re-applying tags")
+            checksums.save_as_tags_on_s3_object()
+        self._notify_ingest()
 
     def _get_file_record(self, file_key):
         logger.debug(f"file_key={file_key}")
@@ -85,33 +203,82 @@ class ChecksumDaemon:
         logger.debug(f"UploadedFile checksums={self.uploaded_file.checksums}")
 
     def _file_is_small_enough_to_checksum_inline(self):
-        return self.uploaded_file.size <= self.USE_BATCH_IF_FILE_LARGER_THAN
+        bytes_per_second = self._estimated_bytes_per_second()
+        predicted_seconds = self.uploaded_file.size / bytes_per_second * self.INLINE_SAFETY_FACTOR
+        available_seconds = self._inline_time_budget_seconds()
+        logger.info(f"Checksumming {self.uploaded_file.size} bytes at {bytes_per_second / MB:.1f} MB/s "
+                    f"should take {predicted_seconds:.1f}s, we have {available_seconds:.1f}s")
+        return predicted_seconds <= available_seconds
+
+    @classmethod
+    def _estimated_bytes_per_second(cls):
+        if not cls._recent_bytes_per_second:
+            return cls.ASSUMED_BYTES_PER_SECOND
+        return statistics.median(cls._recent_bytes_per_second)
+
+    @classmethod
+    def _record_throughput(cls, size, seconds):
+        if size >= cls.MIN_BYTES_TO_MEASURE and seconds > 0:
+            cls._recent_bytes_per_second.append(size / seconds)
+
+    def _inline_time_budget_seconds(self):
+        return (self.context.get_remaining_time_in_millis() - self.RESERVED_MILLIS) / 1000
+
+    def _inline_progress_watchdog(self, start_time, available_seconds):
+        size = self.uploaded_file.size
+
+        def check_progress(bytes_checksummed):
+            elapsed = time.time() - start_time
+            if elapsed < self.MIN_SECONDS_BEFORE_HANDOFF or bytes_checksummed >= size:
+                return
+            projected_seconds = elapsed * size / bytes_checksummed
+            if projected_seconds > available_seconds:
+                raise self.InlineChecksummingFellBehind(
+                    f"{bytes_checksummed} of {size} bytes in {elapsed:.1f}s, "
+                    f"projected {projected_seconds:.1f}s but only {available_seconds:.1f}s available")
+        return check_progress
 
-    def _notify_ingest(self):
-        self._check_content_type()
+    # If the file's content_type doesn't have a 'dcp-type' suffix, re-check it a few times to see if it acquires
+    # one.  Due to AWSCLI/S3 failing to correctly apply content_type, we occasionally have to add it after the fact.
+    # Rather than sleep in the Lambda, each re-check is a delayed message on our own queue.
+    # If it doesn't appear, proceed anyway.
+    CHECK_CONTENT_TYPE_INTERVAL = 6
+    CHECK_CONTENT_TYPE_TIMES = 5
+
+    def _notify_ingest(self, content_type_checks_left=CHECK_CONTENT_TYPE_TIMES):
+        if '; dcp-type=' not in self.uploaded_file.content_type:
+            if content_type_checks_left > 0:
+                self._defer_notification(content_type_checks_left)
+                return
+            logger.warning(f"Still no dcp-type in content_type of file {self.uploaded_file.s3_key} after "
+                           f"{self.CHECK_CONTENT_TYPE_TIMES * self.CHECK_CONTENT_TYPE_INTERVAL}s")
         file_info = self.uploaded_file.info()
         notifier = IngestNotifier('file_uploaded', file_id=self.uploaded_file.db_id)
         status = notifier.format_and_send_notification(file_info)
         logger.info(f"Notified Ingest: file_info={file_info}, status={status}")
 
-    CHECK_CONTENT_TYPE_INTERVAL = 6
-    CHECK_CONTENT_TYPE_TIMES = 5
+    def _defer_notification(self, content_type_checks_left):
+        logger.debug(f"No dcp-type in content_type of file {self.uploaded_file.s3_key},"
+                     f" checking {content_type_checks_left} more times")
+        payload = {
+            'Records': [{
+                'eventName': self.DEFERRED_NOTIFICATION_EVENT,
+                's3': {
+                    'bucket': {'name': self.uploaded_file.upload_area.bucket_name},
+                    'object': {'key': urllib.parse.quote(self.uploaded_file.s3_key), 'eTag': self.uploaded_file.s3_etag}
+                },
+                'contentTypeChecksLeft': content_type_checks_left - 1
+            }]
+        }
+        sqs.send_message(QueueUrl=self.config.csum_upload_q_url,
+                         MessageBody=json.dumps(payload),
+                         DelaySeconds=self.CHECK_CONTENT_TYPE_INTERVAL)
 
-    """
-    If the file's content_type doesn't have a 'dcp-type' suffix, refresh it a few times
-    to see if it acquires one.  Due to AWSCLI/S3 failing to correctly apply content_type,
-    we occasionally have to add it after the fact.  If it doesn't appear, proceed anyway.
-    """
-    def _check_content_type(self):
-        naps_left = self.CHECK_CONTENT_TYPE_TIMES
-        while naps_left > 0 and '; dcp-type=' not in self.uploaded_file.content_type:
-            logger.debug(f"No dcp-type in content_type of file {self.uploaded_file.s3_key},"
-                         f" checking {naps_left} more times")
-            time.sleep(self.CHECK_CONTENT_TYPE_INTERVAL)
-            naps_left -= 1
-            self.uploaded_file.refresh()
-        if '; dcp-type=' not in self.uploaded_file.content_type:
-            logger.warning(f"Still no dcp-type in content_type of file {self.uploaded_file.s3_key} after 30s")
+    def _consume_deferred_notification(self, event):
+        self._get_file_record(event['s3']['object']['key'])
+        if self._event_is_superseded(event):
+            return  # the new contents' own event will notify Ingest
+        self._notify_ingest(content_type_checks_left=event['contentTypeChecksLeft'])
 
     def _compute_checksums(self):
         checksum_event = ChecksumEvent(checksum_id=str(uuid.uuid4()),
@@ -119,40 +286,116 @@ class ChecksumDaemon:
                                        status="CHECKSUMMING")
         checksum_event.create_record()
 
+        start_time = time.time()
+        watchdog = self._inline_progress_watchdog(start_time, self._inline_time_budget_seconds())
         checksums = DssChecksums(s3_object=self.uploaded_file.s3object)
-        checksums.compute(report_progress=True)
+        try:
+            checksums.compute(report_progress=True, progress_listener=watchdog,
+                              concurrency=max(1, self.READ_CONCURRENCY // self.share),
+                              max_buffered_bytes=self.MAX_BUFFERED_BYTES // self.share)
+        except self.InlineChecksummingFellBehind as e:
+            logger.warning(f"Inline checksumming of {self.uploaded_file.s3_key} fell behind, handing off to Batch: {e}")
+            checksum_event.status = "ABORTED"
+            checksum_event.update_record()
+            return None
+        self._record_throughput(self.uploaded_file.size, time.time() - start_time)
 
         checksum_event.status = "CHECKSUMMED"
         checksum_event.update_record()
 
         return checksums
 
-    def _schedule_checksumming(self):
+    def _apply_reused_checksums(self, reused_checksums):
+        checksums = DssChecksums(s3_object=self.uploaded_file.s3object, checksums=reused_checksums)
+        checksums.save_as_tags_on_s3_object()
+        self.uploaded_file.checksums = dict(checksums)  # saves to DB
+        checksum_event = ChecksumEvent(checksum_id=str(uuid.uuid4()),
+                                       file_id=self.uploaded_file.db_id,
+                                       status="CHECKSUMMED")
+        checksum_event.create_record()
+        return checksums
+
+    def _schedule_checksumming(self, claim, audited_checksums=None):
+        logger.debug(f"Will checksum {self.uploaded_file.s3_key} in Batch")
+        claim.extend(ChecksumClaim.BATCH_TTL_SECONDS)  # released by the Upload API when the job finishes or fails
+        self._files_awaiting_batch.append(self.uploaded_file)
+        if audited_checksums is not None:
+            self._reuse_audits[self.uploaded_file.s3url] = audited_checksums
+
+    def _submit_batch_checksumming(self):
+        """ Submit Batch jobs for the files awaiting them.  Returns the files that could not be submitted. """
+        files, self._files_awaiting_batch = self._files_awaiting_batch, []
+        reuse_audits, self._reuse_audits = self._reuse_audits, {}
+        unsubmitted_files = []
+        for start in range(0, len(files), self.MAX_FILES_PER_MANIFEST):
+            batch_of_files = files[start:start + self.MAX_FILES_PER_MANIFEST]
+            try:
+                if len(batch_of_files) == 1:
+                    self._submit_checksumming_job(batch_of_files[0], reuse_audits)
+                else:
+                    self._submit_manifest_checksumming_job(batch_of_files, reuse_audits)
+            except Exception as e:
+                logger.exception(f"Failed to schedule checksumming of {len(batch_of_files)} files: {e}")
+                for uploaded_file in batch_of_files:
+                    ChecksumClaim.release_by_key(uploaded_file.s3_key, uploaded_file.s3_etag)  # let a retry claim it
+                unsubmitted_files.extend(batch_of_files)
+        return unsubmitted_files
+
+    def _submit_checksumming_job(self, uploaded_file, reuse_audits):
         logger.debug("Scheduling checksumming batch job")
         checksum_id = str(uuid.uuid4())
-        command = ['python', '/checksummer.py', self.uploaded_file.s3url, self.uploaded_file.s3_etag]
-        environment = {
-            'API_HOST': self.api_host,
-            'CHECKSUM_ID': checksum_id,
-            'CONTAINER': 'DOCKER'
-        }
+        command = ['python', '/checksummer.py', uploaded_file.s3url, uploaded_file.s3_etag]
+        if uploaded_file.s3url in reuse_audits:
+            command += ['--audit-checksums', json.dumps(reuse_audits[uploaded_file.s3url])]
+        environment = self._batch_job_environment(CHECKSUM_ID=checksum_id)
         job_name = "-".join([
-            "csum", self.deployment_stage, self.uploaded_file.upload_area.uuid, self.uploaded_file.name])
+            "csum", self.deployment_stage, uploaded_file.upload_area.uuid, uploaded_file.name])
+        job_id = self._enqueue_batch_job(queue_arn=self.config.csum_job_q_arn,
+                                         job_name=job_name,
+                                         command=command,
+                                         environment=environment)
+        self._create_scheduled_checksum_event(uploaded_file, checksum_id, job_id)
+
+    def _submit_manifest_checksumming_job(self, uploaded_files, reuse_audits):
+        logger.debug(f"Scheduling checksumming batch job for {len(uploaded_files)} files")
+        checksum_ids = [str(uuid.uuid4()) for _ in uploaded_files]
+        manifest = [{'s3_url': uploaded_file.s3url, 's3_etag': uploaded_file.s3_etag, 'checksum_id': checksum_id}
+                    for uploaded_file, checksum_id in zip(uploaded_files, checksum_ids)]
+        for entry in manifest:
+            if entry['s3_url'] in reuse_audits:
+                entry['audit_checksums'] = reuse_audits[entry['s3_url']]
+        command = ['python', '/checksummer.py', '--manifest', json.dumps(manifest)]
+        environment = self._batch_job_environment()
+        job_name = "-".join(["csum", self.deployment_stage, "manifest", checksum_ids[0]])
         job_id = self._enqueue_batch_job(queue_arn=self.config.csum_job_q_arn,
                                          job_name=job_name,
                                          command=command,
                                          environment=environment)
+        for uploaded_file, checksum_id in zip(uploaded_files, checksum_ids):
+            self._create_scheduled_checksum_event(uploaded_file, checksum_id, job_id)
+
+    def _batch_job_environment(self, **extra_variables):
+        environment = {
+            'API_HOST': self.api_host,
+            'CONTAINER': 'DOCKER'
+        }
+        if self.checkpoint_bucket:
+            environment['CSUM_CHECKPOINT_BUCKET'] = self.checkpoint_bucket
+        environment.update(extra_variables)
+        return environment
 
-        checksum_event = ChecksumEvent(file_id=self.uploaded_file.db_id,
+    @staticmethod
+    def _create_scheduled_checksum_event(uploaded_file, checksum_id, job_id):
+        checksum_event = ChecksumEvent(file_id=uploaded_file.db_id,
                                        checksum_id=checksum_id,
                                        job_id=job_id,
                                        status="SCHEDULED")
         checksum_event.create_record()
 
     def _find_or_create_job_definition(self):
-        job_defn = JobDefinition(docker_image=self.docker_image, deployment=self.deployment_stage)
-        job_defn.find_or_create(self.config.csum_job_role_arn)
-        return job_defn
+        return JobDefinition.find_or_create_cached(docker_image=self.docker_image,
+                                                   deployment=self.deployment_stage,
+                                                   job_role_arn=self.config.csum_job_role_arn)
 
     JOB_NAME_ALLOWABLE_CHARS = '[^\w-]'
 
@@ -160,10 +403,9 @@ class ChecksumDaemon:
     def _enqueue_batch_job(self, queue_arn, job_name, command, environment):
         job_name = re.sub(self.JOB_NAME_ALLOWABLE_CHARS, "", job_name)[0:128]
         job_defn = self._find_or_create_job_definition()
-        job = batch.submit_job(
+        job = job_defn.submit_job(
             jobName=job_name,
             jobQueue=queue_arn,
-            jobDefinition=job_defn.arn,
             containerOverrides={
                 'command': command,
                 'environment': [dict(name=k, value=v) for k, v in environment.items()]
@@ -1,6 +1,8 @@
 import os
 
 from upload.common.batch import JobDefinition
+from upload.common.database import UploadDB
+from upload.common.upload_area_counts import UploadAreaCounts
 from .upload_cleaner import UploadCleaner
 
 
@@ -15,7 +17,26 @@ class CleanupCLI:
         cleanup_files_parser.set_defaults(command='cleanup', cleanup_command='files')
         cleanup_files_parser.add_argument('-j', '--jobs', nargs='?', help="parallelize", type=int, default=1)
 
+        cleanup_counts_parser = cleanup_subparsers.add_parser('counts', description="Recount upload area statuses")
+        cleanup_counts_parser.set_defaults(command='cleanup', cleanup_command='counts')
+        cleanup_counts_parser.add_argument('upload_area_uuid', nargs='*', help="recount these areas, default all")
+
     @classmethod
     def run(cls, args):
         if args.cleanup_command == 'files':
             UploadCleaner(options=args).clean_files()
+        elif args.cleanup_command == 'counts':
+            cls._repair_counts(args.upload_area_uuid)
+
+    @staticmethod
+    def _repair_counts(upload_area_uuids):
+        if not upload_area_uuids:
+            UploadAreaCounts.repair_all()
+            return
+        for upload_area_uuid in upload_area_uuids:
+            record = UploadDB().get_pg_record('upload_area', upload_area_uuid, column='uuid')
+            if not record:
+                print(f"{upload_area_uuid}: no such upload area")
+                continue
+            before, after = UploadAreaCounts(record['id']).repair()
+            print(f"{upload_area_uuid}: {'repaired' if after != before else 'correct'} {after}")
@@ -53,7 +53,8 @@ class UploadCleaner:
         self.options = options
         self.s3 = boto3.resource('s3')
         self.bucket = self.s3.Bucket(f"org-humancellatlas-upload-{os.environ['DEPLOYMENT_STAGE']}")
-        self.db_session_maker = DBSessionMaker()
+        # One connection per worker thread.  A cleanup can run for hours, so test connections before use.
+        self.db_session_maker = DBSessionMaker(pool_size=options.jobs, pool_pre_ping=True)
 
     def clean_files(self):
         """